@@ -1,19 +1,123 @@
+import io
+import os
+import sys
 import json
+import argparse
+from contextlib import nullcontext
 from typing import Union
 
-import cloudscraper
-from bs4 import BeautifulSoup
+# The nu_scraping modules import their siblings as top level modules, they are imported the same way here so that
+# each of them, and the metrics registry, is loaded once
+SCRAPING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nu_scraping")
+if SCRAPING_DIR not in sys.path:
+    sys.path.insert(0, SCRAPING_DIR)
+
+from metrics import metrics, timed_get  # noqa: E402
+from clearance import create_scraper  # noqa: E402
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def make_soup(markup):
+    """html.parser BeautifulSoup of a page, bs4 is only imported once a page is parsed"""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(markup, "html.parser")
+
+
+def dumps(obj):
+    """Serialize a native scraper result to a JSON string
+
+    orjson is used when it is installed, the standard library encoder
+    otherwise. Non-ASCII characters are written as is, not \\u escaped.
+
+    Args:
+        obj: dict or list returned by one of the ``get_*`` methods
+
+    Returns:
+        str: JSON document
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def dump_many(records, fp):
+    """Stream records to a file handle as JSON lines
+
+    Every record is written directly to ``fp`` followed by a newline, so no
+    intermediate document holding all records is built. orjson is used when
+    it is installed, binary handles receive its bytes as is and text handles
+    the decoded string, the standard library encoder is used otherwise.
+
+    Args:
+        records: iterable of dicts or lists
+        fp: file handle opened for writing, text or binary
+
+    Returns:
+        int: number of records written
+    """
+    binary = not isinstance(fp, io.TextIOBase)
+    count = 0
+    for record in records:
+        if binary:
+            if orjson is not None:
+                fp.write(orjson.dumps(record))
+            else:
+                fp.write(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+            fp.write(b"\n")
+        else:
+            if orjson is not None:
+                fp.write(orjson.dumps(record).decode("utf-8"))
+            else:
+                json.dump(record, fp, ensure_ascii=False)
+            fp.write("\n")
+        count += 1
+    return count
 
 
 class NUScraper:
+    INTERNED_FIELDS = ("language", "genre", "tag", "authors", "artists")
 
-    def __init__(self):
-        self.scraper = cloudscraper.create_scraper()
-        self.json_encoder = json.JSONEncoder()
+    def __init__(self, vocab=None, archive=None, resolver=None, profiler=None):
+        """
+        Args:
+            vocab(Vocabulary): optional symbol table from ``nu_scraping.vocab``, when
+                given the repeated string fields (see INTERNED_FIELDS) are returned as ids
+            archive(HtmlArchive): optional ``nu_scraping.archive`` the fetched novel pages
+                are stored in, see reextract
+            resolver(SeriesResolver): optional id <-> slug mapping from ``nu_scraping.resolver``,
+                filled from the scraped pages, novels with a known slug are fetched from their
+                canonical url without the ?p= redirect
+            profiler(ParseProfiler): optional ``nu_scraping.profiling`` profiler every parsed
+                page is passed through, the extractor timings are in the shared metrics registry
+        """
+        self.vocab = vocab
+        self.profiler = profiler
+        self.archive = archive
+        self.resolver = resolver
+        # Imported here, the nu CLI subcommands that do not scrape with NUScraper skip it
+        import cloudscraper
+        self.scraper = create_scraper(cloudscraper.create_scraper)
         self.SERIES_FINDER = "https://www.novelupdates.com/series-finder/"
         self.NOVEL = "http://www.novelupdates.com/?p="
 
-    def parse_series_finder(self, page, ntype=None, language=None, nchapters=None, release_frequency=None, reviews=None,
+    def parse_series_finder(self, *args, **kwargs):
+        """
+        Parses a single novel updates series finder page
+
+        Thin wrapper around ``get_series_finder`` that encodes the result, see
+        it for the arguments.
+
+        Returns:
+            str: JSON converted from the list of various novel's info in the page,
+            an empty list ("[]") when the page could not be fetched
+        """
+        return dumps(self.get_series_finder(*args, **kwargs))
+
+    def get_series_finder(self, page, ntype=None, language=None, nchapters=None, release_frequency=None, reviews=None,
                             rating=None, nratings=None, readers=None, first_date=None, last_date=None,
                             genre_included: list[Union[list[str], str]] = None, genre_excluded=None,
                             tags_included: list[Union[list[str], str]] = None, tags_excluded=None, status=None,
@@ -21,7 +125,7 @@ class NUScraper:
         """
         Parses a single novel updates series finder page
 
-        This Function Return JSON of the series info in the all of series finder page. The Series info consists
+        This Function Return the series info in the all of series finder page. The Series info consists
         of series's id, title, genre id list, genre list and image link.
 
         Args:
@@ -45,7 +149,7 @@ class NUScraper:
             order(str): the order of the novel (asc or desc)
 
         Returns:
-            str: JSON converted from the list of various novel's info in the page
+            list[dict]: the list of various novel's info in the page
         """
         url = self.SERIES_FINDER + str(page) + "/?sf=1"
         if ntype:
@@ -91,13 +195,20 @@ class NUScraper:
         if status:
             url += "&ss=" + status
         url += "&sort=" + sort + "&order=" + order
-        page = self.scraper.get(url)
+        page = timed_get(self.scraper, url, "NUScraper")
         if page.status_code == 200:
-            soup = BeautifulSoup(page.text, "html.parser")
-            sf_json = self.json_encoder.encode(self.get_sf_info(soup))
-            return sf_json
+            with self._sample(), metrics.timer("parse_seconds", extractor="get_sf_info"):
+                soup = make_soup(page.text)
+                novel_list = self.get_sf_info(soup)
+            if self.resolver is not None:
+                for novel in novel_list:
+                    self.resolver.add(novel["id"], novel["link"])
+            if self.vocab is not None:
+                for novel in novel_list:
+                    self.vocab.encode(novel, ("genre",))
+            return novel_list
         else:
-            return self.json_encoder.encode(dict())
+            return list()
 
     @staticmethod
     def get_sf_info(content):
@@ -113,6 +224,7 @@ class NUScraper:
             novel_list += [{
                 "id": sid,
                 "title": title_div.text,
+                "link": title_div.get("href"),
                 "genre_id": [i.get("gid") for i in genre_div],
                 "genre": [i.text for i in genre_div],
                 "image_link": image_div.get("src")
@@ -121,24 +233,67 @@ class NUScraper:
         return novel_list
 
     def parse_novel(self, novel_id, full_url=False):
+        """Thin wrapper around ``get_novel`` returning the novel info as JSON"""
+        return dumps(self.get_novel(novel_id, full_url))
+
+    def get_novel(self, novel_id, full_url=False):
         if full_url is False:
             url = self.NOVEL + str(novel_id)
         else:
             url = str(novel_id)
-        page = self.scraper.get(url)
+        if self.resolver is not None:
+            url = self.resolver.canonical_url(url)
+        page = timed_get(self.scraper, url, "NUScraper")
         if page.status_code == 200:
-            soup = BeautifulSoup(page.text, features="html.parser")
+            if self.archive is not None:
+                self.archive.put(url, page.content, novel_id)
+            return self.get_novel_from_page(page.content, novel_id, page.url)
+        else:
+            return dict()
+
+    def _sample(self):
+        return self.profiler.sample() if self.profiler is not None else nullcontext()
+
+    def get_novel_from_page(self, html, novel_id, page_url=None):
+        """Scrapes the novel info from an already downloaded novel page
+
+        With page_url, the url the page was fetched from after any redirect, the resolver learns the
+        id read from the shortlink of the page and the slug of the url.
+        """
+        with self._sample():
+            with metrics.timer("parse_seconds", extractor="soup"):
+                soup = make_soup(html)
+            if self.resolver is not None and page_url is not None:
+                shortlink = soup.find("link", {"rel": "shortlink"})
+                if shortlink is not None:
+                    self.resolver.add(shortlink.get("href").split("p=")[-1], page_url)
             full_content = soup.find("div", attrs={"class": "l-main"})
             content = soup.find("div", attrs={"class": "w-blog-content"})
             novel_info = {"sid": novel_id}
-            novel_info.update(self.get_general_info(content))
-            novel_info.update(self.get_desc(full_content))
-            novel_info.update(self.get_detail_info(content))
-            novel_info.update(self.get_creators_info(content))
-            novel_json = self.json_encoder.encode(novel_info)
-            return novel_json
-        else:
-            return self.json_encoder.encode(dict())
+            for extractor, section in ((self.get_general_info, content), (self.get_desc, full_content),
+                                       (self.get_detail_info, content), (self.get_creators_info, content)):
+                with metrics.timer("parse_seconds", extractor=extractor.__name__):
+                    novel_info.update(extractor(section))
+        if self.vocab is not None:
+            self.vocab.encode(novel_info, self.INTERNED_FIELDS)
+        return novel_info
+
+    def reextract(self, processes=None):
+        """
+        Runs the current extractors over every novel page of the archive in several
+        processes, nothing is fetched
+
+        Args:
+            processes(int): number of worker processes, the number of CPUs if None
+        """
+        from archive import reextract
+
+        novel_infos = []
+        for novel_info in reextract(self.archive, _parse_archived_novel, processes):
+            if self.vocab is not None:
+                self.vocab.encode(novel_info, self.INTERNED_FIELDS)
+            novel_infos.append(novel_info)
+        return novel_infos
 
     @staticmethod
     def get_general_info(content):
@@ -237,22 +392,33 @@ class NUScraper:
     #     status = content_div.find("div", attrs={"id": "edityear"})
 
     def get_filters_list(self):
-        """Get filters list
+        """Get filters list as JSON
+
+        Thin wrapper around ``get_filters``.
+
+        Returns:
+            str: JSON from the list of filters on novel updates
+        """
+        return dumps(self.get_filters())
+
+    def get_filters(self):
+        """Get filters
 
         The function scrapes NU Series Finder to get the filters list which
         consists of novel language, genre and tags. The novel type, status and
         sort filter is not included because they don't change.
 
         Returns:
-            str: JSON from the list of filters on novel updates
+            dict: the list of filters on novel updates
         """
-        page = self.scraper.get(self.SERIES_FINDER)
+        page = timed_get(self.scraper, self.SERIES_FINDER, "NUScraper")
         if page.status_code == 200:
-            page_soup = BeautifulSoup(page.text, "html.parser")
-            filter_div = page_soup.find_all("div", {"class": "g-cols wpb_row offset_default"})
-            language_list = filter_div[1].find_all("a", {"class": "langrank"})
-            genre_list = filter_div[2].find_all("a", {"class": "genreme"})
-            tags_list = filter_div[3].find("select", {"class": "chzn-select"}).find_all("option")
+            with self._sample(), metrics.timer("parse_seconds", extractor="get_filters"):
+                page_soup = make_soup(page.text)
+                filter_div = page_soup.find_all("div", {"class": "g-cols wpb_row offset_default"})
+                language_list = filter_div[1].find_all("a", {"class": "langrank"})
+                genre_list = filter_div[2].find_all("a", {"class": "genreme"})
+                tags_list = filter_div[3].find("select", {"class": "chzn-select"}).find_all("option")
             filter_list = {
                 "language": [{
                     "id": i.get("genreid"),
@@ -267,34 +433,107 @@ class NUScraper:
                     "name": i.text
                 } for i in tags_list]
             }
-            return self.json_encoder.encode(filter_list)
+            return filter_list
+        else:
+            return dict()
+
+
+# NUScraper of a reextract worker process
+_page_parser = None
+
+
+def _parse_archived_novel(html, novel_id):
+    global _page_parser
+    if _page_parser is None:
+        _page_parser = NUScraper()
+    return _page_parser.get_novel_from_page(html, novel_id)
+
+
+def _run_script(name, argv):
+    sys.argv = [name] + argv
+    import runpy
+    runpy.run_path(os.path.join(SCRAPING_DIR, name), run_name="__main__")
+
+
+def _kasasagi():
+    import kasasagi
+    return kasasagi
+
+
+def main(argv=None):
+    """Entry point of the ``nu`` command line
+
+    Every subcommand imports its heavy dependencies (cloudscraper, pandas, hug...) itself, so single
+    lookups from cron or scripts start fast.
+    """
+    parser = argparse.ArgumentParser(prog="nu", description="Novel Updates scraper")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the ranked parse times of novel, finder and filters, see nu_scraping/profiling.py")
+    parser.add_argument("--profile_output", default=None, help="also save the cProfile stats to this file")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    # Every argument after crawl, --help included, is left over and passed on to scraper.py
+    subparsers.add_parser("crawl", help="crawl the catalog, options of nu_scraping/scraper.py", add_help=False)
+
+    novel = subparsers.add_parser("novel", help="scrape a single series")
+    novel.add_argument("novel", help="series id or url")
+
+    finder = subparsers.add_parser("finder", help="scrape a series finder page")
+    finder.add_argument("page", type=int, nargs="?", default=1)
+    finder.add_argument("--ntype", default=None)
+    finder.add_argument("--language", default=None)
+    finder.add_argument("--status", default=None)
+    finder.add_argument("--sort", default="sdate")
+    finder.add_argument("--order", default="desc")
+
+    subparsers.add_parser("filters", help="scrape the series finder filters")
+
+    chapters = subparsers.add_parser("chapters", help="chapter list of a series as JSON lines")
+    chapters.add_argument("url", help="series url")
+    chapters.add_argument("--mode", choices=["ajax", "pages"], default="ajax")
+
+    serve = subparsers.add_parser("serve", help="run the kasasagi HTTP API")
+    serve.add_argument("--port", type=int, default=8000)
+
+    args, crawl_options = parser.parse_known_args(argv)
+    if crawl_options and args.command != "crawl":
+        parser.error("unrecognized arguments: " + " ".join(crawl_options))
+    profiler = None
+    if args.profile:
+        from profiling import ParseProfiler
+        # Every page is sampled, these commands parse one page
+        profiler = ParseProfiler(metrics, sample_every=1)
+
+    if args.command == "crawl":
+        _run_script("scraper.py", crawl_options)
+    elif args.command == "novel":
+        full_url = not args.novel.isdigit()
+        print(NUScraper(profiler=profiler).parse_novel(args.novel.strip() if full_url else int(args.novel),
+                                                       full_url=full_url))
+    elif args.command == "finder":
+        print(NUScraper(profiler=profiler).parse_series_finder(args.page, ntype=args.ntype, language=args.language,
+                                                               status=args.status, sort=args.sort, order=args.order))
+    elif args.command == "filters":
+        print(NUScraper(profiler=profiler).get_filters_list())
+    elif args.command == "chapters":
+        import asyncio
+        kasasagi = _kasasagi()
+
+        async def print_chapters():
+            async for item in kasasagi.iter_all_chapters(args.url, args.mode):
+                print(dumps(item))
+
+        asyncio.run(print_chapters())
+    elif args.command == "serve":
+        import hug
+        hug.API(_kasasagi()).http.serve(port=args.port)
+
+    if profiler is not None:
+        profiler.print_report()
+        if args.profile_output is not None:
+            profiler.dump(args.profile_output)
 
 
 if __name__ == "__main__":
-    novel_list = [r"https://www.novelupdates.com/series/the-regressor-and-the-blind-saint/ "
-                  r"https://www.novelupdates.com/series/every-night-i-come-to-his-bedroom/ ",
-                  r"https://www.novelupdates.com/series/a-terminally-ill-villainess-refuses-to-be-adopted/ ",
-                  r"https://www.novelupdates.com/series/the-flower-with-a-sword/ ",
-                  r"https://www.novelupdates.com/series/i-was-a-man-before-reincarnating-so-i-refuse-a-reverse-harem/",
-                  r"https://www.novelupdates.com/series/im-worried-that-my-brother-is-too-gentle/",
-                  r"https://www.novelupdates.com/series/my-sister-picked-up-the-male-lead/",
-                  r"https://www.novelupdates.com/series/the-ladys-butler/",
-                  r"https://www.novelupdates.com/series/becoming-the-villains-family/",
-                  r"https://www.novelupdates.com/series/ending-maker/",
-                  r"https://www.novelupdates.com/series/im-really-not-the-demon-gods-lackey/",
-                  r"https://www.novelupdates.com/series/since-ive-entered-the-world-of-romantic-comedy-manga-ill-do"
-                  r"-my-best-to-make-the-heroine-who-doesnt-stick-with-the-hero-happy/ ",
-                  r"https://www.novelupdates.com/series/i-was-reincarnated-in-a-yandere-main-love-comedy-game-and"
-                  r"-suddenly-a-dangerous-girl-became-my-younger-sister/ "
-                  ]
-
-    nu_scraper = NUScraper()
-
-    # print(nu_scraper.get_filters_list())
-    # for novel in novel_list:
-    #     print(nu_scraper.parse_novel(novel, full_url=True))
-    #     print()
-    #
-    # nu_scraper.parse_series_finder(1)
-
-    print(nu_scraper.parse_novel(r"https://www.novelupdates.com/series/the-regressor-and-the-blind-saint/ ", full_url=True))
+    main()
@@ -0,0 +1,206 @@
+import os
+import json
+import zlib
+import threading
+from time import time
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def segment_path(directory, segment_num):
+    return os.path.join(directory, f'segment-{segment_num:05d}.warc')
+
+
+class ArchiveReader:
+    """
+    Reads pages of an HtmlArchive from their index entries, without loading the index.
+    Safe to use from several threads.
+
+    :param directory: The directory of the archive.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.fds = dict()
+
+    @staticmethod
+    def decompress(data, codec):
+        if codec == 'zstd':
+            if zstandard is None:
+                raise ImportError('The archive holds zstd pages, the zstandard package is needed to read them')
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def read(self, entry):
+        """
+        :param entry: An index entry, see HtmlArchive.entries.
+        :returns: bytes, the raw page.
+        """
+        segment_num = entry['segment']
+        fd = self.fds.get(segment_num)
+        if fd is None:
+            fd = os.open(segment_path(self.directory, segment_num), os.O_RDONLY)
+            if self.fds.setdefault(segment_num, fd) != fd:
+                os.close(fd)
+                fd = self.fds[segment_num]
+        # pread does not move a shared file position, so threads can read at the same time
+        return self.decompress(os.pread(fd, entry['length'], entry['offset']), entry['codec'])
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds.clear()
+
+
+class HtmlArchive:
+    """
+    Raw pages of a crawl, kept so the extractors can be run again without fetching anything.
+
+    A directory of append-only segment files and an index. Every page is written to the current segment as a JSON
+    header line ({"url", "key", "fetched_at", "codec", "length"}) followed by the compressed page, like a WARC record,
+    so a lost index can be rebuilt from the segments. A new segment is started once the current one is larger than
+    segment_size. index.jsonl holds one line per page with its segment and offset, a page stored again is found by
+    its newest line.
+    Pages are compressed with zstd when the zstandard package is installed, with zlib otherwise. Safe to use from
+    several threads.
+
+    :param directory: The directory of the archive, created if needed.
+    :param segment_size: int, the size in bytes after which a new segment is started.
+    :param level: The compression level, the codec default if None.
+    """
+
+    INDEX_FILE = 'index.jsonl'
+
+    def __init__(self, directory, segment_size=256 * 1024 * 1024, level=None):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.codec = 'zstd' if zstandard is not None else 'zlib'
+        self.level = level
+        self.lock = threading.Lock()
+        self.index = dict()
+        self.segment = None
+        self.segment_num = 0
+        self.reader = ArchiveReader(directory)
+        os.makedirs(directory, exist_ok=True)
+
+        index_path = os.path.join(directory, self.INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.index[entry['url']] = entry
+                    self.segment_num = max(self.segment_num, entry['segment'] + 1)
+        self.index_file = open(index_path, 'a', encoding='utf-8')
+
+    def compress(self, data):
+        if self.codec == 'zstd':
+            level = 3 if self.level is None else self.level
+            return zstandard.ZstdCompressor(level=level).compress(data)
+        return zlib.compress(data, 6 if self.level is None else self.level)
+
+    def put(self, url, content, key=None, fetched_at=None):
+        """
+        Stores a fetched page.
+
+        :param url: The url of the page.
+        :param content: bytes, the raw page.
+        :param key: An id the page is parsed with, e.g. the novel id, None for pages that are not re-extracted.
+        :param fetched_at: The fetch time as a unix timestamp, now if None.
+        :returns: The index entry of the page.
+        """
+        data = self.compress(content)
+        entry = {'url': url, 'key': key, 'fetched_at': int(time()) if fetched_at is None else fetched_at,
+                 'codec': self.codec, 'length': len(data), 'size': len(content)}
+        header = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+        with self.lock:
+            if self.segment is None or self.segment.tell() >= self.segment_size:
+                if self.segment is not None:
+                    self.segment.close()
+                    self.segment_num += 1
+                self.segment = open(segment_path(self.directory, self.segment_num), 'ab')
+            entry['segment'] = self.segment_num
+            entry['offset'] = self.segment.tell() + len(header)
+            self.segment.write(header)
+            self.segment.write(data)
+            self.segment.flush()
+            # The index line is written last, a crash never leaves an entry pointing to a partial record
+            self.index_file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.index_file.flush()
+            self.index[url] = entry
+        return entry
+
+    def get(self, url):
+        """
+        :param url: The url of the page.
+        :returns: bytes, the newest stored page of the url or None.
+        """
+        entry = self.index.get(url)
+        return self.reader.read(entry) if entry is not None else None
+
+    def __contains__(self, url):
+        return url in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def entries(self, keyed=True):
+        """
+        :param keyed: Boolean, if true only the pages stored with a key are returned, the newest fetched page of every
+                      key: the same novel can be stored under several urls (?p=<id> and its /series/<slug>/ url).
+        :returns: A list with the index entry of the newest page of every url (or key), in segment order for
+                  sequential reads.
+        """
+        if keyed:
+            newest = dict()
+            for entry in self.index.values():
+                if entry['key'] is None:
+                    continue
+                current = newest.get(entry['key'])
+                order = (entry['fetched_at'], entry['segment'], entry['offset'])
+                if current is None or order > (current['fetched_at'], current['segment'], current['offset']):
+                    newest[entry['key']] = entry
+            entries = list(newest.values())
+        else:
+            entries = list(self.index.values())
+        return sorted(entries, key=lambda entry: (entry['segment'], entry['offset']))
+
+    def close(self):
+        with self.lock:
+            if self.segment is not None:
+                self.segment.close()
+                self.segment = None
+            self.index_file.close()
+        self.reader.close()
+
+
+# Reader of a reextract worker process, opened once per process
+_worker_reader = None
+
+
+def _open_worker_reader(directory):
+    global _worker_reader
+    _worker_reader = ArchiveReader(directory)
+
+
+def _parse_entry(parse, entry):
+    return parse(_worker_reader.read(entry), entry['key'])
+
+
+def reextract(archive, parse, processes=None, chunksize=16):
+    """
+    Runs the current extractors over the newest page of every key of an archive, in several processes.
+
+    :param archive: An HtmlArchive.
+    :param parse: A picklable (module level) function parse(html, key) returning the extracted record.
+    :param processes: The number of worker processes, the number of CPUs if None.
+    :param chunksize: The number of pages sent to a worker at once.
+    :returns: A generator of the extracted records, in archive order.
+    """
+    entries = archive.entries()
+    with ProcessPoolExecutor(processes, initializer=_open_worker_reader, initargs=(archive.directory,)) as executor:
+        yield from executor.map(partial(_parse_entry, parse), entries, chunksize=chunksize)
@@ -0,0 +1,85 @@
+import asyncio
+from time import monotonic
+from collections import OrderedDict
+from metrics import metrics
+
+
+class SingleFlightCache:
+    """
+    In-memory result cache of an async endpoint, with request coalescing.
+
+    Concurrent calls with the same key share one upstream fetch (single-flight) instead of each scraping the site.
+    Results are kept for ttl seconds, the least recently used ones are dropped past maxsize. An expired result
+    younger than ttl + stale_ttl is still returned right away while a single background fetch refreshes it
+    (stale-while-revalidate). Exceptions are not cached, every waiting caller gets them.
+    Meant for a single event loop.
+
+    :param name: str, the cache name used as metric label.
+    :param ttl: float, seconds a result is fresh.
+    :param stale_ttl: float, seconds an expired result can still be served while it is refreshed.
+    :param maxsize: int, the maximum number of cached results.
+    """
+
+    def __init__(self, name, ttl=300, stale_ttl=1800, maxsize=256):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.inflight = dict()
+
+    async def get(self, key, fetch):
+        """
+        :param key: A hashable key, e.g. the tuple of the endpoint arguments.
+        :param fetch: A function without arguments returning the awaitable that computes the result.
+        :returns: The cached or fetched result.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            result, stored_at = entry
+            age = monotonic() - stored_at
+            if age < self.ttl:
+                self.entries.move_to_end(key)
+                metrics.inc('cache_requests_total', cache=self.name, result='hit')
+                return result
+            if age < self.ttl + self.stale_ttl:
+                self.entries.move_to_end(key)
+                metrics.inc('cache_requests_total', cache=self.name, result='stale')
+                if key not in self.inflight:
+                    # Nobody awaits the refresh, its exception is retrieved so it is not reported as lost
+                    self._start(key, fetch).add_done_callback(lambda task: task.cancelled() or task.exception())
+                return result
+
+        if key in self.inflight:
+            metrics.inc('cache_requests_total', cache=self.name, result='coalesced')
+            task = self.inflight[key]
+        else:
+            metrics.inc('cache_requests_total', cache=self.name, result='miss')
+            task = self._start(key, fetch)
+        # A cancelled caller must not cancel the fetch the other callers wait for
+        return await asyncio.shield(task)
+
+    def _start(self, key, fetch):
+        task = asyncio.ensure_future(self._fetch(key, fetch))
+        self.inflight[key] = task
+        return task
+
+    async def _fetch(self, key, fetch):
+        try:
+            result = await fetch()
+            self.entries[key] = (result, monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            return result
+        finally:
+            del self.inflight[key]
+
+    def invalidate(self, key=None):
+        """
+        :param key: The key to drop, every result if None.
+        """
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key, None)
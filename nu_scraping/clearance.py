@@ -0,0 +1,161 @@
+import os
+import json
+import threading
+from time import time
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'nu_scraping', 'clearance.json')
+DOMAIN = 'www.novelupdates.com'
+# Cookies Cloudflare hands out once its challenge is passed
+CLEARANCE_COOKIES = ('cf_clearance', '__cf_bm', '__cfduid')
+CHALLENGE_STATUSES = (403, 429, 503)
+
+
+def is_challenge(response):
+    """
+    :param response: A requests response.
+    :returns: Whether the response is a Cloudflare challenge instead of the page.
+    """
+    if response.status_code not in CHALLENGE_STATUSES:
+        return False
+    if response.headers.get('cf-mitigated') == 'challenge':
+        return True
+    return 'cloudflare' in response.headers.get('Server', '').lower() and (
+        'cf_chl' in response.text or 'Just a moment' in response.text)
+
+
+def clearance_of(session):
+    return next((cookie.value for cookie in session.cookies if cookie.name == 'cf_clearance'), None)
+
+
+class ClearanceStore:
+    """
+    Cloudflare clearance shared by every scraper process of the machine.
+
+    The clearance cookies only work with the user-agent that solved the challenge, so both are stored together per
+    domain, with the expiry of the cookies. A new session loads them and skips the challenge (the multi-second cold
+    start of cloudscraper/cfscrape). The sessions are tracked: the store is updated when the library solves a new
+    challenge and the stored clearance is dropped when a challenge comes back, so the next session solves it again.
+    The file is replaced atomically and merged with what other processes wrote meanwhile.
+
+    :param path: The JSON file of the store.
+    :param default_ttl: Seconds a clearance is trusted when its cookies have no expiry.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, default_ttl=1800):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def _write(self, entries):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_file = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp_file, self.path)
+
+    def load(self, domain=DOMAIN, margin=60):
+        """
+        :param domain: The domain of the clearance.
+        :param margin: Seconds before the expiry a clearance is already considered expired.
+        :returns: A dictionary with the user_agent, cookies and expires of the clearance, None if there is no valid one.
+        """
+        entry = self._read().get(domain)
+        if entry is None or entry['expires'] < time() + margin:
+            return None
+        return entry
+
+    def save(self, session, domain=DOMAIN):
+        """
+        Stores the clearance cookies and user-agent of a session.
+
+        :returns: False if the session has no clearance cookie.
+        """
+        cookies = {cookie.name: (cookie.value, cookie.expires) for cookie in session.cookies
+                   if cookie.name in CLEARANCE_COOKIES and domain.endswith(cookie.domain.lstrip('.'))}
+        if 'cf_clearance' not in cookies:
+            return False
+        expiries = [expires for _, expires in cookies.values() if expires]
+        entry = {
+            'user_agent': session.headers.get('User-Agent'),
+            'cookies': {name: value for name, (value, _) in cookies.items()},
+            'expires': min(expiries) if expiries else time() + self.default_ttl
+        }
+        with self.lock:
+            entries = self._read()
+            entries[domain] = entry
+            self._write(entries)
+        return True
+
+    def invalidate(self, domain=DOMAIN):
+        with self.lock:
+            entries = self._read()
+            if entries.pop(domain, None) is not None:
+                self._write(entries)
+
+    def apply(self, session, domain=DOMAIN):
+        """
+        Loads the stored clearance into a session.
+
+        :returns: Whether a valid clearance was loaded.
+        """
+        entry = self.load(domain)
+        if entry is None:
+            return False
+        if entry['user_agent']:
+            session.headers['User-Agent'] = entry['user_agent']
+        for name, value in entry['cookies'].items():
+            session.cookies.set(name, value, domain='.' + domain.split('.', 1)[-1], path='/')
+        return True
+
+    def track(self, session, domain=DOMAIN):
+        """
+        Keeps the store up to date with the responses of a session (a requests response hook).
+        """
+        state = {'clearance': clearance_of(session)}
+
+        def on_response(response, *args, **kwargs):
+            if domain not in response.url:
+                return
+            if is_challenge(response):
+                # The stored clearance is no good anymore, the library solves the challenge again
+                self.invalidate(domain)
+                state['clearance'] = None
+                return
+            clearance = clearance_of(session)
+            if response.ok and clearance is not None and clearance != state['clearance']:
+                state['clearance'] = clearance
+                self.save(session, domain)
+
+        session.hooks['response'].append(on_response)
+        return session
+
+
+_default_store = None
+
+
+def create_scraper(factory, store=None, domain=DOMAIN, **kwargs):
+    """
+    Creates a cloudscraper/cfscrape session warm-started with the stored clearance and tracked by the store.
+
+    :param factory: cloudscraper.create_scraper or cfscrape.create_scraper.
+    :param store: A ClearanceStore, one at DEFAULT_PATH (or the NU_CLEARANCE_FILE environment variable) if None.
+    :param domain: The domain of the clearance.
+    :returns: The session.
+    """
+    global _default_store
+    if store is None:
+        if _default_store is None:
+            _default_store = ClearanceStore(os.environ.get('NU_CLEARANCE_FILE', DEFAULT_PATH))
+        store = _default_store
+    session = factory(**kwargs)
+    store.apply(session, domain)
+    return store.track(session, domain)
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+from time import monotonic
+from contextlib import contextmanager
+from metrics import metrics
+
+
+class AIMDController:
+    """
+    Adaptive limit of the requests in flight, additive increase / multiplicative decrease like TCP congestion control.
+
+    Every healthy response raises the limit by increase / limit, so about increase per round of requests. A 429, a
+    5xx, a challenge page, a failed request or a time to first byte over latency_factor times its moving average cuts
+    the limit by decrease, at most once per cooldown seconds so the requests already in flight do not collapse it.
+    The limit is exported as the concurrency_limit gauge.
+    Shared by threads (slot) and by the coroutines of one event loop (async_slot).
+
+    :param name: str, the controller name used as metric label.
+    :param initial: The starting limit.
+    :param minimum: The lowest limit.
+    :param maximum: The highest limit, e.g. the number of worker threads.
+    :param increase: The additive increase per round of requests.
+    :param decrease: The multiplicative decrease factor.
+    :param latency_factor: A time to first byte this many times the moving average counts as congestion.
+    :param latency_floor: Times to first byte below this many seconds never count as congestion.
+    :param cooldown: Seconds between two decreases.
+    """
+
+    def __init__(self, name, initial=2, minimum=1, maximum=16, increase=1.0, decrease=0.5, latency_factor=2.0,
+                 latency_floor=0.5, cooldown=2.0):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.latency_floor = latency_floor
+        self.cooldown = cooldown
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.latency_average = None
+        self.last_decrease = 0.0
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.async_waiters = []
+        metrics.set('concurrency_limit', self.limit, controller=name)
+
+    def _has_room(self):
+        return self.in_flight < int(self.limit)
+
+    def _wake(self):
+        # Called with the lock held
+        self.condition.notify_all()
+        waiters, self.async_waiters = self.async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(None))
+
+    def _release(self):
+        with self.lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def observe(self, status=None, latency=None, challenge=False, error=False):
+        """
+        Adjusts the limit with the outcome of a request.
+
+        :param status: int, the HTTP status.
+        :param latency: float, the time to first byte in seconds.
+        :param challenge: Boolean, whether the response is an anti-bot challenge page.
+        :param error: Boolean, whether the request failed without response.
+        """
+        reason = None
+        if error:
+            reason = 'error'
+        elif challenge:
+            reason = 'challenge'
+        elif status is not None and (status == 429 or status >= 500):
+            reason = 'status'
+        elif latency is not None and self.latency_average is not None and latency > self.latency_floor \
+                and latency > self.latency_factor * self.latency_average:
+            reason = 'latency'
+
+        with self.lock:
+            if reason is None:
+                if latency is not None:
+                    self.latency_average = latency if self.latency_average is None \
+                        else 0.9 * self.latency_average + 0.1 * latency
+                self.limit = min(float(self.maximum), self.limit + self.increase / self.limit)
+                self._wake()
+            else:
+                now = monotonic()
+                if now - self.last_decrease < self.cooldown:
+                    return
+                self.last_decrease = now
+                self.limit = max(float(self.minimum), self.limit * self.decrease)
+            limit = self.limit
+        if reason is not None:
+            metrics.inc('concurrency_decreases_total', controller=self.name, reason=reason)
+        metrics.set('concurrency_limit', round(limit, 2), controller=self.name)
+
+    @contextmanager
+    def slot(self):
+        """
+        Waits for room under the limit, for threads. Yields observe, to call with the outcome of the request, a
+        request raising an exception before it is observed counts as an error.
+        """
+        with self.condition:
+            while not self._has_room():
+                self.condition.wait()
+            self.in_flight += 1
+        slot = _Slot(self)
+        try:
+            yield slot.observe
+        except Exception:
+            slot.failed()
+            raise
+        finally:
+            self._release()
+
+    def async_slot(self):
+        """
+        slot for coroutines, an async context manager.
+        """
+        return _Slot(self)
+
+    async def acquire(self):
+        """
+        Waits for room under the limit without blocking the event loop.
+        """
+        while True:
+            with self.lock:
+                if self._has_room():
+                    self.in_flight += 1
+                    return
+                loop = asyncio.get_event_loop()
+                future = loop.create_future()
+                self.async_waiters.append((loop, future))
+            await future
+
+
+class _Slot:
+    """One request under the limit of an AIMDController"""
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.observed = False
+
+    def observe(self, status=None, latency=None, challenge=False, error=False):
+        self.observed = True
+        self.controller.observe(status, latency, challenge, error)
+
+    def failed(self):
+        if not self.observed:
+            self.observe(error=True)
+
+    async def __aenter__(self):
+        await self.controller.acquire()
+        return self.observe
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.failed()
+        self.controller._release()
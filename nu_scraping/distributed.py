@@ -0,0 +1,283 @@
+import os
+import abc
+import json
+import math
+import socket
+import sqlite3
+import argparse
+import multiprocessing
+from time import sleep, time
+from scraper import NovelScraper
+from utils import str2bool
+from metrics import metrics
+
+
+class LeaseQueue(abc.ABC):
+    """
+    Work queue shared by the coordinator and the workers of a distributed crawl.
+
+    The novel ids are split in shards. A worker claims a shard for a limited time (a lease), renews the lease while it
+    works on it and completes the shard at the end. A lease that is not renewed expires and the shard is handed to
+    another worker, so the shards of a dead worker are not lost.
+    Every shard has a key, adding a shard whose key is already queued does nothing, so running the coordinator again
+    does not crawl everything twice. Backends implement the methods below, see SQLiteLeaseQueue.
+    """
+
+    @abc.abstractmethod
+    def add_shards(self, shards):
+        """
+        :param shards: A list of (key, novel ids) tuples, see make_shards.
+        :returns: The number of shards added, the ones already queued are skipped.
+        """
+
+    @abc.abstractmethod
+    def claim(self, worker_id, ttl):
+        """
+        :param worker_id: str, the id of the claiming worker.
+        :param ttl: float, the lease duration in seconds.
+        :returns: A (shard_id, novel_ids) tuple or None if no shard is available right now.
+        """
+
+    @abc.abstractmethod
+    def renew(self, shard_id, worker_id, ttl):
+        """
+        :returns: False if the lease was lost to another worker.
+        """
+
+    @abc.abstractmethod
+    def complete(self, shard_id, worker_id):
+        pass
+
+    @abc.abstractmethod
+    def remaining(self):
+        """
+        :returns: The number of shards that are not completed, leased or not.
+        """
+
+    @abc.abstractmethod
+    def reset(self):
+        """
+        Drops every shard, completed or not, to crawl everything again.
+        """
+
+
+class SQLiteLeaseQueue(LeaseQueue):
+    """
+    LeaseQueue stored in a SQLite database file, shared by processes of the same machine (or a shared disk).
+
+    :param path: The path of the database file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS shards (id INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE, '
+                                'novel_ids TEXT NOT NULL, owner TEXT, expires REAL NOT NULL DEFAULT 0, '
+                                'done INTEGER NOT NULL DEFAULT 0)')
+
+    def add_shards(self, shards):
+        changes = self.connection.total_changes
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO shards (key, novel_ids) VALUES (?, ?)',
+                                        [(str(key), json.dumps(novel_ids)) for key, novel_ids in shards])
+        return self.connection.total_changes - changes
+
+    def claim(self, worker_id, ttl):
+        now = time()
+        # BEGIN IMMEDIATE takes the write lock so two workers can not claim the same shard
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.connection.execute('SELECT id, novel_ids FROM shards WHERE done = 0 AND expires < ? '
+                                          'ORDER BY id LIMIT 1', (now,)).fetchone()
+            if row is not None:
+                self.connection.execute('UPDATE shards SET owner = ?, expires = ? WHERE id = ?',
+                                        (worker_id, now + ttl, row[0]))
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def renew(self, shard_id, worker_id, ttl):
+        cursor = self.connection.execute('UPDATE shards SET expires = ? WHERE id = ? AND owner = ? AND done = 0',
+                                         (time() + ttl, shard_id, worker_id))
+        return cursor.rowcount == 1
+
+    def complete(self, shard_id, worker_id):
+        self.connection.execute('UPDATE shards SET done = 1 WHERE id = ? AND owner = ?', (shard_id, worker_id))
+
+    def remaining(self):
+        return self.connection.execute('SELECT COUNT(*) FROM shards WHERE done = 0').fetchone()[0]
+
+    def reset(self):
+        self.connection.execute('DELETE FROM shards')
+
+
+class JSONLinesSink:
+    """
+    Output shared by all workers, one JSON line per scraped novel.
+    Every record is written with a single append, so lines of concurrent workers do not interleave.
+    A shard re-done after an expired lease can write a novel twice, read keeps the last record of every id.
+    A novel that failed is written as an {'id', 'error'} record, read skips it and failed lists it unless the novel
+    was scraped by another attempt.
+
+    :param path: The path of the output file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, record):
+        # The scraped fields missing from a page are NaN, written as null to keep the lines valid JSON
+        line = (json.dumps(_nan_to_none(record), ensure_ascii=False, allow_nan=False) + '\n').encode('utf-8')
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def _read(self):
+        records, errors = dict(), dict()
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                (errors if 'error' in record else records)[record.get('id')] = record
+        return records, errors
+
+    def read(self):
+        """
+        :returns: A list with the last written record of every scraped novel id.
+        """
+        return list(self._read()[0].values())
+
+    def failed(self):
+        """
+        :returns: A list with the last error record of every novel id that was never scraped.
+        """
+        records, errors = self._read()
+        return [error for novel_id, error in errors.items() if novel_id not in records]
+
+
+def _nan_to_none(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, dict):
+        return {key: _nan_to_none(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_nan_to_none(item) for item in value]
+    return value
+
+
+def make_shards(novel_ids, shard_size):
+    """
+    Splits the id space in ranges of shard_size ids, the key of a shard is the index of its range. The keys do not
+    depend on the listing order, the same ids give the same shards on every run.
+
+    :param novel_ids: A list with novel ids.
+    :param shard_size: The size of the id ranges.
+    :returns: A list of (key, novel ids) tuples, sorted by key.
+    """
+    shards = dict()
+    for novel_id in sorted(set(novel_ids)):
+        shards.setdefault(novel_id // shard_size, []).append(novel_id)
+    return sorted(shards.items())
+
+
+def run_coordinator(queue, novel_scraper, shard_size=25, reset=False):
+    """
+    Gets all novel ids and splits them in shards on the queue. The shards already queued by an earlier run are
+    skipped, unless reset.
+
+    :returns: The number of shards added.
+    """
+    if reset:
+        queue.reset()
+    return queue.add_shards(make_shards(novel_scraper.get_all_novel_ids(), shard_size))
+
+
+def run_worker(queue, sink, novel_scraper, worker_id, ttl=300, poll_interval=5):
+    """
+    Claims and scrapes shards until every shard of the queue is completed.
+    The lease is renewed after every novel, a shard whose lease was lost is dropped. A novel that raises is written to
+    the sink as an error record and counted in worker_errors_total, the rest of its shard is still scraped.
+
+    :returns: The number of novels scraped by this worker.
+    """
+    scraped = 0
+    while True:
+        lease = queue.claim(worker_id, ttl)
+        if lease is None:
+            if queue.remaining() == 0:
+                return scraped
+            # Every remaining shard is leased, wait for them to complete or expire
+            sleep(poll_interval)
+            continue
+
+        shard_id, novel_ids = lease
+        for novel_id in novel_ids:
+            try:
+                info = novel_scraper.parse_single_novel(novel_id)
+            except Exception as error:
+                metrics.inc('worker_errors_total', error=type(error).__name__)
+                sink.write({'id': novel_id, 'error': f'{type(error).__name__}: {error}'})
+            else:
+                if info:
+                    sink.write(info)
+                scraped += 1
+            if not queue.renew(shard_id, worker_id, ttl):
+                break
+        else:
+            queue.complete(shard_id, worker_id)
+
+
+def _worker_process(queue_path, sink_path, base_url, delay, worker_num, ttl=300, poll_interval=5):
+    novel_scraper = make_scraper(base_url, delay)
+    worker_id = f'{socket.gethostname()}-{os.getpid()}-{worker_num}'
+    run_worker(SQLiteLeaseQueue(queue_path), JSONLinesSink(sink_path), novel_scraper, worker_id, ttl, poll_interval)
+
+
+def make_scraper(base_url, delay):
+    """
+    :param base_url: The site root, e.g. a local mock server instead of novelupdates.
+    :param delay: The delay between web requests.
+    :returns: A NovelScraper.
+    """
+    novel_scraper = NovelScraper(delay, workers=1)
+    if base_url is not None:
+        base_url = base_url.rstrip('/')
+        novel_scraper.NOVEL_LIST_URL = base_url + '/novelslisting/?st=1&pg='
+        novel_scraper.NOVEL_SINGLE_URL = base_url + '/?p='
+    return novel_scraper
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('role', choices=['coordinator', 'worker', 'local'],
+                        help='local runs a coordinator and --processes workers on this machine')
+    parser.add_argument('--queue', type=str, default='crawl_queue.db')
+    parser.add_argument('--sink', type=str, default='novels.jsonl')
+    parser.add_argument('--base_url', type=str, default=None)
+    parser.add_argument('--delay', type=float, default=0.5)
+    parser.add_argument('--shard_size', type=int, default=25)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--ttl', type=float, default=300, help='lease duration in seconds')
+    parser.add_argument('--reset', type=str2bool, nargs='?', const=True, default=False,
+                        help='drop the queued shards, done or not, first')
+    args = parser.parse_args()
+
+    if args.role in ('coordinator', 'local'):
+        num_shards = run_coordinator(SQLiteLeaseQueue(args.queue), make_scraper(args.base_url, args.delay),
+                                     args.shard_size, args.reset)
+        print('Shards added:', num_shards)
+    if args.role == 'worker':
+        _worker_process(args.queue, args.sink, args.base_url, args.delay, 0, args.ttl)
+    elif args.role == 'local':
+        processes = [multiprocessing.Process(target=_worker_process,
+                                             args=(args.queue, args.sink, args.base_url, args.delay, num, args.ttl))
+                     for num in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
@@ -1,56 +1,139 @@
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+import asyncio
+import hashlib
+import json
 import re as regex
+from time import perf_counter
 
 from bs4 import BeautifulSoup
 from bs4 import SoupStrainer
-from json2html import *
 import aiohttp
 import hug
 
+from metrics import metrics
+from cache import SingleFlightCache
+from concurrency import AIMDController
+from normalize import INTRO_CLEAN_RE
+from ranking_history import RankingHistory
+from resolver import SeriesResolver
+from watermarks import WatermarkStore
+
 __version__ = "0.5.3"
 __author__ = 'Anthony Forsberg'
 __license__ = 'MIT'
 __copyright__ = 'Copyright 2017 Anthony Forsberg'
 __title__ = 'Novel Updates Unofficial API'
 
-session = None
-headers = None
-table_filter = None
+headers = {'user_agent': '{}/{} (https://github.com/Evolution0)'.format(__title__, __version__)}
+# Pooled session shared by the batch endpoints, see get_client
+client_session = None
+# Upper bounds of the batch endpoints
+max_batch_size = 100
+max_batch_concurrency = 16
+# Adaptive limit of the series and release table page requests in flight, see fetch_page
+fetch_controller = AIMDController('kasasagi', initial=4, maximum=max_batch_concurrency)
+table_filter = SoupStrainer('table')
+# Release table pages fetched ahead of the one being yielded by iter_all_chapters
+chapter_read_ahead = 4
+# Bounded pool the pages are parsed in, so a big page does not stall the event loop, see parse_off_loop
+parse_workers = 4
+parse_executor = None
+# Last seen state of every synced reading list, keyed by list url, persisted so a restart does not report every
+# novel as added again
+reading_list_snapshots = WatermarkStore('reading_list_snapshots.json')
+# Id of the newest series every consumer of get_new_series has been given, see poll_latest_series
+latest_watermarks = WatermarkStore('latest_series_watermarks.json')
+latest_filter = SoupStrainer('div', {'class': 'search_main_box_nu'})
+ranking_filter = SoupStrainer('div', {'class': 'search_main_box_nu'})
+ranking_history = RankingHistory('rankings')
+non_digit_pattern = regex.compile(r'\D')
+group_link_pattern = regex.compile(r'http://www\.novelupdates\.com/group/')
+series_path_pattern = regex.compile(r'/series/.*/')
+page_num_pattern = regex.compile(r'^[0-6]')
+# Endpoint of the full chapter list popup of a series page, point it to a local stand-in to test
+ajax_url = 'https://www.novelupdates.com/wp-admin/admin-ajax.php'
+series_base_url = 'http://www.novelupdates.com'
+# Series ids <-> slugs learned from the ?p= redirects, known series are fetched from their canonical url
+series_resolver = SeriesResolver('series_slugs.json', series_base_url)
+# Results shared by concurrent and repeated calls, see SingleFlightCache
+chapters_cache = SingleFlightCache('get_all_chapters', ttl=600, stale_ttl=3600, maxsize=512)
+search_cache = SingleFlightCache('search', ttl=300, stale_ttl=1800, maxsize=256)
+
+
+def make_soup(markup, parse_only=None, name='soup'):
+    """lxml BeautifulSoup of a page, the parse time is recorded under the given name"""
+    with metrics.timer('parse_seconds', extractor=name):
+        return BeautifulSoup(markup, 'lxml', parse_only=parse_only)
+
+
+def parse_markup(markup, parser, parse_only=None, name='soup', kwargs=None):
+    """Soup of a page turned into plain data by parser, run in the parse pool"""
+    return parser(make_soup(markup, parse_only, name), **(kwargs or {}))
+
+
+def set_parse_pool(workers=4, processes=False):
+    """Replaces the parse pool, a process pool also spreads the parsing over several cores
+
+    With processes the parsers are pickled, they have to be module level functions returning plain data, and the
+    parse_seconds timings are recorded in the metrics registry of the child processes, they are lost to this one.
+    0 workers parses on the event loop itself, as a baseline for load_benchmark.py.
+    """
+    global parse_executor
+    global parse_workers
+    if parse_executor is not None:
+        parse_executor.shutdown(wait=False)
+    parse_workers = workers
+    if workers == 0:
+        parse_executor = None
+    elif processes:
+        parse_executor = ProcessPoolExecutor(workers)
+    else:
+        parse_executor = ThreadPoolExecutor(workers, thread_name_prefix='kasasagi-parse')
 
 
-@hug.local()
-async def async_iter(iterable):
-    for item in iterable:
-        yield item
+async def parse_off_loop(markup, parser, parse_only=None, name='soup', **kwargs):
+    """Builds the soup of a page and runs parser(soup, **kwargs) on it in the bounded parse pool
+
+    The event loop keeps serving other requests meanwhile, parser should return plain data, not soup objects.
+    """
+    if parse_workers == 0:
+        return parse_markup(markup, parser, parse_only, name, kwargs)
+    if parse_executor is None:
+        set_parse_pool(parse_workers)
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(parse_executor,
+                                      partial(parse_markup, markup, parser, parse_only, name, kwargs))
 
 
 @hug.local()
 async def init():
-    """Manual initialization function due to Hug's broken: @hug.startup()"""
-    global session
+    """Manual initialization function due to Hug's broken: @hug.startup()
+
+    Returns a new session owned by the caller, who closes it. Concurrent requests and the background refreshes of
+    the caches never share a session another call could close.
+    """
     global headers
-    global table_filter
     global base_url
-    session = aiohttp.ClientSession()
     headers = {'user_agent': '{}/{} (https://github.com/Evolution0)'.format(__title__, __version__)}
-    table_filter = SoupStrainer('table')
     base_url = 'http://www.novelupdates.com/'
+    return aiohttp.ClientSession(trace_configs=[metrics.trace_config('kasasagi')])
 
 
-@hug.local()
-async def parse_search(soup, limit=None):
-    intro_clean = lambda string: regex.sub(r'(\.\.\.\smore>>|\s<<less)', '', string.text.strip())
+def parse_search(soup, limit=None):
+    intro_clean = lambda string: INTRO_CLEAN_RE.sub('', string.text.strip())
 
-    titles = [title.text async for title in async_iter(soup.find_all('span', {'class': 'entry-title'}))]
-    links = [link.get('href', None) async for link in async_iter(soup.find_all('a', {'class': 'w-blog-entry-link'}))]
-    covers = [cover.get('src', None) async for cover in async_iter(soup.find_all('img', {'class': 'wp-post-image'}))]
-    genres_block = [genre.text async for genre in async_iter(soup.find_all('span', {'class': 's-genre'}))]
-    genres = [genre.split() async for genre in async_iter(genres_block)]
-    intros = [intro_clean(intro) async for intro in async_iter(soup.find_all('div', {'class': 'w-blog-entry-short'}))]
+    titles = [title.text for title in soup.find_all('span', {'class': 'entry-title'})]
+    links = [link.get('href', None) for link in soup.find_all('a', {'class': 'w-blog-entry-link'})]
+    covers = [cover.get('src', None) for cover in soup.find_all('img', {'class': 'wp-post-image'})]
+    genres = [genre.text.split() for genre in soup.find_all('span', {'class': 's-genre'})]
+    intros = [intro_clean(intro) for intro in soup.find_all('div', {'class': 'w-blog-entry-short'})]
 
     novels = []
 
-    async for title, link, cover, genre, intro in async_iter(zip(titles, links, covers, genres, intros)):
+    for title, link, cover, genre, intro in zip(titles, links, covers, genres, intros):
         novels.append({
             'title': title,
             'link': link,
@@ -62,14 +145,36 @@ async def parse_search(soup, limit=None):
     return novels
 
 
-@hug.local()
-def parse_latest(soup, limit=None) -> dict:
-    pass
+def parse_latest(soup, limit=None) -> list:
+    novels = []
+    for block in soup.find_all('div', {'class': 'search_main_box_nu'}, limit=limit):
+        sid = block.find('span', {'class': 'rl_icons_en'})
+        title = block.find('div', {'class': 'search_title'}).find('a')
+        cover = block.find('img')
+        novels.append({
+            'id': int(sid['id'][3:]),
+            'title': title.text.strip(),
+            'link': title.get('href', None),
+            'cover': cover.get('src', None) if cover else None,
+            'genre': [genre.text for genre in block.find_all('a', {'class': 'gennew'})] or None
+        })
+    return novels
 
 
-@hug.local()
-def parse_ranking(soup, limit=None) -> dict:
-    pass
+def parse_ranking(soup, limit=None, offset=0) -> list:
+    ranking = []
+    for position, block in enumerate(soup.find_all('div', {'class': 'search_main_box_nu'}, limit=limit), 1):
+        sid = block.find('span', {'class': 'rl_icons_en'})
+        title = block.find('div', {'class': 'search_title'}).find('a')
+        rank = block.find('div', {'class': 'genre_rank'})
+        rank = non_digit_pattern.sub('', rank.text) if rank else ''
+        ranking.append({
+            'rank': int(rank) if rank else offset + position,
+            'id': int(sid['id'][3:]),
+            'title': title.text.strip(),
+            'link': title.get('href', None)
+        })
+    return ranking
 
 
 @hug.local()
@@ -77,11 +182,15 @@ def parse_ranking(soup, limit=None) -> dict:
 @hug.get(versions=1, output=hug.output_format.pretty_json)
 async def get_reading_list(url: str) -> dict:
     """https://nu-kasasagi.herokuapp.com/v1/get_reading_list/?url=READING_LIST_URL"""
-    await init()
-    novels = OrderedDict({})
-    async with session.get(url, headers=headers) as response:
-        list_soup = BeautifulSoup(await response.text(), 'lxml', parse_only=table_filter)
+    async with await init() as session:
+        async with session.get(url, headers=headers) as response:
+            markup = await response.text()
 
+    return await parse_off_loop(markup, parse_reading_list, table_filter, 'reading_list')
+
+
+def parse_reading_list(list_soup) -> dict:
+    novels = OrderedDict({})
     statuses = list_soup.find_all('td', {'align': 'left'})
     links = list_soup.find_all('a')
 
@@ -92,132 +201,351 @@ async def get_reading_list(url: str) -> dict:
             'last': status[0][2:],
             'current': status[1][:-2]
         }})
-    session.close()
     return novels
 
 
+def diff_reading_list(old: dict, new: dict) -> dict:
+    """Delta between two reading list snapshots: added and removed novels and changed current/last chapters"""
+    added = {title: novel for title, novel in new.items() if title not in old}
+    removed = [title for title in old if title not in new]
+    changed = {}
+    for title, novel in new.items():
+        previous = old.get(title)
+        if previous is None:
+            continue
+        fields = {field: {'old': previous[field], 'new': novel[field]}
+                  for field in ('current', 'last') if previous[field] != novel[field]}
+        if fields:
+            changed[title] = fields
+    return {'added': added, 'removed': removed, 'changed': changed}
+
+
+async def fetch_reading_list_delta(client, url: str) -> dict:
+    """Conditionally fetch a reading list and diff it against the last snapshot stored for its url"""
+    snapshot = reading_list_snapshots.get(url)
+    request_headers = dict(headers)
+    if snapshot is not None:
+        if snapshot['etag']:
+            request_headers['If-None-Match'] = snapshot['etag']
+        if snapshot['last_modified']:
+            request_headers['If-Modified-Since'] = snapshot['last_modified']
+
+    unchanged = {'url': url, 'modified': False, 'added': {}, 'removed': [], 'changed': {}}
+    async with client.get(url, headers=request_headers) as response:
+        if response.status == 304:
+            metrics.inc('cache_hits_total', source='reading_list', kind='not_modified')
+            return unchanged
+        if response.status != 200:
+            return {'url': url, 'error': f'HTTP {response.status}'}
+        body = await response.read()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+    # NU does not always honour the conditional headers, an identical body is not parsed again
+    digest = hashlib.sha1(body).hexdigest()
+    if snapshot is not None and snapshot['digest'] == digest:
+        metrics.inc('cache_hits_total', source='reading_list', kind='same_digest')
+        return unchanged
+
+    novels = await parse_off_loop(body, parse_reading_list, table_filter, 'reading_list')
+    delta = diff_reading_list(snapshot['novels'] if snapshot else {}, novels)
+    reading_list_snapshots.set(url, {
+        'etag': etag,
+        'last_modified': last_modified,
+        'digest': digest,
+        'novels': novels
+    })
+    delta.update({'url': url, 'modified': True})
+    return delta
+
+
 @hug.local()
 @hug.cli()
 @hug.get(versions=1, output=hug.output_format.pretty_json)
-async def get_all_chapters(url: str) -> dict:
-    """https://nu-kasasagi.herokuapp.com/v1/get_all_chapters/?url=NOVEL_PAGE_URL"""
-    await init()
+async def sync_reading_list(url: str) -> dict:
+    """https://nu-kasasagi.herokuapp.com/v1/sync_reading_list/?url=READING_LIST_URL"""
+    async with await init() as session:
+        return await fetch_reading_list_delta(session, url)
 
-    chapters_list = []
 
-    async def get_chapter_list(chapter_url: str):
-        async with session.get(chapter_url, headers=headers) as chapter_response:
-            chapter_list_soup = BeautifulSoup(await chapter_response.text(), 'lxml', parse_only=table_filter)
+@hug.local()
+@hug.cli()
+@hug.get(versions=1, output=hug.output_format.pretty_json)
+async def sync_reading_lists(urls: hug.types.delimited_list(','), limit: hug.types.number=10) -> dict:
+    """https://nu-kasasagi.herokuapp.com/v1/sync_reading_lists/?urls=URL1,URL2"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def sync(list_url):
+        async with semaphore:
+            try:
+                return await fetch_reading_list_delta(session, list_url)
+            except aiohttp.ClientError as error:
+                return {'url': list_url, 'error': str(error)}
+
+    async with await init() as session:
+        deltas = await asyncio.gather(*[sync(list_url) for list_url in urls])
+    return {'lists': deltas}
+
+
+def parse_chapter_popup(soup) -> list:
+    """Chapters of the admin-ajax chapter list fragment, in the order of the fragment"""
+    chapters = []
+    for item in soup.find_all('li', {'class': 'sp_li_chp'}):
+        links = [link for link in item.find_all('a') if link.text.strip()]
+        if not links:
+            continue
+        chapter = links[-1]
+        name = chapter.find('span')
+        chapters.append({
+            'chapter_name': name.get('title', name.text) if name else chapter.text.strip(),
+            'chapter_link': chapter['href'],
+            # The popup lists every chapter once, without the releasing group
+            'release_group': None
+        })
+    return chapters
 
-        latest = chapter_list_soup.find('table', {'id': 'myTable'})
-        latest_chapters = latest.find_all('a', {'class': 'chp-release'})
-        releases = chapter_list_soup.find_all('a', href=regex.compile('http://www\.novelupdates\.com/group/'))
 
-        for chapter, release in zip(latest_chapters[1::2], releases):
-            chapters_list.append({
-                'chapter_name': chapter.text,
-                'chapter_link': chapter['href'],
-                'release_group': release.text
-            })
+async def fetch_page(client, url, raise_for_status=False, with_url=False):
+    """Text of a page, fetched under the adaptive limit of fetch_controller
 
-    if 'series' not in url:
-        return {'error': 'Not a valid novel url'}
-    else:
-        pattern = regex.compile(r'/series/.*/')
-        series = pattern.search(url).group()
-        base_url = 'http://www.novelupdates.com'
+    The status, time to first byte and Cloudflare challenges are reported to the controller. With with_url, a
+    (text, url after the redirects) tuple is returned.
+    """
+    async with fetch_controller.async_slot() as observe:
+        start = perf_counter()
+        async with client.get(url, headers=headers) as response:
+            challenge = response.headers.get('cf-mitigated') == 'challenge' or (
+                response.status == 403 and 'cloudflare' in response.headers.get('Server', '').lower())
+            observe(response.status, perf_counter() - start, challenge)
+            if raise_for_status:
+                response.raise_for_status()
+            if with_url:
+                return await response.text(), str(response.url)
+            return await response.text()
+
+
+async def fetch_chapter_popup(client, post_id):
+    """The full chapter list of a series in one admin-ajax request, keyed on the series post id"""
+    data = {'action': 'nd_getchapters', 'mygrr': 0, 'mypostid': post_id}
+    async with client.post(ajax_url, data=data, headers=headers) as response:
+        response.raise_for_status()
+        markup = await response.text()
+    return await parse_off_loop(markup, parse_chapter_popup, None, 'chapter_popup')
 
-        url = f'{base_url}{series}'
 
-    async with session.get(url, headers=headers) as response:
-        novel_soup = BeautifulSoup(await response.text(), 'lxml')
+@hug.local()
+@hug.cli()
+@hug.get(versions=1, output=hug.output_format.pretty_json)
+async def get_all_chapters(url: str, mode: hug.types.one_of(['ajax', 'pages'])='ajax',
+                           stream: hug.types.smart_boolean=False, response=None):
+    """https://nu-kasasagi.herokuapp.com/v1/get_all_chapters/?url=NOVEL_PAGE_URL
+
+    mode=ajax gets the whole chapter list in one request and only pages through the release
+    tables (?pg=N) when that fails, mode=pages always pages through them.
+    Identical concurrent calls share one scrape, results are cached (chapters_cache).
+    stream=true answers NDJSON instead, a {"name"} line and then every chapter as soon as its
+    page is parsed, without going through the cache.
+    """
+    if stream:
+        if response is not None:
+            response.content_type = 'application/x-ndjson'
+        return NDJSONStream(iter_all_chapters(url, mode), asyncio.get_event_loop())
+    return await chapters_cache.get((url, mode), lambda: fetch_all_chapters(url, mode))
+
+
+def parse_chapter_table(chapter_list_soup) -> list:
+    """Chapters of a release table page (?pg=N) of a series"""
+    latest = chapter_list_soup.find('table', {'id': 'myTable'})
+    latest_chapters = latest.find_all('a', {'class': 'chp-release'})
+    releases = chapter_list_soup.find_all('a', href=group_link_pattern)
 
+    return [{
+        'chapter_name': chapter.text,
+        'chapter_link': chapter['href'],
+        'release_group': release.text
+    } for chapter, release in zip(latest_chapters[1::2], releases)]
+
+
+def parse_series_page(novel_soup) -> dict:
+    """Title, post id and number of release table pages (None for a single page) of a series page"""
+    shortlink = novel_soup.find('link', {'rel': 'shortlink'})
     gap = novel_soup.find('span', {'class': 'gap'})
     pagination = novel_soup.find_all('div', {'class': 'digg_pagination'})
 
-    single = False
-
     if gap:
         gap = gap.findNext('a')
-        final_page = regex.sub('\D', '', gap['href'])
-        page_urls = [f'{url}?pg={i}' for i in range(1, int(final_page) + 1)]
+        last_page = int(non_digit_pattern.sub('', gap['href']))
     elif pagination:
-        page_nums = novel_soup.find_all('a', text=regex.compile(r'^[0-6]'))
+        page_nums = novel_soup.find_all('a', text=page_num_pattern)
         page_nums = [num.text for num in page_nums]
-        page_urls = [f'{url}?pg={i}' for i in range(1, int(max(page_nums)) + 1)]
+        last_page = int(max(page_nums))
     else:
-        single = True
+        last_page = None
+
+    return {
+        'title': novel_soup.find('div', {'class': 'seriestitlenu'}).text,
+        'post_id': shortlink.get('href').split('p=')[-1] if shortlink is not None else None,
+        'last_page': last_page
+    }
 
-    if single is True:
-        await get_chapter_list(url)
-    else:
-        for page_url in page_urls:
-            await get_chapter_list(page_url)
 
-    novel_title = novel_soup.find('div', {'class': 'seriestitlenu'}).text
+async def iter_all_chapters(url, mode='ajax', client=None):
+    """Yields {'name': title} (or {'error'}) first, then every chapter of a series as soon as its page is parsed
 
-    chapters = {
-        'name': novel_title,
+    Uses the given client or a session of its own, closed at the end.
+    """
+    if 'series' not in url:
+        yield {'error': 'Not a valid novel url'}
+        return
+
+    own_session = client is None
+    if own_session:
+        client = await init()
+    try:
+        series = series_path_pattern.search(url).group()
+        url = f'{series_base_url}{series}'
+
+        markup = await fetch_page(client, url)
+        series_page = await parse_off_loop(markup, parse_series_page, None, 'novel_page')
+
+        yield {'name': series_page['title']}
+
+        if mode == 'ajax' and series_page['post_id'] is not None:
+            try:
+                chapters = await fetch_chapter_popup(client, series_page['post_id'])
+            except Exception:
+                # Request or parse failure of the popup (e.g. a changed fragment), the release tables still work
+                chapters = []
+            if chapters:
+                for chapter in chapters:
+                    yield chapter
+                return
+            metrics.inc('chapter_list_fallbacks_total', source='kasasagi')
+
+        if series_page['last_page'] is None:
+            page_urls = [url]
+        else:
+            page_urls = [f'{url}?pg={page}' for page in range(1, series_page['last_page'] + 1)]
+
+        async def fetch_chapter_page(page_url):
+            markup = await fetch_page(client, page_url)
+            return await parse_off_loop(markup, parse_chapter_table, table_filter, 'chapter_list')
+
+        # Fetched concurrently up to chapter_read_ahead pages ahead (and as far as fetch_controller allows), yielded
+        # in page order. A consumer that stops early leaves at most the read-ahead pages fetched for nothing.
+        page_urls = iter(page_urls)
+        pages = deque()
+
+        def read_ahead():
+            for page_url in islice(page_urls, max(1, chapter_read_ahead) - len(pages)):
+                page = asyncio.ensure_future(fetch_chapter_page(page_url))
+                # The pages left behind by an early exit are not awaited, their exception is retrieved
+                page.add_done_callback(lambda task: task.cancelled() or task.exception())
+                pages.append(page)
+
+        try:
+            read_ahead()
+            while pages:
+                chapters = await pages.popleft()
+                read_ahead()
+                for chapter in chapters:
+                    yield chapter
+        finally:
+            for page in pages:
+                page.cancel()
+    finally:
+        if own_session:
+            await client.close()
+
+
+async def fetch_all_chapters(url, mode='ajax', client=None):
+    """Scrapes the chapter list of a series, with the given client or a new session closed at the end"""
+    items = iter_all_chapters(url, mode, client)
+    header = await items.__anext__()
+    if 'error' in header:
+        return header
+
+    chapters_list = [chapter async for chapter in items]
+    return {
+        'name': header['name'],
         'chapter_count': len(chapters_list),
         'chapters': chapters_list
     }
 
-    session.close()
-    return chapters
-
 
 @hug.cli()
 @hug.get(versions=1, output=hug.output_format.pretty_json)
-async def search(term: str, limit=None) -> dict:
-    """https://nu-kasasagi.herokuapp.com/v1/search/?term=SEARCH_TERMS"""
-    # TODO: Slows down far too much per page of results
+async def search(term: str, limit=None, stream: hug.types.smart_boolean=False, response=None):
+    """https://nu-kasasagi.herokuapp.com/v1/search/?term=SEARCH_TERMS
 
-    await init()
+    Identical concurrent calls share one scrape, results are cached (search_cache).
+    stream=true answers NDJSON instead, every result as soon as its page is parsed, without going
+    through the cache.
+    """
+    if stream:
+        if response is not None:
+            response.content_type = 'application/x-ndjson'
+        return NDJSONStream(iter_search(term), asyncio.get_event_loop())
+    return await search_cache.get((term.strip().lower(), limit), lambda: fetch_search(term, limit))
 
-    url = f'{base_url}/?s={term}&post_type=seriesplans'
 
-    search_filter = SoupStrainer('div', {'class': 'l-content'})
+def parse_search_page(search_soup) -> dict:
+    """Results of the first search page and the number of result pages, results is None if nothing was found"""
+    if search_soup.find('div', {'class': 'w-blog-entry-h'}) is None:
+        return {'results': None, 'last_page': None}
 
-    async with session.get(url, headers=headers) as response:
-        search_soup = BeautifulSoup(await response.text(), 'lxml', parse_only=search_filter)
+    nav = search_soup.find('div', {'class': 'digg_pagination'})
+    next_page = nav.find('a', {'class': 'next'})
+    dots = nav.find('span', {'class': 'dots'})
+    last_page = None
+    if next_page:
+        last_page = int(dots.findNext('a').text) if dots else 3
+    return {'results': parse_search(search_soup), 'last_page': last_page}
 
-    found = search_soup.find('div', {'class': 'w-blog-entry-h'})
 
-    search_result = []
+async def iter_search(term):
+    """Yields every search result as soon as its page is parsed, nothing if no posts were found"""
+    # TODO: Slows down far too much per page of results
 
-    if found is None:
-        search_result = {'info': 'no posts were found'}
-    else:
-        search_result.extend(await parse_search(search_soup))
+    session = await init()
+    try:
+        url = f'{base_url}/?s={term}&post_type=seriesplans'
 
-        nav = search_soup.find('div', {'class': 'digg_pagination'})
-        next_page = nav.find('a', {'class': 'next'})
-        dots = nav.find('span', {'class': 'dots'})
+        search_filter = SoupStrainer('div', {'class': 'l-content'})
 
-        async def page_gen(num):
-                return f'{base_url}/page/{num}/?s={term}&post_type=seriesplans'
+        async with session.get(url, headers=headers) as response:
+            markup = await response.text()
+        first_page = await parse_off_loop(markup, parse_search_page, search_filter, 'search')
 
-        if next_page:
-            if dots:
-                last_page = dots.findNext('a').text
-                pages = [await page_gen(page) async for page in async_iter(range(1, int(last_page)))]
-            else:
-                last_page = 3
-                pages = [await page_gen(page) async for page in async_iter(range(1, int(last_page)))]
+        if first_page['results'] is None:
+            return
+        for result in first_page['results']:
+            yield result
+
+        pages = []
+        if first_page['last_page'] is not None:
+            pages = [f'{base_url}/page/{num}/?s={term}&post_type=seriesplans'
+                     for num in range(1, first_page['last_page'])]
 
-        if pages:
-            async for page in async_iter(pages):
-                async with session.get(page, headers=headers) as response:
-                    if response.status == 200:
-                        search_soup = BeautifulSoup(await response.text(), 'lxml', parse_only=search_filter)
-                        search_result.extend(await parse_search(search_soup))
+        for page in pages:
+            async with session.get(page, headers=headers) as response:
+                if response.status == 200:
+                    markup = await response.text()
+                    for result in await parse_off_loop(markup, parse_search, search_filter, 'search'):
+                        yield result
+    finally:
+        await session.close()
+
+
+async def fetch_search(term, limit=None):
+    search_result = [result async for result in iter_search(term)]
+    if not search_result:
+        search_result = {'info': 'no posts were found'}
 
     search_results = {
         'result_count': len(search_result),
         'results': search_result
     }
-
-    session.close()
     return search_results
 
 
@@ -235,7 +563,6 @@ async def advanced_search(language=None, novel_type=None, genre: hug.types.delim
                           complete: hug.types.one_of(['yes', 'no'])=None, sort=None, order=None,
                           limit: hug.types.number=None) -> dict:
     """https://nu-kasasagi.herokuapp.com/v1/advanced_search/?arg1=value&?arg2=value, etc (See Inputs)"""
-    await init()
 
     base_url = 'http://www.novelupdates.com/series-finder/?sf=1'
 
@@ -1568,55 +1895,319 @@ async def advanced_search(language=None, novel_type=None, genre: hug.types.delim
 
     search_filter = SoupStrainer('div', {'class': 'w-blog-list'})
 
-    async with session.get(base_url, params=urlargs, headers=headers) as response:
-        adv_search_soup = BeautifulSoup(await response.text(), 'lxml', parse_only=search_filter)
+    async with await init() as session:
+        async with session.get(base_url, params=urlargs, headers=headers) as response:
+            markup = await response.text()
 
-    session.close()
+    search_result = await parse_off_loop(markup, parse_advanced_search, search_filter, 'advanced_search')
+    return search_result
 
-    if 'No posts were found.' in adv_search_soup.find('div', {'class': 'l-content'}).text:
-        search_result = {'info': 'no posts were found'}
-    else:
-        search_result = parse_search(adv_search_soup)
 
-    return search_result
+def parse_advanced_search(adv_search_soup):
+    if 'No posts were found.' in adv_search_soup.find('div', {'class': 'l-content'}).text:
+        return {'info': 'no posts were found'}
+    return parse_search(adv_search_soup)
 
 
 @hug.cli()
 @hug.get(versions=1, output=hug.output_format.pretty_json)
-async def get_latest_series(limit=None) -> dict:
+async def get_latest_series(limit: hug.types.number=None, page: hug.types.number=1) -> dict:
     """Get latest series added"""
-    await init()
+    url = f'{series_base_url}/latest-series/?st=1&pg={page}'
+
+    async with await init() as session:
+        async with session.get(url, headers=headers) as response:
+            markup = await response.text()
 
-    url = 'http://www.novelupdates.com/latest-series/'
+    latest_series = await parse_off_loop(markup, parse_latest, latest_filter, 'latest_series', limit=limit)
+    return {
+        'result_count': len(latest_series),
+        'results': latest_series
+    }
 
-    latest_filter = SoupStrainer('div', {'class': 'g-html'})
 
-    async with session.get(url, headers=headers) as response:
-        latest_series_soup = BeautifulSoup(await response.text(), 'lxml', parse_only=latest_filter)
+async def poll_latest_series(client, watermark=None, max_pages=10, on_new=None):
+    """Fetch latest series pages until the series with the watermark id (the newest one seen by the previous poll)
+    shows up, returns the new series, the watermark of the next poll and whether the poll was truncated
 
+    Without watermark only the first page is read. A poll that does not reach the watermark within max_pages is
+    truncated, the series past the last page read were not seen. The watermark is then kept, the next poll gets the
+    new series again instead of skipping the unseen ones.
+    on_new, e.g. NovelScraper.parse_novels, is called with the list of new series ids. A coroutine function is
+    awaited, a plain function runs in the default executor so it does not block the event loop.
+    """
+    new_series = []
+    for page in range(1, max_pages + 1):
+        url = f'{series_base_url}/latest-series/?st=1&pg={page}'
+        async with client.get(url, headers=headers) as response:
+            markup = await response.text()
+
+        entries = await parse_off_loop(markup, parse_latest, latest_filter, 'latest_series')
+        reached = False
+        for entry in entries:
+            if watermark is not None and entry['id'] <= watermark:
+                reached = True
+                break
+            new_series.append(entry)
+        if reached or not entries or watermark is None:
+            truncated = False
+            break
+    else:
+        truncated = True
 
+    if new_series:
+        if on_new is not None:
+            new_ids = [entry['id'] for entry in new_series]
+            if asyncio.iscoroutinefunction(on_new):
+                await on_new(new_ids)
+            else:
+                await asyncio.get_event_loop().run_in_executor(None, on_new, new_ids)
+        if not truncated:
+            watermark = max(entry['id'] for entry in new_series)
+    return new_series, watermark, truncated
 
-    session.close()
-    return {'error': 'unimplemented'}
+
+async def poll_consumer_series(consumer='default', since=None, max_pages=10, on_new=None):
+    """poll_latest_series from the persisted watermark of a consumer, the watermark is stored once on_new is done
+
+    since, the watermark of an earlier answer, overrides the stored one.
+    """
+    watermark = since if since is not None else latest_watermarks.get(consumer)
+    async with await init() as session:
+        new_series, watermark, truncated = await poll_latest_series(session, watermark, max_pages, on_new)
+    if watermark is not None:
+        latest_watermarks.set(consumer, watermark)
+    return new_series, watermark, truncated
 
 
 @hug.cli()
 @hug.get(versions=1, output=hug.output_format.pretty_json)
-async def get_series_ranking(limit=None) -> dict:
-    """Get series ranking"""
-    await init()
+async def get_new_series(consumer: str='default', since: hug.types.number=None,
+                         max_pages: hug.types.number=10) -> dict:
+    """Get the series added since the previous call of the same consumer
+
+    The watermark of every consumer is persisted (latest_watermarks). since, the watermark of an earlier
+    answer, overrides the stored one. truncated means max_pages did not reach the watermark, the watermark was
+    kept and the next call returns these series again, with the older ones.
+    """
+    new_series, watermark, truncated = await poll_consumer_series(consumer, since, max_pages)
+    return {
+        'result_count': len(new_series),
+        'watermark': watermark,
+        'truncated': truncated,
+        'results': new_series
+    }
+
+
+@hug.cli()
+@hug.get(versions=1, output=hug.output_format.pretty_json)
+async def get_series_ranking(rank='popmonth', pages: hug.types.number=1, limit: hug.types.number=None,
+                             concurrency: hug.types.number=5, snapshot: hug.types.smart_boolean=False) -> dict:
+    """Get series ranking, rank is one of NU's rankings (popular, popmonth, sixmonths, ...)"""
+    url = f'http://www.novelupdates.com/series-ranking/?rank={rank}'
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get_ranking_page(page):
+        async with semaphore:
+            async with session.get(f'{url}&pg={page}', headers=headers) as response:
+                markup = await response.text()
+        # NU lists 25 series per ranking page
+        return await parse_off_loop(markup, parse_ranking, ranking_filter, 'series_ranking',
+                                    offset=(page - 1) * 25)
+
+    async with await init() as session:
+        ranking_pages = await asyncio.gather(*[get_ranking_page(page) for page in range(1, pages + 1)])
+
+    series_ranking = [entry for ranking_page in ranking_pages for entry in ranking_page]
+    if snapshot:
+        ranking_history.save_snapshot(rank, series_ranking)
+    if limit:
+        series_ranking = series_ranking[:limit]
+
+    return {
+        'ranking': rank,
+        'result_count': len(series_ranking),
+        'results': series_ranking
+    }
+
+
+@hug.cli()
+@hug.get(versions=1, output=hug.output_format.pretty_json)
+def get_rank_history(series_id: hug.types.number, rank='popmonth') -> dict:
+    """Get the rank of a series in every stored ranking snapshot"""
+    history = ranking_history.rank_history(series_id, rank)
+    return {
+        'id': series_id,
+        'ranking': rank,
+        'history': [{'date': date, 'rank': position} for date, position in history]
+    }
+
+
+def parse_series_details(soup) -> dict:
+    """Main details of a series page"""
+    def text(element_id):
+        element = soup.find('div', {'id': element_id})
+        return element.text.strip() if element else None
+
+    def links(element_id):
+        element = soup.find('div', {'id': element_id})
+        return [link.text.strip() for link in element.find_all('a')] if element else []
+
+    shortlink = soup.find('link', {'rel': 'shortlink'})
+    cover = soup.find('div', {'class': 'seriesimg'})
+    cover = cover.find('img') if cover else None
+    return {
+        'id': int(shortlink.get('href').split('p=')[-1]) if shortlink is not None else None,
+        'title': soup.find('div', {'class': 'seriestitlenu'}).text.strip(),
+        'cover': cover.get('src', None) if cover else None,
+        'type': text('showtype'),
+        'language': text('showlang'),
+        'genre': links('seriesgenre'),
+        'tags': links('showtags'),
+        'authors': links('showauthors'),
+        'year': text('edityear'),
+        'status': text('editstatus'),
+        'description': text('editdescription')
+    }
+
+
+async def fetch_series(client, series_id) -> dict:
+    url = series_resolver.url(series_id, f'{series_base_url}/?p={series_id}')
+    markup, url = await fetch_page(client, url, raise_for_status=True, with_url=True)
+    if series_resolver.slug(series_id) != series_resolver.slug_of(url):
+        series_resolver.add(series_id, url)
+        series_resolver.save()
+    return await parse_off_loop(markup, parse_series_details, None, 'series_details')
+
+
+async def get_client():
+    """Pooled session of the batch endpoints, created once and kept open between requests"""
+    global client_session
+    if client_session is None or client_session.closed:
+        client_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=max_batch_concurrency),
+                                               trace_configs=[metrics.trace_config('kasasagi')])
+    return client_session
+
+
+async def run_batch(keys, fetch, concurrency):
+    """Runs fetch(key) for every key with bounded concurrency, yields {'key', 'result'} or {'key', 'error'}
+    items as they complete. A failed item does not fail the batch, an exception or an {'error'} payload
+    (e.g. fetch_all_chapters on an invalid url) make an error item."""
+    semaphore = asyncio.Semaphore(max(1, min(concurrency, max_batch_concurrency)))
+
+    async def run_one(key):
+        async with semaphore:
+            try:
+                result = await fetch(key)
+            except Exception as error:
+                metrics.inc('batch_item_errors_total', source='kasasagi', error=type(error).__name__)
+                return {'key': key, 'error': f'{type(error).__name__}: {error}'}
+        if isinstance(result, dict) and 'error' in result:
+            metrics.inc('batch_item_errors_total', source='kasasagi', error='payload')
+            return {'key': key, 'error': result['error']}
+        return {'key': key, 'result': result}
+
+    tasks = [asyncio.ensure_future(run_one(key)) for key in keys]
+    try:
+        for item in asyncio.as_completed(tasks):
+            yield await item
+    finally:
+        # Closed before the end (see NDJSONStream.close), the items still running are stopped
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class NDJSONStream:
+    """File-like adapter hug streams as the response body (response.stream), one JSON line per batch item
+
+    hug runs the handler coroutine to completion before the body is sent, read() drives the rest of the batch
+    on the same event loop, so every line is sent as soon as its item is done. The server calls close() once the
+    body is sent or the client went away, the items still running are then cancelled.
+    """
+
+    def __init__(self, items, loop):
+        self.items = items
+        self.loop = loop
+        self.buffer = b''
+        self.done = False
+
+    def read(self, size=-1):
+        while not self.done and (size < 0 or len(self.buffer) < size):
+            try:
+                item = self.loop.run_until_complete(self.items.__anext__())
+            except StopAsyncIteration:
+                self.done = True
+                break
+            self.buffer += (json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8')
+        if size < 0 or size >= len(self.buffer):
+            chunk, self.buffer = self.buffer, b''
+        else:
+            chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+    def close(self):
+        if not self.done:
+            self.done = True
+            self.loop.run_until_complete(self.items.aclose())
+
+
+async def batch_response(keys, fetch, concurrency, stream, response):
+    if len(keys) > max_batch_size:
+        return {'error': f'At most {max_batch_size} items per request'}
+    items = run_batch(keys, fetch, concurrency)
+    if stream:
+        if response is not None:
+            response.content_type = 'application/x-ndjson'
+        return NDJSONStream(items, asyncio.get_event_loop())
+    results = {item['key']: item async for item in items}
+    # Same order as the request
+    ordered = [results[key] for key in dict.fromkeys(keys)]
+    errors = {item['key']: item['error'] for item in ordered if 'error' in item}
+    return {
+        'result_count': len(ordered) - len(errors),
+        'error_count': len(errors),
+        'results': ordered,
+        'errors': errors
+    }
+
+
+@hug.local()
+@hug.get('/series', versions=1, output=hug.output_format.pretty_json)
+async def get_series_batch(ids: hug.types.delimited_list(','), concurrency: hug.types.number=8,
+                           stream: hug.types.smart_boolean=False, response=None):
+    """https://nu-kasasagi.herokuapp.com/v1/series?ids=ID1,ID2,... (stream=true for NDJSON)"""
+    client = await get_client()
+    return await batch_response(list(dict.fromkeys(ids)), lambda series_id: fetch_series(client, series_id),
+                                concurrency, stream, response)
+
+
+@hug.local()
+@hug.get('/chapters', versions=1, output=hug.output_format.pretty_json)
+async def get_chapters_batch(urls: hug.types.delimited_list(','), mode: hug.types.one_of(['ajax', 'pages'])='ajax',
+                             concurrency: hug.types.number=4, stream: hug.types.smart_boolean=False, response=None):
+    """https://nu-kasasagi.herokuapp.com/v1/chapters?urls=NOVEL_PAGE_URL1,NOVEL_PAGE_URL2,... (stream=true for NDJSON)
+
+    Shares the chapters_cache of get_all_chapters.
+    """
+    client = await get_client()
+
+    def fetch(url):
+        return chapters_cache.get((url, mode), lambda: fetch_all_chapters(url, mode, client))
+
+    return await batch_response(list(dict.fromkeys(urls)), fetch, concurrency, stream, response)
 
-    url = 'http://www.novelupdates.com/series-ranking/'
 
-    async with session.get(url, headers=headers) as response:
-        series_ranking_soup = BeautifulSoup(await response.text(), 'lxml')
-    session.close()
-    return {'error': 'unimplemented'}
+@hug.get(versions=1, output=hug.output_format.text)
+def get_metrics():
+    """Request, timing and cache counters of this server in the Prometheus text format"""
+    return metrics.to_prometheus()
 
 
 @hug.not_found(output=hug.output_format.html)
 async def not_found_html(documentation: hug.directives.documentation):
     """Generate HTML based 404 page"""
+    from json2html import json2html
     template = """
         <html>
         <head>
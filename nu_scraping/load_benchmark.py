@@ -0,0 +1,93 @@
+import asyncio
+import argparse
+from time import perf_counter
+from aiohttp import web
+import kasasagi
+
+
+def series_page(pages):
+    return (f'<html><head><link rel="shortlink" href="http://localhost/?p=1"/></head><body>'
+            f'<div class="seriestitlenu">Load Test</div>'
+            f'<div class="digg_pagination"><span class="gap">...</span><a href="?pg={pages}">{pages}</a></div>'
+            f'</body></html>')
+
+
+def chapter_page(rows):
+    body = ''.join(f'<tr><td>01/01/20</td><td><a href="http://www.novelupdates.com/group/group-{i}/">Group {i}</a>'
+                   f'</td><td><a class="chp-release" href="#">c{i}</a><a class="chp-release" href="/c/{i}/">c{i}</a>'
+                   f'</td></tr>' for i in range(rows))
+    return f'<html><body><table id="myTable"><tbody>{body}</tbody></table></body></html>'
+
+
+async def start_stand_in(port, pages, rows):
+    """Local stand-in for the series and release table pages of novelupdates"""
+    async def series(request):
+        if 'pg' in request.query:
+            return web.Response(text=chapter_page(rows), content_type='text/html')
+        return web.Response(text=series_page(pages), content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/series/{slug}/', series)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, 'localhost', port).start()
+    return runner
+
+
+async def measure_lag(stop, interval=0.01):
+    """Worst delay of a timer on the event loop, how long other requests would have been stalled"""
+    worst = 0.0
+    while not stop.is_set():
+        start = perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, perf_counter() - start - interval)
+    return worst
+
+
+async def run(concurrency, requests):
+    # The calls share this process and its event loop, like the async callers of kasasagi (iter_all_chapters, the
+    # NDJSON stream, the batch endpoints). The served HTTP endpoints are not driven, hug's server answers one request
+    # at a time, so there only the pages of a single request are fetched and parsed concurrently.
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(num):
+        async with semaphore:
+            # Distinct urls, the chapters cache is not what is measured here
+            await kasasagi.fetch_all_chapters(f'{kasasagi.series_base_url}/series/load-{num}/', 'pages')
+
+    stop = asyncio.Event()
+    lag = asyncio.ensure_future(measure_lag(stop))
+    start = perf_counter()
+    await asyncio.gather(*[one(num) for num in range(requests)])
+    elapsed = perf_counter() - start
+    stop.set()
+    return requests / elapsed, await lag
+
+
+async def main(args):
+    runner = await start_stand_in(args.port, args.pages, args.rows)
+    kasasagi.series_base_url = f'http://localhost:{args.port}'
+    try:
+        print(f'{"pool":<14} {"concurrency":>11} {"req/s":>8} {"max loop lag ms":>16}')
+        for workers, processes, label in ((0, False, 'event loop'), (args.workers, False, 'threads'),
+                                          (args.workers, True, 'processes')):
+            kasasagi.set_parse_pool(workers, processes)
+            for concurrency in args.concurrency:
+                throughput, lag = await run(concurrency, args.requests)
+                print(f'{label:<14} {concurrency:>11} {throughput:>8.1f} {lag * 1000:>16.1f}')
+        kasasagi.set_parse_pool(0)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Concurrent fetch_all_chapters calls in this process against a '
+                                                 'local stand-in, parsing on the event loop vs in the parse pool. '
+                                                 'The served HTTP endpoints are not measured.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--requests', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--pages', type=int, default=3, help='release table pages per series')
+    parser.add_argument('--rows', type=int, default=500, help='rows per release table page')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,199 @@
+import threading
+from time import perf_counter
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    Counters, gauges and timings of a crawl, exported in the Prometheus text format or as a per-run summary.
+
+    Every metric is identified by its name and labels, e.g. inc('http_requests_total', source='NovelScraper',
+    status=200). Timings (observe/timer) keep a count, a sum and a maximum. Safe to use from several threads.
+
+    :param prefix: str, prepended to every metric name on export.
+    """
+
+    def __init__(self, prefix='nu_'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = dict()
+        self.gauges = dict()
+        self.timings = dict()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            count, total, maximum = self.timings.get(key, (0, 0.0, 0.0))
+            self.timings[key] = (count + 1, total + value, max(maximum, value))
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes the time spent in the with block, in seconds.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+    def record_response(self, source, response, seconds):
+        """
+        Records a requests response: status, bytes, time to first byte and download time.
+        requests does not expose the DNS and connect times, they are only recorded for aiohttp (trace_config).
+
+        :param source: str, the fetcher, e.g. NovelScraper.
+        :param response: A requests response.
+        :param seconds: The total time of the request.
+        """
+        ttfb = response.elapsed.total_seconds()
+        self.inc('http_requests_total', source=source, status=response.status_code)
+        self.inc('http_response_bytes_total', len(response.content), source=source)
+        self.observe('http_ttfb_seconds', ttfb, source=source)
+        self.observe('http_download_seconds', max(seconds - ttfb, 0.0), source=source)
+        # requests follows redirects, every hop is a round-trip
+        if response.history:
+            self.inc('http_redirects_total', len(response.history), source=source)
+
+    def trace_config(self, source):
+        """
+        Builds an aiohttp TraceConfig recording DNS, connect, time to first byte, bytes and status of every request.
+
+        :param source: str, the fetcher, e.g. kasasagi.
+        :returns: An aiohttp.TraceConfig to pass to ClientSession(trace_configs=[...]).
+        """
+        import aiohttp
+
+        async def on_request_start(session, context, params):
+            context.start = perf_counter()
+            context.dns_start = context.connect_start = None
+
+        async def on_dns_resolvehost_start(session, context, params):
+            context.dns_start = perf_counter()
+
+        async def on_dns_resolvehost_end(session, context, params):
+            self.observe('http_dns_seconds', perf_counter() - context.dns_start, source=source)
+
+        async def on_dns_cache_hit(session, context, params):
+            self.inc('dns_cache_hits_total', source=source)
+
+        async def on_connection_create_start(session, context, params):
+            context.connect_start = perf_counter()
+
+        async def on_connection_create_end(session, context, params):
+            self.observe('http_connect_seconds', perf_counter() - context.connect_start, source=source)
+
+        async def on_connection_reuseconn(session, context, params):
+            self.inc('http_connection_reuses_total', source=source)
+
+        async def on_request_end(session, context, params):
+            self.inc('http_requests_total', source=source, status=params.response.status)
+            self.observe('http_ttfb_seconds', perf_counter() - context.start, source=source)
+            if params.response.content_length:
+                self.inc('http_response_bytes_total', params.response.content_length, source=source)
+
+        async def on_request_redirect(session, context, params):
+            self.inc('http_redirects_total', source=source)
+
+        async def on_request_exception(session, context, params):
+            self.inc('http_errors_total', source=source, error=type(params.exception).__name__)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+        trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_redirect.append(on_request_redirect)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+
+    def to_prometheus(self):
+        """
+        :returns: str, all metrics in the Prometheus text exposition format.
+        """
+        def labels_text(labels):
+            if not labels:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+        lines = []
+        with self.lock:
+            for kind, values in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f'# TYPE {self.prefix}{name} {kind}')
+                    for (metric_name, labels), value in sorted(values.items()):
+                        if metric_name == name:
+                            lines.append(f'{self.prefix}{name}{labels_text(labels)} {value}')
+            for name in sorted({name for name, _ in self.timings}):
+                lines.append(f'# TYPE {self.prefix}{name} summary')
+                for (metric_name, labels), (count, total, maximum) in sorted(self.timings.items()):
+                    if metric_name == name:
+                        lines.append(f'{self.prefix}{name}_count{labels_text(labels)} {count}')
+                        lines.append(f'{self.prefix}{name}_sum{labels_text(labels)} {total:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """
+        :returns: A list of rows (metric, labels, count or value, total seconds, mean seconds, max seconds),
+                  timings sorted by total time first.
+        """
+        rows = []
+        with self.lock:
+            for (name, labels), (count, total, maximum) in sorted(self.timings.items(), key=lambda i: -i[1][1]):
+                rows.append((name, dict(labels), count, total, total / count, maximum))
+            for (name, labels), value in sorted(self.counters.items()):
+                rows.append((name, dict(labels), value, None, None, None))
+            for (name, labels), value in sorted(self.gauges.items()):
+                rows.append((name, dict(labels), value, None, None, None))
+        return rows
+
+    def print_summary(self):
+        for name, labels, count, total, mean, maximum in self.summary():
+            label = ','.join(f'{k}={v}' for k, v in labels.items())
+            if total is None:
+                print(f'{name:<32} {label:<48} {count}')
+            else:
+                print(f'{name:<32} {label:<48} n={count} total={total:.3f}s mean={mean * 1000:.1f}ms '
+                      f'max={maximum * 1000:.1f}ms')
+
+
+def timed_get(session, url, source, registry=None, **kwargs):
+    """
+    session.get(url) recorded in the metrics registry.
+
+    :param session: A requests compatible session (requests, cfscrape, cloudscraper).
+    :param url: The url to get.
+    :param source: str, the fetcher name used as label.
+    :param registry: The Metrics to record in, the module level metrics if None.
+    :returns: The response.
+    """
+    registry = metrics if registry is None else registry
+    start = perf_counter()
+    try:
+        response = session.get(url, **kwargs)
+    except Exception as error:
+        registry.inc('http_errors_total', source=source, error=type(error).__name__)
+        raise
+    registry.record_response(source, response, perf_counter() - start)
+    return response
+
+
+# Registry shared by the scrapers of a process
+metrics = Metrics()
@@ -0,0 +1,150 @@
+import re
+import csv
+import argparse
+from functools import lru_cache
+
+# Compiled once, these run on every scraped page
+CHAPTERS_RE = re.compile(r'(\d+)[ wnl]*(?=chap)')
+VOLUMES_RE = re.compile(r'(\d+)[ wnl]*(?=volu)')
+EPISODES_RE = re.compile(r'(\d+)[ wnl]*(?=epi)')
+NUMBER_RE = re.compile(r'(\d+)')
+DECIMAL_RE = re.compile(r'\d+\.?\d*')
+INTRO_CLEAN_RE = re.compile(r'(\.\.\.\smore>>|\s<<less)')
+
+UNIT_PATTERNS = (('chapters', CHAPTERS_RE), ('volumes', VOLUMES_RE), ('episodes', EPISODES_RE))
+# The raw status text column of the scraper.py catalogs
+RAW_STATUS_COLUMN = 'chapters_original_status'
+
+
+@lru_cache(maxsize=8192)
+def parse_status(text):
+    """
+    Turns a free text chapter status (e.g. '2446 Chapters (Complete)', '5 Volumes + 2 side stories')
+    into structured fields. Chapters are looked for first, then volumes and episodes, then any number.
+    Results are cached, the same status strings come back all the time.
+
+    :param text: str, the status text, None is accepted.
+    :returns: A tuple (count, unit, complete), count is an int or None, unit is 'chapters', 'volumes',
+              'episodes' or None and complete is whether the text says complete.
+    """
+    if text is None:
+        return None, None, None
+    text = text.lower()
+    complete = 'complete' in text
+    for unit, pattern in UNIT_PATTERNS:
+        match = pattern.search(text)
+        if match is not None:
+            return int(match.group(1)), unit, complete
+    match = NUMBER_RE.search(text)
+    if match is not None:
+        return int(match.group(1)), None, complete
+    return None, None, complete
+
+
+def format_status(count, unit):
+    """
+    The chapters_original_current format of NovelScraper: '12 chapters', '3 volumes' or the bare number.
+
+    :param count: int or None.
+    :param unit: str or None.
+    :returns: str or None.
+    """
+    if count is None:
+        return None
+    if unit in ('chapters', 'volumes'):
+        return f'{count} {unit}'
+    return str(count)
+
+
+def parse_frequency(text):
+    """
+    Gets the release frequency, the number of days between releases, e.g. 'Every 2.3 Day(s)'.
+
+    :param text: str, the release frequency text.
+    :returns: A float or None if the text has no number.
+    """
+    if not text:
+        return None
+    match = DECIMAL_RE.search(text)
+    return float(match.group(0)) if match is not None else None
+
+
+def normalize_statuses(values):
+    """
+    Batch version of parse_status for a whole stored column, every distinct value is parsed once.
+    A pandas Series is handled with vectorized str.extract calls instead.
+
+    :param values: A list of status strings (None allowed) or a pandas Series.
+    :returns: A tuple of three lists (or Series): counts, units and complete flags. Missing statuses give None in
+              the three, <NA> for the Int64 counts of a Series.
+    """
+    if hasattr(values, 'str'):
+        return _normalize_series(values)
+    parsed = [parse_status(value if isinstance(value, str) else None) for value in values]
+    if not parsed:
+        return [], [], []
+    counts, units, completes = zip(*parsed)
+    return list(counts), list(units), list(completes)
+
+
+def _normalize_series(series):
+    import pandas as pd
+
+    lower = series.str.lower()
+    counts = lower.str.extract(NUMBER_RE.pattern, expand=False)
+    units = pd.Series(None, index=series.index, dtype=object)
+    # Reverse order so chapters, the first choice, is written last
+    for unit, pattern in reversed(UNIT_PATTERNS):
+        extracted = lower.str.extract(pattern.pattern, expand=False)
+        found = extracted.notna()
+        counts = counts.where(~found, extracted)
+        units = units.where(~found, unit)
+    # Missing statuses are None like in the list version, not False (or NaN) as str.contains gives them
+    missing = lower.isna()
+    units = units.astype(object).where(units.notna(), None)
+    completes = lower.str.contains('complete').astype(object).where(~missing, None)
+    return counts.astype('float').astype('Int64'), units, completes
+
+
+def renormalize_csv(in_file, out_file, column=None):
+    """
+    Re-normalizes the chapter status of a stored catalog without scraping again, rows are streamed one by one.
+    The <column>_count and <column>_unit columns are added. Catalogs written by scraper.py hold the raw status text in
+    chapters_original_status, it is parsed again and chapters_original_current and complete_original are rewritten
+    too. Older catalogs only hold the formatted chapters_original_current, it can only be split into count and unit.
+
+    :param in_file: The path of a csv file written by scraper.py.
+    :param out_file: The path of the csv file to write.
+    :param column: The column holding the status text, chapters_original_status if the file has it,
+                   chapters_original_current otherwise.
+    :returns: The number of rows written.
+    """
+    with open(in_file, newline='', encoding='utf-8') as f_in, \
+            open(out_file, 'w', newline='', encoding='utf-8') as f_out:
+        reader = csv.DictReader(f_in)
+        if column is None:
+            column = RAW_STATUS_COLUMN if RAW_STATUS_COLUMN in reader.fieldnames else 'chapters_original_current'
+        raw = column == RAW_STATUS_COLUMN
+        writer = csv.DictWriter(f_out, reader.fieldnames + [f'{column}_count', f'{column}_unit'])
+        writer.writeheader()
+        rows = 0
+        for row in reader:
+            count, unit, complete = parse_status(row[column] or None)
+            row[f'{column}_count'] = count
+            row[f'{column}_unit'] = unit
+            if raw and row[column]:
+                row['chapters_original_current'] = format_status(count, unit)
+                row['complete_original'] = complete
+            writer.writerow(row)
+            rows += 1
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('in_file', type=str)
+    parser.add_argument('out_file', type=str)
+    parser.add_argument('--column', type=str, default=None,
+                        help='status column, chapters_original_status or else chapters_original_current by default')
+    args = parser.parse_args()
+    print('Rows written:', renormalize_csv(args.in_file, args.out_file, args.column))
@@ -0,0 +1,102 @@
+import os
+import io
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+
+
+class ParseProfiler:
+    """
+    Finds the parse hot spots of a crawl or of a corpus of saved pages.
+
+    The time of every extractor is taken from the parse_seconds timings of a Metrics registry (recorded by the
+    scrapers themselves) and ranked. On top of that every sample_every-th page is parsed under cProfile, so the
+    functions inside the extractors (regexes, soup searches...) show up too. The cProfile stats can be dumped and
+    opened with snakeviz, or turned into a flamegraph with flameprof / gprof2dot.
+
+    :param registry: The Metrics the scrapers record their extractor timings in.
+    :param sample_every: int, one page out of sample_every is run under cProfile.
+    """
+
+    def __init__(self, registry, sample_every=10):
+        self.registry = registry
+        self.sample_every = max(sample_every, 1)
+        self.profile = cProfile.Profile()
+        self.count_lock = threading.Lock()
+        self.profile_lock = threading.Lock()
+        self.pages = 0
+
+    @contextmanager
+    def sample(self):
+        """
+        Wraps the parsing of one page, the page is run under cProfile if it is sampled.
+        Only one page is profiled at a time, pages parsed by other threads meanwhile are not sampled.
+        """
+        with self.count_lock:
+            self.pages += 1
+            sampled = (self.pages - 1) % self.sample_every == 0
+        if sampled and self.profile_lock.acquire(blocking=False):
+            try:
+                self.profile.enable()
+                try:
+                    yield
+                finally:
+                    self.profile.disable()
+            finally:
+                self.profile_lock.release()
+        else:
+            yield
+
+    def extractor_table(self):
+        """
+        :returns: A list of (extractor, calls, total seconds, mean seconds, share of the parse time) tuples,
+                  slowest first.
+        """
+        rows = [(labels.get('extractor', ''), count, total, mean)
+                for name, labels, count, total, mean, _ in self.registry.summary() if name == 'parse_seconds']
+        parse_time = sum(row[2] for row in rows) or 1.0
+        return [(extractor, count, total, mean, total / parse_time) for extractor, count, total, mean in rows]
+
+    def print_report(self, top=20):
+        """
+        Prints the ranked extractor table and the top functions of the sampled cProfile stats.
+
+        :param top: The number of cProfile functions shown.
+        """
+        print(f'Parsed pages: {self.pages}')
+        print(f'{"extractor":<24} {"calls":>8} {"total s":>10} {"mean ms":>10} {"share":>7}')
+        for extractor, count, total, mean, share in self.extractor_table():
+            print(f'{extractor:<24} {count:>8} {total:>10.3f} {mean * 1000:>10.2f} {share:>7.1%}')
+
+        stream = io.StringIO()
+        try:
+            stats = pstats.Stats(self.profile, stream=stream)
+        except TypeError:
+            # No page was sampled
+            return
+        stats.sort_stats('cumulative').print_stats(top)
+        print(stream.getvalue())
+
+    def dump(self, file_name):
+        """
+        Saves the sampled cProfile stats, e.g. for snakeviz or flameprof.
+
+        :param file_name: The path of the .prof file.
+        """
+        self.profile.dump_stats(file_name)
+
+
+def iter_fixtures(directory):
+    """
+    Reads a corpus of saved series pages, files named <novel id>.html.
+
+    :param directory: The directory of the corpus.
+    :returns: A generator of (novel id, page bytes) tuples.
+    """
+    for name in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(name)
+        if extension not in ('.html', '.htm'):
+            continue
+        with open(os.path.join(directory, name), 'rb') as f:
+            yield int(stem) if stem.isdigit() else stem, f.read()
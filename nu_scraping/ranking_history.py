@@ -0,0 +1,84 @@
+import os
+import json
+from datetime import date as dt_date
+
+
+class RankingHistory:
+    """
+    Dated snapshots of the novelupdates series rankings.
+
+    Every snapshot is stored column wise, one small JSON file per ranking and date holding two parallel arrays:
+    {"ranking": "popmonth", "date": "2022-08-01", "id": [...], "rank": [...]}.
+    The rank history of any series is then read from the snapshots instead of scraping every series page
+    (the activity_*_rank fields of NovelScraper.release_info).
+
+    :param directory: The directory the snapshots are stored in, created on the first save.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, ranking, date):
+        return os.path.join(self.directory, f'{ranking}_{date}.json')
+
+    def save_snapshot(self, ranking, entries, date=None):
+        """
+        Saves a ranking snapshot, a snapshot of the same ranking and date is overwritten.
+
+        :param ranking: The ranking name, e.g. popmonth.
+        :param entries: A list of dictionaries with at least the id and rank of a series.
+        :param date: An ISO date string, today if None.
+        :returns: The path of the snapshot file.
+        """
+        date = date or dt_date.today().isoformat()
+        entries = sorted(entries, key=lambda e: e['rank'])
+        snapshot = {
+            'ranking': ranking,
+            'date': date,
+            'id': [int(e['id']) for e in entries],
+            'rank': [int(e['rank']) for e in entries]
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(ranking, date)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        return path
+
+    def dates(self, ranking):
+        """
+        :param ranking: The ranking name.
+        :returns: A sorted list with the dates of the stored snapshots of the ranking.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        prefix = ranking + '_'
+        return sorted(name[len(prefix):-5] for name in os.listdir(self.directory)
+                      if name.startswith(prefix) and name.endswith('.json'))
+
+    def load(self, ranking, date):
+        """
+        :param ranking: The ranking name.
+        :param date: The ISO date of the snapshot.
+        :returns: The snapshot dictionary.
+        """
+        with open(self._path(ranking, date), encoding='utf-8') as f:
+            return json.load(f)
+
+    def rank_history(self, series_id, ranking):
+        """
+        Gets the rank of a series in every stored snapshot of a ranking.
+
+        :param series_id: The id number of the series.
+        :param ranking: The ranking name.
+        :returns: A list of (date, rank) tuples, rank is None if the series was not ranked that day.
+        """
+        series_id = int(series_id)
+        history = []
+        for date in self.dates(ranking):
+            snapshot = self.load(ranking, date)
+            try:
+                rank = snapshot['rank'][snapshot['id'].index(series_id)]
+            except ValueError:
+                rank = None
+            history.append((date, rank))
+        return history
@@ -0,0 +1,174 @@
+import os
+import json
+import argparse
+from time import sleep, time
+from bs4 import BeautifulSoup
+import cfscrape
+from metrics import metrics, timed_get
+from clearance import create_scraper
+from resolver import SeriesResolver
+
+
+class ReleaseFeed:
+    """
+    Tracks new chapter releases of followed series on novelupdates.
+
+    A watermark, the newest release already emitted, is kept per series. Release pages are fetched newest first and
+    only until the watermark shows up, every newer release is appended to the feed file as one JSON line:
+    {"series_id", "chapter", "group", "link", "date", "seen_at"}.
+
+    :param state_file: JSON file holding the watermark of every series.
+    :param feed_file: JSON lines file the release events are appended to.
+    :param scraper: A requests compatible session, a new cfscrape session is created if None.
+    :param delay: The delay between web requests.
+    :param max_pages: The maximum number of release pages fetched for a single series in one poll.
+    :param resolver: Optional SeriesResolver, series whose slug is known are polled from their canonical url without
+                     the ?p= redirect, the slugs of the others are learned from the redirect.
+    """
+
+    SERIES_URL = "https://www.novelupdates.com/?p="
+
+    def __init__(self, state_file, feed_file, scraper=None, delay=0.5, max_pages=5, resolver=None):
+        self.state_file = state_file
+        self.feed_file = feed_file
+        self.scraper = scraper if scraper is not None else create_scraper(cfscrape.create_scraper)
+        self.delay = delay
+        self.max_pages = max_pages
+        self.resolver = resolver
+        self.watermarks = dict()
+        if os.path.exists(state_file):
+            with open(state_file, encoding='utf-8') as f:
+                self.watermarks = json.load(f)
+
+    def poll_all(self, series_ids):
+        """
+        Polls several series. The watermark of a series is saved as soon as its events are appended to the feed, an
+        interrupted poll does not emit them again on the next run.
+
+        :param series_ids: The ids of the followed series.
+        :returns: A list with the new release events of all series.
+        """
+        events = []
+        for series_id in series_ids:
+            events.extend(self.poll(series_id))
+            sleep(self.delay)
+        return events
+
+    def poll(self, series_id, save=True):
+        """
+        Gets the releases of a series newer than its watermark and appends them to the feed.
+        A series polled for the first time only has its first release page emitted, no history scan is done.
+
+        :param series_id: The id number of the series.
+        :param save: Whether to save the watermarks right away.
+        :returns: A list with the new release events, oldest first.
+        """
+        series_id = str(series_id)
+        watermark = self.watermarks.get(series_id)
+
+        url = self.SERIES_URL + series_id
+        if self.resolver is not None:
+            url = self.resolver.url(series_id, url)
+        page = timed_get(self.scraper, url, 'ReleaseFeed')
+        # ?p= redirects to the canonical /series/<slug>/ url, which the release pages hang from
+        series_url = page.url.split('?')[0]
+        if self.resolver is not None:
+            self.resolver.add(series_id, series_url)
+        new_releases = []
+        page_num = 1
+        while True:
+            with metrics.timer('parse_seconds', extractor='parse_releases'):
+                releases = self.parse_releases(BeautifulSoup(page.text, 'html.parser'))
+            reached = False
+            for release in releases:
+                if self.release_key(release) == watermark:
+                    reached = True
+                    break
+                new_releases.append(release)
+            if reached or not releases or watermark is None or page_num >= self.max_pages:
+                break
+            page_num += 1
+            sleep(self.delay)
+            page = timed_get(self.scraper, f'{series_url}?pg={page_num}', 'ReleaseFeed')
+
+        if not new_releases:
+            return []
+
+        seen_at = int(time())
+        events = [dict(series_id=series_id, seen_at=seen_at, **release) for release in reversed(new_releases)]
+        with open(self.feed_file, 'a', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+        self.watermarks[series_id] = self.release_key(new_releases[0])
+        if save:
+            self.save()
+        return events
+
+    def save(self):
+        """
+        Writes the watermarks to the state file, the file is replaced atomically.
+        """
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.watermarks, f)
+        os.replace(tmp_file, self.state_file)
+
+    @staticmethod
+    def release_key(release):
+        """
+        The identity of a release, its link or the group and chapter name when there is no link.
+
+        :param release: A release dictionary returned by parse_releases.
+        :returns: A string.
+        """
+        return release['link'] or f"{release['group']}|{release['chapter']}"
+
+    @staticmethod
+    def parse_releases(soup):
+        """
+        Scrapes the release table (#myTable) of a series page.
+
+        :param soup: A series page or one of its ?pg= release pages.
+        :returns: A list of dictionaries with the date, group, chapter and link of every release, newest first.
+        """
+        table = soup.find('table', attrs={'id': 'myTable'})
+        if table is None:
+            return []
+        releases = []
+        for row in table.find('tbody').find_all('tr'):
+            tds = row.find_all('td')
+            if len(tds) < 3:
+                continue
+            chapters = [a for a in tds[2].find_all('a') if a.get_text(strip=True)]
+            chapter = chapters[-1] if chapters else tds[2].a
+            if chapter is None:
+                continue
+            link = chapter.get('href')
+            if link and link.startswith('//'):
+                link = 'https:' + link
+            releases.append({
+                'chapter': chapter.get_text(strip=True),
+                'group': tds[1].get_text(strip=True) or None,
+                'link': link,
+                'date': tds[0].get_text(strip=True) or None
+            })
+        return releases
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('novel_ids', type=int, nargs='+')
+    parser.add_argument('--state', type=str, default='release_watermarks.json')
+    parser.add_argument('--feed', type=str, default='releases.jsonl')
+    parser.add_argument('--delay', type=float, default=0.5)
+    parser.add_argument('--max_pages', type=int, default=5)
+    parser.add_argument('--resolver', type=str, default=None, help='id <-> slug mapping file, fetch canonical urls')
+    args = parser.parse_args()
+
+    resolver = SeriesResolver(args.resolver) if args.resolver is not None else None
+    feed = ReleaseFeed(args.state, args.feed, delay=args.delay, max_pages=args.max_pages, resolver=resolver)
+    for event in feed.poll_all(args.novel_ids):
+        print(event)
+    if resolver is not None:
+        resolver.save()
@@ -0,0 +1,116 @@
+import os
+import re
+import json
+import threading
+
+SLUG_PATTERN = re.compile(r'/series/([^/?#]+)')
+ID_PATTERN = re.compile(r'[?&]p=(\d+)')
+
+
+class SeriesResolver:
+    """
+    Bidirectional mapping between series ids and slugs, e.g. 1234 <-> 'release-that-witch'.
+
+    A series can be addressed by its ?p=<id> url, which redirects, or by its canonical /series/<slug>/ url. The
+    mapping is filled from every scraped page and listing entry, so later fetches can request the canonical url
+    directly and save the redirect round-trip. The id is the dedupe key shared by all scrapers, see id.
+    Safe to use from several threads.
+
+    :param path: The JSON file the mapping is loaded from and saved to, nothing is persisted if None.
+    :param base_url: The site root of the canonical urls.
+    """
+
+    def __init__(self, path=None, base_url="https://www.novelupdates.com"):
+        self.path = path
+        self.base_url = base_url.rstrip('/')
+        self.lock = threading.Lock()
+        self.slugs = dict()
+        self.ids = dict()
+        if path is not None and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for series_id, slug in json.load(f).items():
+                    self.slugs[int(series_id)] = slug
+                    self.ids[slug] = int(series_id)
+
+    @staticmethod
+    def slug_of(url):
+        """
+        :param url: A series url or a bare slug.
+        :returns: The slug or None if the url is not a series url.
+        """
+        if '/' not in url:
+            return url or None
+        match = SLUG_PATTERN.search(url)
+        return match.group(1) if match is not None else None
+
+    def add(self, series_id, url):
+        """
+        Records a series, a slug that changed replaces the old one.
+
+        :param series_id: The id number of the series.
+        :param url: The canonical url of the series (e.g. the url a ?p= request was redirected to) or its slug.
+        """
+        slug = self.slug_of(url) if url else None
+        if series_id is None or slug is None:
+            return
+        series_id = int(series_id)
+        with self.lock:
+            old_slug = self.slugs.get(series_id)
+            if old_slug == slug:
+                return
+            if old_slug is not None:
+                del self.ids[old_slug]
+            self.slugs[series_id] = slug
+            self.ids[slug] = series_id
+
+    def slug(self, series_id):
+        return self.slugs.get(int(series_id))
+
+    def id(self, ref):
+        """
+        :param ref: A series id, a ?p=<id> url, a series url or a slug.
+        :returns: The id number of the series or None if it is not known.
+        """
+        if isinstance(ref, int):
+            return ref
+        if ref.isdigit():
+            return int(ref)
+        match = ID_PATTERN.search(ref)
+        if match is not None:
+            return int(match.group(1))
+        return self.ids.get(self.slug_of(ref))
+
+    def url(self, series_id, default=None):
+        """
+        :param series_id: The id number of the series.
+        :param default: Returned if the slug of the series is not known yet.
+        :returns: The canonical url of the series.
+        """
+        slug = self.slugs.get(int(series_id))
+        return f'{self.base_url}/series/{slug}/' if slug is not None else default
+
+    def canonical_url(self, url):
+        """
+        :param url: A series url, ?p=<id> urls are replaced by the canonical url when the slug is known.
+        :returns: The url to request.
+        """
+        match = ID_PATTERN.search(url)
+        if match is None:
+            return url
+        return self.url(int(match.group(1)), url)
+
+    def __len__(self):
+        return len(self.slugs)
+
+    def save(self):
+        """
+        Writes the mapping to the JSON file, the file is replaced atomically.
+        """
+        if self.path is None:
+            return
+        with self.lock:
+            mapping = {str(series_id): slug for series_id, slug in self.slugs.items()}
+        tmp_file = self.path + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(mapping, f, ensure_ascii=False)
+        os.replace(tmp_file, self.path)
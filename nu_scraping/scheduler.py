@@ -0,0 +1,174 @@
+import os
+import csv
+import json
+import heapq
+from math import log1p, log2
+from time import time
+
+
+class CrawlScheduler:
+    """
+    Orders crawl work so the series users care about stay fresh first under a fixed request budget.
+
+    The priority of a series is its popularity times the number of releases it probably had since it was last scraped:
+    * popularity: 1 + log(1 + on_reading_lists), boosted by a good activity_week_rank.
+    * expected missed releases: days since the last scrape / release_freq (the days between releases,
+      series without a known frequency are counted as monthly).
+    Series never scraped are counted as a year old. The long tail is refreshed with whatever budget is left.
+    The listing pages read to find the novels are charged to the budget too.
+
+    :param state_file: JSON file with the pool of novels, their popularity and release frequency and the time every
+                       one was last scraped, optional.
+    :param budget_per_hour: The maximum number of pages (series or listing) fetched per hour.
+    """
+
+    NEVER_SCRAPED_DAYS = 365
+    DEFAULT_RELEASE_FREQ = 30.0
+
+    def __init__(self, state_file=None, budget_per_hour=1000):
+        self.state_file = state_file
+        self.budget_per_hour = budget_per_hour
+        self.stats = dict()
+        self.last_scraped = dict()
+        self.window_start = 0.0
+        self.window_used = 0
+        if state_file is not None and os.path.exists(state_file):
+            with open(state_file, encoding='utf-8') as f:
+                state = json.load(f)
+            # State files of older versions have no stats, their pool is found again from the listing
+            self.stats = {int(k): v for k, v in state.get('stats', dict()).items()}
+            self.last_scraped = {int(k): v for k, v in state['last_scraped'].items()}
+            self.window_start = state['window_start']
+            self.window_used = state['window_used']
+
+    def __len__(self):
+        return len(self.stats)
+
+    def add(self, novel_ids):
+        """
+        Adds novels to the pool of work, e.g. the ids from NovelScraper.get_all_novel_ids.
+
+        :param novel_ids: An iterable with novel id numbers.
+        """
+        for novel_id in novel_ids:
+            self.stats.setdefault(int(novel_id), dict())
+
+    def add_pages(self, id_pages, newest_first=False, now=None):
+        """
+        Adds the novels of listing pages to the pool, every page read is charged to the budget of the hour.
+
+        :param id_pages: An iterable with the list of novel ids of every page, consumed lazily, e.g. from
+                         NovelScraper.iter_novel_id_pages.
+        :param newest_first: Boolean, the pages list the newest novels first (NovelScraper.iter_latest_novel_ids),
+                             reading stops at the first page with a novel already in the pool.
+        :param now: The current unix time, time() if None.
+        :returns: The number of novels added.
+        """
+        self.remaining_budget(now)
+        added = 0
+        for novel_ids in id_pages:
+            self.window_used += 1
+            new_ids = [int(novel_id) for novel_id in novel_ids if int(novel_id) not in self.stats]
+            self.add(new_ids)
+            added += len(new_ids)
+            if newest_first and len(new_ids) < len(novel_ids):
+                break
+        return added
+
+    def update(self, record):
+        """
+        Takes the popularity and release frequency of a novel from a scraped record.
+
+        :param record: A dictionary returned by NovelScraper.parse_single_novel or a row of a previous run.
+        """
+        if not record or record.get('id') in (None, ''):
+            return
+        stats = self.stats.setdefault(int(record['id']), dict())
+        for key in ('on_reading_lists', 'activity_week_rank', 'release_freq'):
+            value = record.get(key)
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if value == value:
+                stats[key] = value
+
+    def load_history(self, file_name):
+        """
+        Loads the popularity and release frequency of the novels from the csv file of an earlier run.
+
+        :param file_name: The path of a csv file written by scraper.py.
+        """
+        with open(file_name, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                self.update(row)
+
+    def priority(self, novel_id, now=None):
+        """
+        :param novel_id: The id number of the novel.
+        :param now: The current unix time, time() if None.
+        :returns: A float, higher is scraped first.
+        """
+        now = time() if now is None else now
+        stats = self.stats.get(novel_id, dict())
+
+        popularity = 1 + log1p(stats.get('on_reading_lists', 0))
+        rank = stats.get('activity_week_rank')
+        if rank:
+            popularity *= 1 + 1 / log2(1 + rank)
+
+        last_scraped = self.last_scraped.get(novel_id)
+        staleness = self.NEVER_SCRAPED_DAYS if last_scraped is None else (now - last_scraped) / 86400
+        release_freq = stats.get('release_freq') or self.DEFAULT_RELEASE_FREQ
+        return popularity * staleness / max(release_freq, 0.1)
+
+    def remaining_budget(self, now=None):
+        """
+        :param now: The current unix time, time() if None.
+        :returns: The number of series pages that can still be scraped in the current hour.
+        """
+        now = time() if now is None else now
+        if now - self.window_start >= 3600:
+            self.window_start = now
+            self.window_used = 0
+        return max(self.budget_per_hour - self.window_used, 0)
+
+    def next_batch(self, size=None, now=None):
+        """
+        Takes the most urgent novels that fit in the remaining budget of the hour.
+
+        :param size: The maximum size of the batch, the whole remaining budget if None.
+        :param now: The current unix time, time() if None.
+        :returns: A list with novel ids, most urgent first.
+        """
+        now = time() if now is None else now
+        budget = self.remaining_budget(now)
+        if size is not None:
+            budget = min(budget, size)
+        batch = heapq.nlargest(budget, self.stats, key=lambda novel_id: self.priority(novel_id, now))
+        self.window_used += len(batch)
+        return batch
+
+    def mark_scraped(self, novel_id, now=None):
+        """
+        :param novel_id: The id number of a novel that was just scraped.
+        :param now: The current unix time, time() if None.
+        """
+        self.last_scraped[int(novel_id)] = time() if now is None else now
+
+    def save(self):
+        """
+        Writes the pool with its stats, the last scrape times and the budget window to the state file.
+        """
+        if self.state_file is None:
+            return
+        state = {
+            'stats': self.stats,
+            'last_scraped': self.last_scraped,
+            'window_start': self.window_start,
+            'window_used': self.window_used
+        }
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
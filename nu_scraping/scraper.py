@@ -1,11 +1,18 @@
-import re
 import cfscrape
 import argparse
-import pandas as pd
-import numpy as np
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
-from utils import get_value, str2bool, get_value_str_txt, is_empty, progressbar
+from utils import get_value, str2bool, get_value_str_txt, is_empty, ProgressReporter, RateLimiter
+from vocab import Vocabulary
+from scheduler import CrawlScheduler
+from metrics import metrics, timed_get
+from clearance import create_scraper, is_challenge
+from concurrency import AIMDController
+from profiling import ParseProfiler, iter_fixtures
+from archive import HtmlArchive, reextract
+from sitemap import SitemapDiscovery
+from resolver import SeriesResolver
+from normalize import parse_status, format_status, parse_frequency, DECIMAL_RE
 
 
 class NovelScraper:
@@ -17,57 +24,177 @@ class NovelScraper:
       The url of the series listings. A number is added to the end depending on the wanted tab.
     * NOVEL_SINGLE_URL: http://www.novelupdates.com/?p=
       The url of a single novel, a id number needs to be added to the end for the specific novel.
+    * SITEMAP_URL: https://www.novelupdates.com/sitemap_index.xml
+      The sitemap index the series are discovered from by iter_sitemap_urls.
+    * LATEST_URL: http://www.novelupdates.com/latest-series/?st=1&pg=
+      The listing of the newest series first, a page number is added to the end.
     
     :param debug: Boolean, debug mode. If true, only one page with novels will be parsed (25).
     :param delay: The delay between web requests, used both when obtaining novel ids and for each individual novel.
-                  Affects the speed of the program.
+                  Affects the speed of the program. The delay is shared by all workers.
+    :param vocab: Optional Vocabulary, if given the repeated string fields (see INTERNED_FIELDS) are stored as ids.
+    :param workers: The number of requests that can be in flight at the same time.
+    :param profiler: Optional ParseProfiler, every parsed page is passed through it.
+    :param archive: Optional HtmlArchive, every fetched page is stored in it, see reextract.
+    :param resolver: Optional SeriesResolver, filled from the scraped pages and listings. Novels whose slug is known
+                     are fetched from their canonical url, without the ?p= redirect.
+    :param controller: Optional AIMDController, the requests in flight (series and listing pages) are kept under its
+                       adaptive limit, workers is then only the upper bound.
     """
 
-    def __init__(self, delay=0.5, debug=False):
+    INTERNED_FIELDS = ('original_language', 'authors', 'genres', 'tags', 'original_publisher', 'english_publisher')
+    EXTRACTORS = ('general_info', 'publisher_info', 'chapter_info', 'release_info', 'community_info', 'relation_info')
+
+    def __init__(self, delay=0.5, debug=False, vocab=None, workers=4, profiler=None, archive=None, resolver=None,
+                 controller=None):
         self.delay = delay
+        self.controller = controller
+        self.archive = archive
+        self.resolver = resolver
+        self.profiler = profiler
         self.debug = debug
+        self.vocab = vocab
+        self.workers = workers
+        self.rate_limiter = RateLimiter(delay)
+        self.reporter = None
         self.NOVEL_LIST_URL = "http://www.novelupdates.com/novelslisting/?st=1&pg="
         self.NOVEL_SINGLE_URL = "http://www.novelupdates.com/?p="
-        self.scraper = cfscrape.create_scraper()
+        self.SITEMAP_URL = SitemapDiscovery.SITEMAP_URL
+        self.LATEST_URL = "http://www.novelupdates.com/latest-series/?st=1&pg="
+        self.scraper = create_scraper(cfscrape.create_scraper)
+
+    def fetch(self, url, key=None):
+        """
+        Gets a web page, waiting for the shared rate limit first. Safe to call from several threads.
+        With a controller, also waits for room under its limit and reports the status and time to first byte to it.
+        The page is stored in the archive, if there is one.
 
-    def parse_all_novels(self):
+        :param url: The url of the page.
+        :param key: The novel id of a novel page, pages stored with a key are parsed again by reextract.
+        :returns: The response.
+        """
+        if self.controller is None:
+            self.rate_limiter.wait()
+            page = timed_get(self.scraper, url, 'NovelScraper')
+        else:
+            with self.controller.slot() as observe:
+                self.rate_limiter.wait()
+                page = timed_get(self.scraper, url, 'NovelScraper')
+                observe(page.status_code, page.elapsed.total_seconds(), is_challenge(page))
+        if self.archive is not None and page.status_code == 200:
+            self.archive.put(url, page.content, key)
+        if self.reporter is not None:
+            self.reporter.update(0, nbytes=len(page.content))
+        return page
+
+    def parse_all_novels(self, shallow=False):
         """
         Parses and scrapes information from all novel pages.
+        :param shallow: Boolean, if true only the novels listing pages are scraped, see get_all_novel_listings.
         :returns: A list of dictionaries with all scraped and cleaned information of the novels.
         """
-        novel_ids = self.get_all_novel_ids()
+        if shallow:
+            return self.get_all_novel_listings()
+        # The novel pages are scraped while the remaining listing pages are still being fetched
+        return self.parse_novels(self.iter_novel_ids())
 
-        all_novel_information = []
-        for novel_id in progressbar(novel_ids, prefix="Parsing novels: ", suffix="current novel id: "):
-            info = self.parse_single_novel(novel_id)
-            all_novel_information.append(info)
-            sleep(self.delay)
-        return all_novel_information
+    def parse_novels(self, novel_ids):
+        """
+        Parses and scrapes information from the given novel pages, using the worker threads.
+        Also used as the on_new callback of kasasagi.poll_latest_series to scrape newly added series.
+
+        :param novel_ids: An iterable with novel id numbers, consumed as the ids arrive.
+        :returns: A list of dictionaries with all scraped and cleaned information of the novels.
+        """
+        total = len(novel_ids) if hasattr(novel_ids, '__len__') else None
+        self.reporter = ProgressReporter(prefix="Parsing novels: ", suffix="current novel id: ", total=total)
+
+        def parse(novel_id):
+            try:
+                info = self.parse_single_novel(novel_id)
+            except Exception:
+                self.reporter.update(error=True, item=novel_id)
+                raise
+            self.reporter.update(item=novel_id)
+            return info
+
+        try:
+            with ThreadPoolExecutor(self.workers) as executor:
+                futures = [executor.submit(parse, novel_id) for novel_id in novel_ids]
+                return [future.result() for future in futures]
+        finally:
+            self.reporter.close()
+            self.reporter = None
 
     def parse_single_novel(self, novel_id):
         """
         Parses and scrapes information from a single novel page.
 
-        :param novel_id: The id number of the novel.
+        :param novel_id: The id number of the novel or the url of its series page, e.g. from iter_sitemap_urls.
         :returns: A dictionary with all scraped and cleaned information about the novel.
         """
+        if isinstance(novel_id, str) and novel_id.startswith('http'):
+            page = self.fetch(novel_id, novel_id)
+            # The id is read from the page
+            novel_id = None
+        else:
+            url = self.NOVEL_SINGLE_URL + str(novel_id)
+            if self.resolver is not None:
+                url = self.resolver.url(novel_id, url)
+            page = self.fetch(url, novel_id)
+        if self.profiler is not None:
+            with self.profiler.sample():
+                data = self.parse_novel_page(page.content, novel_id)
+        else:
+            data = self.parse_novel_page(page.content, novel_id)
+        if self.resolver is not None and data:
+            # The url after the ?p= redirect is the canonical one
+            self.resolver.add(data['id'], page.url)
+        return data
 
-        page = self.scraper.get(self.NOVEL_SINGLE_URL + str(novel_id))
-        soup = BeautifulSoup(page.content, 'html.parser')
+    def parse_novel_page(self, html, novel_id=None):
+        """
+        Scrapes the information of a novel from an already downloaded page.
+
+        :param html: The content of the novel page.
+        :param novel_id: The id number of the novel, read from the shortlink of the page if None.
+        :returns: A dictionary with all scraped and cleaned information about the novel.
+        """
+        with metrics.timer('parse_seconds', extractor='soup'):
+            soup = BeautifulSoup(html, 'html.parser')
         content = soup.find('div', attrs={'class': 'w-blog-content'})
         if content is None:
+            metrics.inc('empty_pages_total', source='NovelScraper')
             return dict()
+        if novel_id is None:
+            shortlink = soup.find('link', attrs={'rel': 'shortlink'})
+            novel_id = int(shortlink.get('href').split('p=')[-1]) if shortlink is not None else None
 
         data = {'id': novel_id}
-        data.update(self.general_info(content))
-        data.update(self.publisher_info(content))
-        data.update(self.chapter_info(content))
-        data.update(self.release_info(content))
-        data.update(self.community_info(content))
-        data.update(self.relation_info(content))
+        for extractor in self.EXTRACTORS:
+            with metrics.timer('parse_seconds', extractor=extractor):
+                data.update(getattr(self, extractor)(content))
 
+        if self.vocab is not None:
+            self.vocab.encode(data, self.INTERNED_FIELDS)
         return data
 
+    def reextract(self, processes=None):
+        """
+        Parses every novel page of the archive again with the current extractors, nothing is fetched.
+        The pages are parsed in several processes.
+
+        :param processes: The number of worker processes, the number of CPUs if None.
+        :returns: A list of dictionaries with all scraped and cleaned information of the novels.
+        """
+        novel_info = []
+        for data in reextract(self.archive, parse_archived_page, processes):
+            # Interned in this process, the workers do not share the vocabulary
+            if data and self.vocab is not None:
+                self.vocab.encode(data, self.INTERNED_FIELDS)
+            novel_info.append(data)
+        return novel_info
+
     def get_all_novel_ids(self):
         """
         There is no easy way to get all novel ids (they are not strictly consecutive).
@@ -76,22 +203,116 @@ class NovelScraper:
 
         :returns: A list with the novel ids of all currently listed novels.
         """
+        return list(self.iter_novel_ids())
+
+    def iter_novel_ids(self):
+        """
+        Same as get_all_novel_ids but yields the ids as soon as their listing page arrives.
+        Novels moving between pages during the crawl can be listed twice, duplicated ids are skipped.
+
+        :returns: A generator of novel ids.
+        """
+        seen_ids = set()
+        for novel_ids in self.iter_novel_id_pages():
+            for novel_id in novel_ids:
+                if novel_id not in seen_ids:
+                    seen_ids.add(novel_id)
+                    yield novel_id
+
+    def iter_novel_id_pages(self):
+        """
+        Same as iter_novel_ids but yields the ids of every listing page as one list, duplicates included.
+
+        :returns: A generator of lists of novel ids.
+        """
+        for page in self.get_listing_pages(prefix="Obtaining novel ids: "):
+            yield self.get_page_novel_ids(page)
+
+    def iter_latest_novel_ids(self, max_pages=10):
+        """
+        Reads the latest series listing, newest series first. The pages are fetched one at a time, when the
+        generator is no longer consumed no more pages are requested.
+
+        :param max_pages: The maximum number of pages to read.
+        :returns: A generator with the list of novel ids of every page.
+        """
+        for page_num in range(1, max_pages + 1):
+            novel_ids = self.get_page_novel_ids(self.fetch(self.LATEST_URL + str(page_num)))
+            if not novel_ids:
+                return
+            yield novel_ids
+
+    def get_page_novel_ids(self, page):
+        """
+        Gets the novel ids of a listing page, the resolver (if any) learns the slugs of its novels.
+
+        :param page: One of the pages with novels.
+        :returns: A list with the novel ids of the page.
+        """
+        if self.resolver is not None:
+            with metrics.timer('parse_seconds', extractor='get_listing_info'):
+                return [listing['id'] for listing in self.learn_listings(self.get_listing_info(page))]
+        with metrics.timer('parse_seconds', extractor='get_novel_ids'):
+            return self.get_novel_ids(page)
+
+    def iter_sitemap_urls(self, since=None):
+        """
+        Discovers the series from the sitemaps, a few requests instead of every listing page.
+
+        :param since: An ISO 8601 date, if given only the series modified since then are returned.
+        :returns: A generator of series urls, to pass to parse_novels.
+        """
+        discovery = SitemapDiscovery(self.scraper, self.SITEMAP_URL, self.rate_limiter)
+        for url, lastmod in discovery.iter_series(since):
+            yield url
+
+    def get_all_novel_listings(self):
+        """
+        Shallow crawl, gets the listing level information of all novels from the novels listing pages alone.
+        One request gives the id, name, cover, genres and rating of 25 novels, the series pages are not visited.
+
+        :returns: A list of dictionaries, see get_listing_info.
+        """
+        all_listings = []
+        for page in self.get_listing_pages(prefix="Obtaining novel listings: "):
+            with metrics.timer('parse_seconds', extractor='get_listing_info'):
+                all_listings.extend(self.learn_listings(self.get_listing_info(page)))
+        return all_listings
+
+    def learn_listings(self, listings):
+        """
+        Adds the id and link of every listing entry to the resolver, if there is one.
+
+        :param listings: A list of dictionaries, see get_listing_info.
+        :returns: The listings.
+        """
+        if self.resolver is not None:
+            for listing in listings:
+                self.resolver.add(listing['id'], listing['link'])
+        return listings
+
+    def get_listing_pages(self, prefix=""):
+        """
+        Fetches the novels listing pages concurrently with the worker threads.
+        The first page is fetched alone to get the number of pages and reused, the pages are yielded in order.
+
+        :param prefix: str, the progress bar prefix.
+        :returns: A generator of listing pages.
+        """
+        first_page = self.fetch(self.NOVEL_LIST_URL + '1')
         if self.debug:
             novels_num_pages = 1
             print('Debug run, using 1 page with novels.')
         else:
-            page = self.scraper.get(self.NOVEL_LIST_URL + '1')
-            novels_num_pages = self.get_novel_list_num_pages(page)
+            novels_num_pages = self.get_novel_list_num_pages(first_page)
             print('Full run, pages with novels:', novels_num_pages)
 
-        all_novel_ids = []
-        page_nums = progressbar(range(1, novels_num_pages + 1), prefix="Obtaining novel ids: ", suffix="current page: ")
-        for page_num in page_nums:
-            page = self.scraper.get(self.NOVEL_LIST_URL + str(page_num))
-            novel_ids = self.get_novel_ids(page)
-            all_novel_ids.extend(novel_ids)
-            sleep(self.delay)
-        return all_novel_ids
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures = [executor.submit(self.fetch, self.NOVEL_LIST_URL + str(page_num))
+                       for page_num in range(2, novels_num_pages + 1)]
+            reporter = ProgressReporter(prefix=prefix, suffix="current page: ", total=novels_num_pages)
+            for page_num in reporter.wrap(range(1, novels_num_pages + 1)):
+                yield first_page if page_num == 1 else futures[page_num - 2].result()
 
     @staticmethod
     def get_novel_list_num_pages(page):
@@ -123,6 +344,33 @@ class NovelScraper:
         novel_ids = [int(n) for n in novel_ids]
         return novel_ids
 
+    @staticmethod
+    def get_listing_info(page):
+        """
+        Gets the listing level information of all novels on a page.
+
+        :param page: One of the pages with novels.
+        :returns: A list of dictionaries with the id, name, link, cover, genres and rating of the novels on the page.
+        """
+        soup = BeautifulSoup(page.text, 'html.parser')
+        table = soup.find('div', attrs={'class': 'w-blog-content other'})
+        listings = []
+        for novel in table.find_all('div', attrs={'class': 'search_main_box_nu'}):
+            title = novel.find('div', attrs={'class': 'search_title'})
+            cover = novel.find('img')
+            rating = novel.find('span', attrs={'class': 'search_ratings'})
+            rating = DECIMAL_RE.search(rating.text) if rating is not None else None
+            listings.append({
+                'id': int(title.find('span', attrs={'class': 'rl_icons_en'}).get('id')[3:]),
+                'name': title.a.text.strip(),
+                'link': title.a.get('href'),
+                'cover': cover.get('src') if cover is not None else None,
+                'genres': [genre.text.lower() for genre in
+                           novel.find('div', attrs={'class': 'search_genre'}).find_all('a')],
+                'rating': float(rating.group(0)) if rating else None
+            })
+        return listings
+
     @staticmethod
     def general_info(content):
         """
@@ -179,21 +427,11 @@ class NovelScraper:
         chapter_status = get_value_str_txt(content.find('div', attrs={'id': 'editstatus'}))
 
         if chapter_status is not None:
-            chap_info['complete_original'] = 'complete' in chapter_status.lower()
-            chapter_current = re.search(r'(\d+)[ wnl]*(?=chap)', chapter_status.lower())
-            if chapter_current is not None:
-                chapter_current = chapter_current.group(1).strip() + " chapters"
-            else:
-                # Check if volume
-                chapter_current = re.search(r'(\d+)[ wnl]*(?=volu)', chapter_status.lower())
-                if chapter_current is not None:
-                    chapter_current = chapter_current.group(1).strip() + " volumes"
-                else:
-                    # Get the first number
-                    chapter_current = re.search(r'(\d+)', chapter_status.lower())
-                    if chapter_current is not None:
-                        chapter_current = chapter_current.group(1).strip()
-
+            # The raw text is kept so a stored catalog can be normalized again, see normalize.renormalize_csv
+            chap_info['chapters_original_status'] = chapter_status
+            count, unit, complete = parse_status(chapter_status)
+            chap_info['complete_original'] = complete
+            chapter_current = format_status(count, unit)
             chap_info['chapters_original_current'] = chapter_current if chapter_current != "" else None
         chap_info['complete_translated'] = str2bool(get_value(content.find('div', attrs={'id': 'showtranslated'})))
 
@@ -216,7 +454,7 @@ class NovelScraper:
         activity = content.find_all('span', attrs={'class': 'userrate rank'})
 
         if not is_empty(release_freq):
-            rel_info['release_freq'] = float(re.search(r'\d+\.?\d*', release_freq).group(0))
+            rel_info['release_freq'] = parse_frequency(release_freq)
 
         rel_info['activity_week_rank'] = int(activity[0].string[1:])
         rel_info['activity_month_rank'] = int(activity[1].string[1:])
@@ -270,31 +508,142 @@ class NovelScraper:
                                                    for a in rec_lists.findChildren('a')]
 
         # Return NaN in the cases where nothing is found (and not []).
-        rel_info.update((k, np.nan) for k, v in rel_info.items() if len(v) == 0)
+        rel_info.update((k, float('nan')) for k, v in rel_info.items() if len(v) == 0)
         return rel_info
 
 
+# NovelScraper of a reextract worker process
+_page_parser = None
+
+
+def parse_archived_page(html, novel_id):
+    """
+    NovelScraper.parse_novel_page as a module level function, run by the reextract worker processes.
+    Pages fetched by url are archived with their url as key, their id is read from the page.
+    """
+    global _page_parser
+    if _page_parser is None:
+        _page_parser = NovelScraper(workers=1)
+    return _page_parser.parse_novel_page(html, novel_id if isinstance(novel_id, int) else None)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--debug', type=str2bool, nargs='?', const=True, default=False)
     parser.add_argument('--delay', type=float, default=0.5)
+    parser.add_argument('--workers', type=int, default=4)
     parser.add_argument('--novel_id', type=int, default=-1)
     parser.add_argument('--version_number', type=str, default='0.1.2')
+    parser.add_argument('--intern', type=str2bool, nargs='?', const=True, default=False)
+    parser.add_argument('--shallow', type=str2bool, nargs='?', const=True, default=False)
+    parser.add_argument('--schedule', type=str, default=None, help='crawl scheduler state file')
+    parser.add_argument('--history', type=str, default=None, help='csv file of an earlier run')
+    parser.add_argument('--budget', type=int, default=1000, help='series pages per hour when scheduled')
+    parser.add_argument('--latest', type=str, default=None,
+                        help='scrape the series added since the previous --latest run of this consumer name')
+    parser.add_argument('--latest_pages', type=int, default=10, help='latest series pages read at most by --latest')
+    parser.add_argument('--metrics', type=str, default=None, help='write Prometheus metrics to this file')
+    parser.add_argument('--profile', type=str2bool, nargs='?', const=True, default=False)
+    parser.add_argument('--profile_output', type=str, default='parse.prof', help='sampled cProfile stats file')
+    parser.add_argument('--profile_every', type=int, default=10, help='cProfile one page out of N')
+    parser.add_argument('--fixtures', type=str, default=None, help='parse saved <id>.html pages, no requests')
+    parser.add_argument('--archive', type=str, default=None, help='store the raw fetched pages in this directory')
+    parser.add_argument('--reextract', type=str2bool, nargs='?', const=True, default=False,
+                        help='parse the pages of --archive again, no requests')
+    parser.add_argument('--processes', type=int, default=None, help='reextract worker processes')
+    parser.add_argument('--sitemap', type=str2bool, nargs='?', const=True, default=False,
+                        help='discover the series from the sitemaps instead of the listing pages')
+    parser.add_argument('--sitemap_url', type=str, default=None)
+    parser.add_argument('--since', type=str, default=None, help='with --sitemap, only series modified since this date')
+    parser.add_argument('--resolver', type=str, default=None, help='id <-> slug mapping file, fetch canonical urls')
+    parser.add_argument('--adaptive', type=str2bool, nargs='?', const=True, default=False,
+                        help='adapt the requests in flight (up to --workers) to the latency and errors')
     args = parser.parse_args()
 
-    novel_scraper = NovelScraper(args.delay, args.debug)
-
-    if args.novel_id == -1:
+    vocab = Vocabulary() if args.intern else None
+    profiler = ParseProfiler(metrics, args.profile_every) if args.profile else None
+    archive = HtmlArchive(args.archive) if args.archive is not None else None
+    resolver = SeriesResolver(args.resolver) if args.resolver is not None else None
+    controller = AIMDController('NovelScraper', min(2, args.workers), maximum=args.workers) if args.adaptive else None
+    novel_scraper = NovelScraper(args.delay, args.debug, vocab, args.workers, profiler, archive, resolver, controller)
+
+    if args.sitemap_url is not None:
+        novel_scraper.SITEMAP_URL = args.sitemap_url
+
+    if args.reextract:
+        novel_info = novel_scraper.reextract(args.processes)
+    elif args.sitemap:
+        novel_info = novel_scraper.parse_novels(novel_scraper.iter_sitemap_urls(args.since))
+    elif args.fixtures is not None:
+        novel_info = []
+        for novel_id, html in iter_fixtures(args.fixtures):
+            if profiler is not None:
+                with profiler.sample():
+                    novel_info.append(novel_scraper.parse_novel_page(html, novel_id))
+            else:
+                novel_info.append(novel_scraper.parse_novel_page(html, novel_id))
+    elif args.schedule is not None:
+        # Scrape the most urgent novels that fit in this hour's budget. The pool of novels is kept in the state file,
+        # the whole listing is only read while it is empty, later runs only add the series listed since.
+        scheduler = CrawlScheduler(args.schedule, args.budget)
+        if args.history is not None:
+            scheduler.load_history(args.history)
+        if len(scheduler) == 0:
+            scheduler.add_pages(novel_scraper.iter_novel_id_pages())
+        else:
+            scheduler.add_pages(novel_scraper.iter_latest_novel_ids(), newest_first=True)
+        novel_info = novel_scraper.parse_novels(scheduler.next_batch())
+        for info in novel_info:
+            if info:
+                scheduler.update(info)
+                scheduler.mark_scraped(info['id'])
+        scheduler.save()
+    elif args.latest is not None:
+        # The series added since the previous poll of this consumer, kasasagi keeps its watermark
+        import asyncio
+        from kasasagi import poll_consumer_series
+        novel_info = []
+
+        def scrape_new(novel_ids):
+            novel_info.extend(novel_scraper.parse_novels(novel_ids))
+
+        _, _, truncated = asyncio.run(poll_consumer_series(args.latest, max_pages=args.latest_pages,
+                                                           on_new=scrape_new))
+        if truncated:
+            print(f'The series of the previous run were not reached within {args.latest_pages} pages, the watermark '
+                  f'is kept, run again with a higher --latest_pages.')
+    elif args.novel_id == -1:
         # Scrape all novels
-        novel_info = novel_scraper.parse_all_novels()
+        novel_info = novel_scraper.parse_all_novels(args.shallow)
     else:
         novel_info = [novel_scraper.parse_single_novel(args.novel_id)]
 
+    # pandas is only needed to write the csv, single lookups start without it
+    import pandas as pd
     df = pd.DataFrame(novel_info)
-    if not args.debug:
-        file_name = f'novels_{args.version_number}.csv'
-    else:
+    if args.debug:
         file_name = 'novels_debug.csv'
+    elif args.schedule is not None:
+        file_name = f'novels_{args.version_number}_scheduled.csv'
+    elif args.latest is not None:
+        file_name = f'novels_{args.version_number}_latest.csv'
+    else:
+        file_name = f'novels_{args.version_number}.csv'
 
     # Save to csv file
     df.to_csv(file_name, header=True, index=False)
+    if vocab is not None:
+        # The id <-> string table is needed to decode the interned columns
+        vocab.save(file_name.replace('.csv', '_vocab.json'))
+
+    if archive is not None:
+        archive.close()
+    if resolver is not None:
+        resolver.save()
+    metrics.print_summary()
+    if profiler is not None:
+        profiler.print_report()
+        profiler.dump(args.profile_output)
+    if args.metrics is not None:
+        with open(args.metrics, 'w') as f:
+            f.write(metrics.to_prometheus())
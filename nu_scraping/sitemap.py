@@ -0,0 +1,116 @@
+import gzip
+import argparse
+from xml.etree.ElementTree import iterparse
+import cfscrape
+from metrics import metrics
+from clearance import create_scraper
+
+SITEMAP_NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+
+def _sitemap_tag(element):
+    """Tag of an element of the sitemaps.org namespace (or of no namespace), None for the extensions, e.g. image:loc"""
+    if element.tag.startswith(SITEMAP_NS):
+        return element.tag[len(SITEMAP_NS):]
+    return None if element.tag.startswith('{') else element.tag
+
+
+def iter_sitemap(source):
+    """
+    Reads a sitemap or a sitemap index with a streaming XML parser, every entry is dropped once yielded so the memory
+    use does not grow with the size of the sitemap.
+
+    :param source: A file-like object with the XML.
+    :returns: A generator of (tag, loc, lastmod) tuples, tag is 'url' for pages and 'sitemap' for the sitemaps of an
+              index, lastmod is the ISO 8601 string or None. Only the loc and lastmod children of the entry itself
+              are read, the ones of extensions like <image:image><image:loc> are not.
+    """
+    loc = lastmod = None
+    # Depth below the root, the entries are at depth 1 and their loc and lastmod at depth 2
+    depth = 0
+    context = iterparse(source, events=('start', 'end'))
+    _, root = next(context)
+    for event, element in context:
+        if event == 'start':
+            depth += 1
+            continue
+        depth -= 1
+        tag = _sitemap_tag(element)
+        if depth == 1 and tag == 'loc':
+            loc = (element.text or '').strip()
+        elif depth == 1 and tag == 'lastmod':
+            lastmod = (element.text or '').strip() or None
+        elif depth == 0 and tag in ('url', 'sitemap'):
+            yield tag, loc, lastmod
+            loc = lastmod = None
+            root.clear()
+
+
+class SitemapDiscovery:
+    """
+    Discovers the series of novelupdates from its sitemaps instead of the listing pages, a handful of requests for the
+    whole catalog. The sitemap index is read first, then every sitemap whose url contains sitemap_filter.
+    The sitemaps are streamed, not downloaded whole.
+
+    :param session: A requests compatible session.
+    :param sitemap_url: The url of the sitemap index (or of a single sitemap).
+    :param rate_limiter: An optional utils.RateLimiter waited on before every request.
+    :param sitemap_filter: Only the sitemaps of the index with this in their url are read.
+    :param series_filter: Only the pages with this in their url are yielded.
+    """
+
+    SITEMAP_URL = "https://www.novelupdates.com/sitemap_index.xml"
+
+    def __init__(self, session, sitemap_url=SITEMAP_URL, rate_limiter=None, sitemap_filter='series',
+                 series_filter='/series/'):
+        self.session = session
+        self.sitemap_url = sitemap_url
+        self.rate_limiter = rate_limiter
+        self.sitemap_filter = sitemap_filter
+        self.series_filter = series_filter
+
+    def iter_series(self, since=None):
+        """
+        :param since: An ISO 8601 date or datetime, e.g. '2020-01-31'. If given, only the series modified since then
+                      are yielded, series without lastmod are always yielded.
+        :returns: A generator of (series url, lastmod) tuples.
+        """
+        for url, lastmod in self._iter_pages(self.sitemap_url):
+            if self.series_filter not in url:
+                continue
+            # ISO 8601 strings of the same format sort like the dates they stand for
+            if since is not None and lastmod is not None and lastmod[:len(since)] < since:
+                continue
+            yield url, lastmod
+
+    def _iter_pages(self, sitemap_url):
+        for tag, loc, lastmod in self._iter_entries(sitemap_url):
+            if tag == 'url':
+                yield loc, lastmod
+            elif self.sitemap_filter in loc:
+                yield from self._iter_pages(loc)
+
+    def _iter_entries(self, sitemap_url):
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
+        response = self.session.get(sitemap_url, stream=True)
+        metrics.inc('http_requests_total', source='SitemapDiscovery', status=response.status_code)
+        try:
+            response.raise_for_status()
+            # Let urllib3 undo the transfer encoding (gzip) while streaming
+            response.raw.decode_content = True
+            source = gzip.GzipFile(fileobj=response.raw) if sitemap_url.endswith('.gz') else response.raw
+            yield from iter_sitemap(source)
+        finally:
+            response.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sitemap', type=str, default=SitemapDiscovery.SITEMAP_URL)
+    parser.add_argument('--since', type=str, default=None, help='only series modified since this ISO date')
+    args = parser.parse_args()
+
+    discovery = SitemapDiscovery(create_scraper(cfscrape.create_scraper), args.sitemap)
+    for series_url, series_lastmod in discovery.iter_series(args.since):
+        print(series_url, series_lastmod or '')
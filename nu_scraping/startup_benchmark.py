@@ -0,0 +1,67 @@
+import os
+import sys
+import argparse
+import subprocess
+from time import perf_counter
+
+NU = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'nu.py')
+COMMANDS = (['--help'], ['novel', '--help'], ['finder', '--help'], ['filters', '--help'], ['chapters', '--help'],
+            ['crawl', '--help'])
+# What a single lookup imports and builds before its first request: nu novel and nu finder build a NUScraper and
+# parse the page with bs4, nu chapters imports kasasagi. Run in a new interpreter, the network is not used.
+LOOKUPS = (
+    ('novel/finder lookup', 'import nu; nu.NUScraper(); nu.make_soup("<html></html>")'),
+    ('chapters lookup', 'import nu; nu._kasasagi()'),
+)
+HEAVY_MODULES = ('pandas', 'numpy', 'cloudscraper', 'cfscrape', 'bs4', 'hug', 'aiohttp', 'json2html')
+
+
+def time_command(command, runs):
+    """
+    :returns: The mean and best wall time in seconds of running command in a new interpreter, None if the command
+              fails, an error exit is not a startup time.
+    """
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(perf_counter() - start)
+        if completed.returncode != 0:
+            return None
+    return sum(times) / len(times), min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Startup time of the nu CLI subcommands and of the heavy imports '
+                                                 'they avoid')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    baseline, _ = time_command([sys.executable, '-c', 'pass'], args.runs)
+    print(f'{"command":<28} {"mean ms":>9} {"best ms":>9}')
+    print(f'{"python -c pass":<28} {baseline * 1000:>9.1f}')
+    for command in COMMANDS:
+        timing = time_command([sys.executable, NU] + command, args.runs)
+        if timing is None:
+            print(f'{"nu " + " ".join(command):<28} {"failed":>9}')
+            continue
+        mean, best = timing
+        print(f'{"nu " + " ".join(command):<28} {mean * 1000:>9.1f} {best * 1000:>9.1f}')
+    for name, code in LOOKUPS:
+        code = f'import sys; sys.path.insert(0, {os.path.dirname(NU)!r}); {code}'
+        timing = time_command([sys.executable, '-c', code], args.runs)
+        if timing is None:
+            print(f'{name:<28} {"failed":>9}')
+            continue
+        mean, best = timing
+        print(f'{name:<28} {mean * 1000:>9.1f} {best * 1000:>9.1f}')
+
+    print()
+    print(f'{"import":<28} {"mean ms":>9} {"best ms":>9}')
+    for module in HEAVY_MODULES:
+        check = subprocess.run([sys.executable, '-c', f'import {module}'], stderr=subprocess.DEVNULL)
+        if check.returncode != 0:
+            print(f'{module:<28} {"not installed":>9}')
+            continue
+        mean, best = time_command([sys.executable, '-c', f'import {module}'], args.runs)
+        print(f'{module:<28} {(mean - baseline) * 1000:>9.1f} {(best - baseline) * 1000:>9.1f}')
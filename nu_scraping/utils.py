@@ -1,4 +1,7 @@
 import sys
+import json
+import threading
+from time import monotonic, sleep
 
 
 def get_value(element, check=lambda e: e.string, parse=lambda e: e.string.strip()):
@@ -74,21 +77,156 @@ def str2bool(argument):
 def progressbar(it, size=60, prefix="", suffix=""):
     """
     Adds an progress bar when scraping.
-    :param it: iterable, the list or iterable to run over.
+    Kept for existing callers, see ProgressReporter.
+    :param it: iterable, the list or iterable to run over, generators are supported.
     :param size: int, the total length of the bar.
     :param prefix: str, any prefix to use.
     :param suffix: str, any suffix to use.
     """
-    count = len(it)
+    total = len(it) if hasattr(it, '__len__') else None
+    reporter = ProgressReporter(prefix=prefix, suffix=suffix, total=total, size=size)
+    return reporter.wrap(it)
 
-    def show(j, item):
-        x = int(size*j/count)
-        sys.stdout.write("\r%s[%s%s] %i/%i (%s%s)" % (prefix, "#"*x, "."*(size-x), j, count, suffix, item))
-        sys.stdout.flush()
 
-    sys.stdout.write("\r%s[%s] 0/%i" % (prefix, "."*size, count))
-    for i, item in enumerate(it):
-        yield item
-        show(i+1, item)
-    sys.stdout.write("\n")
-    sys.stdout.flush()
+class ProgressReporter:
+    """
+    Throttled progress and throughput reporting, for bounded or unbounded iterators and concurrent workers.
+
+    update can be called from several threads. The state is rendered at most once every interval seconds:
+    items done, items/sec, bytes/sec, ETA (when the total is known) and the error count.
+    The tty renderer redraws a single line, the json renderer writes one JSON object per line for log collectors.
+
+    :param prefix: str, any prefix to use.
+    :param suffix: str, any suffix to use, followed by the last item.
+    :param total: int, the number of items or None if unknown.
+    :param interval: float, the minimum time in seconds between two renders.
+    :param renderer: 'tty', 'json' or None to pick tty when the stream is a terminal and json otherwise.
+    :param size: int, the length of the tty bar.
+    :param stream: The stream to write to, sys.stdout by default.
+    """
+
+    def __init__(self, prefix="", suffix="", total=None, interval=0.5, renderer=None, size=60, stream=None):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.total = total
+        self.interval = interval
+        self.size = size
+        self.stream = stream if stream is not None else sys.stdout
+        if renderer is None:
+            renderer = 'tty' if self.stream.isatty() else 'json'
+        self.renderer = renderer
+        self.lock = threading.Lock()
+        self.start = monotonic()
+        self.last_render = 0.0
+        self.count = 0
+        self.nbytes = 0
+        self.errors = 0
+        self.item = ""
+
+    def update(self, n=1, nbytes=0, error=False, item=None):
+        """
+        :param n: int, the number of items done.
+        :param nbytes: int, the number of bytes downloaded.
+        :param error: bool, whether the item failed.
+        :param item: the last item, shown after the suffix.
+        """
+        with self.lock:
+            self.count += n
+            self.nbytes += nbytes
+            self.errors += int(error)
+            if item is not None:
+                self.item = item
+            now = monotonic()
+            if now - self.last_render >= self.interval:
+                self.last_render = now
+                self._render(now)
+
+    def wrap(self, it):
+        """
+        Yields the items of an iterable, counting every item once the caller is done with it.
+        """
+        self.update(0)
+        for item in it:
+            yield item
+            self.update(item=item)
+        self.close()
+
+    def close(self):
+        """
+        Renders the final state.
+        """
+        with self.lock:
+            self._render(monotonic(), final=True)
+
+    def stats(self, now=None):
+        """
+        :returns: A dictionary with the current progress and throughput.
+        """
+        elapsed = max((now or monotonic()) - self.start, 1e-9)
+        rate = self.count / elapsed
+        eta = None
+        if self.total is not None and rate > 0:
+            eta = max(self.total - self.count, 0) / rate
+        return {
+            'prefix': self.prefix.strip(' :'),
+            'done': self.count,
+            'total': self.total,
+            'errors': self.errors,
+            'elapsed': round(elapsed, 1),
+            'items_per_sec': round(rate, 2),
+            'bytes_per_sec': round(self.nbytes / elapsed),
+            'eta': None if eta is None else round(eta, 1)
+        }
+
+    def _render(self, now, final=False):
+        stats = self.stats(now)
+        if self.renderer == 'json':
+            stats['final'] = final
+            self.stream.write(json.dumps(stats) + "\n")
+        else:
+            if self.total:
+                x = int(self.size * min(self.count, self.total) / self.total)
+                bar = "[%s%s] %i/%i" % ("#" * x, "." * (self.size - x), self.count, self.total)
+            else:
+                bar = "%i" % self.count
+            eta = "" if stats['eta'] is None else " ETA %s" % format_seconds(stats['eta'])
+            self.stream.write("\r%s%s %.1f it/s %.1f kB/s%s errors %i (%s%s)" % (
+                self.prefix, bar, stats['items_per_sec'], stats['bytes_per_sec'] / 1000, eta, self.errors,
+                self.suffix, self.item))
+            if final:
+                self.stream.write("\n")
+        self.stream.flush()
+
+
+def format_seconds(seconds):
+    """
+    :param seconds: float, a duration.
+    :returns: str, the duration as H:MM:SS.
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%i:%02i:%02i" % (hours, minutes, seconds)
+
+
+class RateLimiter:
+    """
+    Spaces out web requests shared by several threads, at most one request starts every delay seconds.
+
+    :param delay: float, the minimum time in seconds between the start of two requests.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.next_start = 0.0
+
+    def wait(self):
+        """
+        Blocks until the calling thread is allowed to start its request.
+        """
+        with self.lock:
+            now = monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.delay
+        if start > now:
+            sleep(start - now)
@@ -0,0 +1,113 @@
+import json
+import sys
+import threading
+
+
+class Vocabulary:
+    """
+    Symbol table for the small strings repeated across a crawl (genres, tags, authors, publishers...).
+
+    Every distinct value is stored once and mapped to a small integer id, records then only hold the ids.
+    The table is saved next to the scraped output so the ids can be decoded again.
+    Safe to share between the worker threads of a crawl.
+
+    :param values: Optional list of values, the position in the list is used as the id.
+    """
+
+    def __init__(self, values=None):
+        self.values = []
+        self.ids = dict()
+        self.lock = threading.Lock()
+        for value in values or []:
+            self.intern(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def intern(self, value):
+        """
+        Gets the id of a value, adding it to the table if it is not known yet.
+
+        :param value: A string, None is passed through unchanged.
+        :returns: The integer id of the value.
+        """
+        if value is None:
+            return None
+        value_id = self.ids.get(value)
+        if value_id is not None:
+            return value_id
+        # Another thread may add the same value, or another one, between the lookup and the append
+        with self.lock:
+            value_id = self.ids.get(value)
+            if value_id is None:
+                value_id = len(self.values)
+                value = sys.intern(value)
+                self.values.append(value)
+                self.ids[value] = value_id
+        return value_id
+
+    def lookup(self, value_id):
+        """
+        Gets the string of an id.
+
+        :param value_id: An id returned by intern.
+        :returns: The string the id stands for.
+        """
+        if value_id is None:
+            return None
+        return self.values[value_id]
+
+    def encode(self, record, fields):
+        """
+        Replaces the values of the given fields by their ids, in place.
+        Lists are encoded element wise, missing fields and NaN placeholders are left untouched.
+
+        :param record: A dictionary with scraped information.
+        :param fields: The keys to encode.
+        :returns: The same dictionary.
+        """
+        for field in fields:
+            value = record.get(field)
+            if isinstance(value, list):
+                record[field] = [self.intern(v) for v in value]
+            elif isinstance(value, str):
+                record[field] = self.intern(value)
+        return record
+
+    def decode(self, record, fields):
+        """
+        Reverse of encode, replaces the ids of the given fields by their strings, in place.
+
+        :param record: A dictionary encoded with encode.
+        :param fields: The keys to decode.
+        :returns: The same dictionary.
+        """
+        for field in fields:
+            value = record.get(field)
+            if isinstance(value, list):
+                record[field] = [self.lookup(v) for v in value]
+            elif isinstance(value, int) and not isinstance(value, bool):
+                record[field] = self.lookup(value)
+        return record
+
+    def save(self, file_name):
+        """
+        Saves the table as a JSON list, the index of a value is its id.
+
+        :param file_name: The path of the file to write.
+        """
+        with self.lock:
+            values = list(self.values)
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump(values, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, file_name):
+        """
+        Loads a table written by save.
+
+        :param file_name: The path of the file to read.
+        :returns: A Vocabulary.
+        """
+        with open(file_name, encoding='utf-8') as f:
+            return cls(json.load(f))
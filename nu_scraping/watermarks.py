@@ -0,0 +1,45 @@
+import os
+import json
+import threading
+
+
+class WatermarkStore:
+    """
+    Persisted watermarks of incremental pollers, the newest item each consumer has already been given.
+
+    The watermarks are kept per consumer key in one JSON file, so several consumers do not take each other's new
+    items and a restart does not replay them. The file is replaced atomically on every update. Any JSON value can
+    be a watermark, e.g. the snapshots of the synced reading lists (ETag, Last-Modified, digest and novels).
+
+    :param path: The JSON file of the store.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def get(self, key):
+        """
+        :param key: The consumer key.
+        :returns: The watermark of the consumer, None if it never polled.
+        """
+        return self._read().get(key)
+
+    def set(self, key, watermark):
+        with self.lock:
+            watermarks = self._read()
+            watermarks[key] = watermark
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_file = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(watermarks, f)
+            os.replace(tmp_file, self.path)
@@ -1,17 +1,30 @@
+import os
+import sys
+
 import cloudscraper
 from bs4 import BeautifulSoup
 
+# The nu_scraping modules import their siblings as top level modules, imported the same way here as in nu.py
+SCRAPING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nu_scraping")
+if SCRAPING_DIR not in sys.path:
+    sys.path.insert(0, SCRAPING_DIR)
+
+from metrics import metrics, timed_get  # noqa: E402
+from clearance import create_scraper  # noqa: E402
+
 
 class ProcessSeriesFinder:
 
-    def __init__(self):
-        self.scraper = cloudscraper.create_scraper()
+    def __init__(self, resolver=None):
+        self.resolver = resolver
+        self.scraper = create_scraper(cloudscraper.create_scraper)
 
     def get_sf_info(self, url):
-        page = self.scraper.get(url)
+        page = timed_get(self.scraper, url, "ProcessSeriesFinder")
         if page.status_code == 200:
-            soup = BeautifulSoup(page.text, "html.parser")
-            return self._parse_sf_info(soup)
+            with metrics.timer("parse_seconds", extractor="_parse_sf_info"):
+                soup = BeautifulSoup(page.text, "html.parser")
+                return self._parse_sf_info(soup)
 
     def _parse_sf_info(self, soup):
         content = soup.find("div", {"class": "w-blog-content other"})
@@ -20,6 +33,8 @@ class ProcessSeriesFinder:
         for novel in novel_list:
             novel_info = dict()
             novel_info.update(self._get_item(novel))
+            if self.resolver is not None:
+                self.resolver.add(novel_info["id"], novel.find("a").get("href"))
             genre_sect = novel.find("div", attrs={"class": "search_genre"})
             novel_info.update(self._get_genre(genre_sect))
             sf_info.append(novel_info)
@@ -47,18 +62,31 @@ class ProcessSeriesFinder:
 
 
 class ProcessNovel:
-    def __init__(self):
-        self.scraper = cloudscraper.create_scraper()
+    INTERNED_FIELDS = ("language", "genre", "tag", "authors", "artists")
+
+    def __init__(self, vocab=None, resolver=None):
+        self.vocab = vocab
+        self.resolver = resolver
+        self.scraper = create_scraper(cloudscraper.create_scraper)
 
     def get_novel_info(self, url):
-        page = self.scraper.get(url)
+        if self.resolver is not None:
+            url = self.resolver.canonical_url(url)
+        page = timed_get(self.scraper, url, "ProcessNovel")
         if page.status_code == 200:
-            soup = BeautifulSoup(page.text, features="html.parser")
+            with metrics.timer("parse_seconds", extractor="soup"):
+                soup = BeautifulSoup(page.text, features="html.parser")
             content = soup.find("div", attrs={"class": "w-blog-content"})
             novel_info = dict()
-            novel_info.update(self._get_general_info(soup))
-            novel_info.update(self._get_detail_info(content))
-            novel_info.update(self._get_creators_info(content))
+            for extractor, section in ((self._get_general_info, soup), (self._get_detail_info, content),
+                                       (self._get_creators_info, content)):
+                with metrics.timer("parse_seconds", extractor=extractor.__name__):
+                    novel_info.update(extractor(section))
+            if self.resolver is not None:
+                # The shortlink gives the id, the url after any redirect the slug
+                self.resolver.add(novel_info["sid"], page.url)
+            if self.vocab is not None:
+                self.vocab.encode(novel_info, self.INTERNED_FIELDS)
             return novel_info
         else:
             return dict()
@@ -133,14 +161,15 @@ class ProcessFilter:
     def __init__(self):
         self.SERIES_FINDER = "https://www.novelupdates.com/series-finder/"
         self.filters = list()
-        self.scraper = cloudscraper.create_scraper()
+        self.scraper = create_scraper(cloudscraper.create_scraper)
         self.updateFilter()
 
     def updateFilter(self):
-        page = self.scraper.get(self.SERIES_FINDER)
+        page = timed_get(self.scraper, self.SERIES_FINDER, "ProcessFilter")
         if page.status_code == 200:
-            soup = BeautifulSoup(page.content, "html.parser")
-            self._parseFilter(soup)
+            with metrics.timer("parse_seconds", extractor="_parseFilter"):
+                soup = BeautifulSoup(page.content, "html.parser")
+                self._parseFilter(soup)
 
     def _parseFilter(self, soup):
         filter_list = dict()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The nu_scraping modules import their siblings as top level modules, the tests import them the same way
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'nu_scraping'))
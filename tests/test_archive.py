@@ -0,0 +1,63 @@
+from archive import HtmlArchive, reextract
+
+
+def parse_title(html, key):
+    """Module level so the reextract worker processes can unpickle it"""
+    return key, html.decode('utf-8')
+
+
+def test_pages_round_trip_across_reopens(tmp_path):
+    directory = str(tmp_path / 'archive')
+    archive = HtmlArchive(directory)
+    archive.put('https://www.novelupdates.com/?p=1', b'<html>one</html>', key=1)
+    archive.put('https://www.novelupdates.com/?p=2', '<html>два</html>'.encode('utf-8'), key=2)
+    archive.close()
+
+    archive = HtmlArchive(directory)
+    assert archive.get('https://www.novelupdates.com/?p=1') == b'<html>one</html>'
+    assert archive.get('https://www.novelupdates.com/?p=2').decode('utf-8') == '<html>два</html>'
+    assert archive.get('https://www.novelupdates.com/?p=3') is None
+    assert len(archive) == 2
+    archive.close()
+
+
+def test_newest_page_of_a_url_wins(tmp_path):
+    archive = HtmlArchive(str(tmp_path))
+    archive.put('https://www.novelupdates.com/?p=1', b'old', key=1)
+    archive.put('https://www.novelupdates.com/?p=1', b'new', key=1)
+    assert archive.get('https://www.novelupdates.com/?p=1') == b'new'
+    assert len(archive.entries()) == 1
+    archive.close()
+
+
+def test_segments_roll_over_and_stay_readable(tmp_path):
+    archive = HtmlArchive(str(tmp_path), segment_size=64)
+    for num in range(5):
+        archive.put(f'https://www.novelupdates.com/?p={num}', f'page {num}'.encode('utf-8') * 20, key=num)
+    assert len({entry['segment'] for entry in archive.entries()}) > 1
+    assert all(archive.get(f'https://www.novelupdates.com/?p={num}') == f'page {num}'.encode('utf-8') * 20
+               for num in range(5))
+    archive.close()
+
+
+def test_reextract_runs_over_the_keyed_pages(tmp_path):
+    archive = HtmlArchive(str(tmp_path))
+    archive.put('https://www.novelupdates.com/?p=1', b'one', key=1)
+    archive.put('https://www.novelupdates.com/series-ranking/', b'ranking')
+    archive.put('https://www.novelupdates.com/?p=2', b'two', key=2)
+    assert [entry['key'] for entry in archive.entries(keyed=False)] == [1, None, 2]
+    assert list(reextract(archive, parse_title, processes=2)) == [(1, 'one'), (2, 'two')]
+    archive.close()
+
+
+def test_keyed_entries_keep_the_newest_page_of_every_key(tmp_path):
+    archive = HtmlArchive(str(tmp_path))
+    archive.put('https://www.novelupdates.com/?p=1', b'redirected', key=1, fetched_at=200)
+    archive.put('https://www.novelupdates.com/series/one/', b'canonical', key=1, fetched_at=300)
+    archive.put('https://www.novelupdates.com/?p=2', b'newer', key=2, fetched_at=500)
+    archive.put('https://www.novelupdates.com/series/two/', b'older', key=2, fetched_at=400)
+    assert [entry['url'] for entry in archive.entries()] == ['https://www.novelupdates.com/series/one/',
+                                                            'https://www.novelupdates.com/?p=2']
+    assert len(archive.entries(keyed=False)) == 4
+    assert list(reextract(archive, parse_title, processes=1)) == [(1, 'canonical'), (2, 'newer')]
+    archive.close()
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+import cache
+from cache import SingleFlightCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache, 'monotonic', lambda: now[0])
+    return now
+
+
+class Upstream:
+    """Counts the fetches, each one returns the next number after a yield to the event loop"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def fetch(self):
+        self.calls += 1
+        calls = self.calls
+        await asyncio.sleep(0)
+        return calls
+
+
+def test_concurrent_calls_share_one_fetch(clock):
+    async def run():
+        upstream = Upstream()
+        results_cache = SingleFlightCache('test', ttl=10)
+        results = await asyncio.gather(*[results_cache.get('key', upstream.fetch) for _ in range(5)])
+        return results, upstream.calls
+
+    assert asyncio.run(run()) == ([1] * 5, 1)
+
+
+def test_expired_result_is_served_stale_while_refreshed(clock):
+    async def run():
+        upstream = Upstream()
+        results_cache = SingleFlightCache('test', ttl=10, stale_ttl=20)
+        assert await results_cache.get('key', upstream.fetch) == 1
+        clock[0] += 5
+        assert await results_cache.get('key', upstream.fetch) == 1
+        clock[0] += 10
+        # Stale, returned right away and refreshed in the background
+        assert await results_cache.get('key', upstream.fetch) == 1
+        await asyncio.sleep(0.01)
+        assert await results_cache.get('key', upstream.fetch) == 2
+        clock[0] += 100
+        # Past the stale window, fetched again
+        assert await results_cache.get('key', upstream.fetch) == 3
+
+    asyncio.run(run())
+
+
+def test_exceptions_are_not_cached(clock):
+    async def run():
+        results_cache = SingleFlightCache('test')
+
+        async def failing():
+            raise ValueError('upstream down')
+
+        with pytest.raises(ValueError):
+            await results_cache.get('key', failing)
+        assert await results_cache.get('key', Upstream().fetch) == 1
+
+    asyncio.run(run())
+
+
+def test_least_recently_used_results_are_dropped(clock):
+    async def run():
+        results_cache = SingleFlightCache('test', maxsize=2)
+        for key in ('a', 'b'):
+            await results_cache.get(key, Upstream().fetch)
+        await results_cache.get('a', Upstream().fetch)
+        await results_cache.get('c', Upstream().fetch)
+        return list(results_cache.entries)
+
+    assert asyncio.run(run()) == ['a', 'c']
+
+
+def test_invalidate(clock):
+    async def run():
+        upstream = Upstream()
+        results_cache = SingleFlightCache('test')
+        await results_cache.get('key', upstream.fetch)
+        results_cache.invalidate('key')
+        return await results_cache.get('key', upstream.fetch)
+
+    assert asyncio.run(run()) == 2
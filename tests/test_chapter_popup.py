@@ -0,0 +1,110 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import kasasagi
+
+PAGES = 3
+ROWS = 20
+CHAPTERS = 150
+
+
+def series_page(pages):
+    return (f'<html><head><link rel="shortlink" href="http://localhost/?p=1"/></head><body>'
+            f'<div class="seriestitlenu">Popup Test</div>'
+            f'<div class="digg_pagination"><span class="gap">...</span><a href="?pg={pages}">{pages}</a></div>'
+            f'</body></html>')
+
+
+def chapter_page(rows):
+    body = ''.join(f'<tr><td>01/01/20</td><td><a href="http://www.novelupdates.com/group/group-{i}/">Group {i}</a>'
+                   f'</td><td><a class="chp-release" href="#">c{i}</a><a class="chp-release" href="/c/{i}/">c{i}</a>'
+                   f'</td></tr>' for i in range(rows))
+    return f'<html><body><table id="myTable"><tbody>{body}</tbody></table></body></html>'
+
+
+def popup_fragment(chapters):
+    """admin-ajax chapter list fragment, an icon link then the chapter link of every release"""
+    items = ''.join(f'<li class="sp_li_chp"><a href="//www.novelupdates.com/nu_goto_chapter.php?rid={i}"><i></i></a>'
+                    f'<a href="//www.novelupdates.com/extnu/{i}/"><span title="c{i}">c{i}</span></a></li>'
+                    for i in range(chapters))
+    return f'<ol class="sp_chp">{items}</ol>'
+
+
+def stand_in_app(state, counts):
+    """
+    Local stand-in for the series page, the release tables and the admin-ajax chapter popup of novelupdates.
+    The popup answers according to state['popup']: 'ok', 'error' (500) or 'broken' (a fragment the parser fails on).
+    Every request is counted by kind.
+    """
+    async def series(request):
+        if 'pg' in request.query:
+            counts['pages'] += 1
+            return web.Response(text=chapter_page(ROWS), content_type='text/html')
+        counts['series'] += 1
+        return web.Response(text=series_page(PAGES), content_type='text/html')
+
+    async def ajax(request):
+        counts['ajax'] += 1
+        data = await request.post()
+        if data.get('action') != 'nd_getchapters' or data.get('mypostid') != '1':
+            return web.Response(status=400)
+        if state['popup'] == 'error':
+            return web.Response(status=500)
+        if state['popup'] == 'broken':
+            return web.Response(text='<li class="sp_li_chp"><a>c1</a></li>', content_type='text/html')
+        return web.Response(text=popup_fragment(CHAPTERS), content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/series/{slug}/', series)
+    app.router.add_post('/wp-admin/admin-ajax.php', ajax)
+    return app
+
+
+@pytest.fixture
+def scrape(monkeypatch):
+    """fetch_all_chapters of a series of the stand-in, returns the result and the requests made by kind"""
+    kasasagi.set_parse_pool(0)
+
+    def scrape(mode, popup='ok'):
+        state = {'popup': popup}
+        counts = {'series': 0, 'pages': 0, 'ajax': 0}
+
+        async def run():
+            server = TestServer(stand_in_app(state, counts))
+            await server.start_server()
+            base_url = str(server.make_url('')).rstrip('/')
+            monkeypatch.setattr(kasasagi, 'series_base_url', base_url)
+            monkeypatch.setattr(kasasagi, 'ajax_url', f'{base_url}/wp-admin/admin-ajax.php')
+            try:
+                async with aiohttp.ClientSession() as client:
+                    return await kasasagi.fetch_all_chapters(f'{base_url}/series/popup-test/', mode, client)
+            finally:
+                await server.close()
+
+        return asyncio.run(run()), counts
+
+    return scrape
+
+
+def test_ajax_mode_lists_the_popup_chapters(scrape):
+    result, counts = scrape('ajax')
+    assert result['chapter_count'] == CHAPTERS
+    assert result['chapters'][0]['chapter_name'] == 'c0'
+    assert counts == {'series': 1, 'pages': 0, 'ajax': 1}
+
+
+@pytest.mark.parametrize('popup', ['error', 'broken'])
+def test_failed_popup_falls_back_to_the_release_tables(scrape, popup):
+    result, counts = scrape('ajax', popup)
+    assert result['chapter_count'] == PAGES * ROWS
+    assert counts['pages'] == PAGES
+
+
+def test_pages_mode_does_not_use_the_popup(scrape):
+    result, counts = scrape('pages')
+    assert result['chapter_count'] == PAGES * ROWS
+    assert counts['ajax'] == 0
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+import pytest
+
+import concurrency
+from concurrency import AIMDController
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(concurrency, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_healthy_responses_raise_the_limit_up_to_the_maximum(clock):
+    controller = AIMDController('test', initial=2, maximum=4)
+    controller.observe(status=200, latency=0.1)
+    assert controller.limit == 2.5
+    for _ in range(20):
+        controller.observe(status=200, latency=0.1)
+    assert controller.limit == 4
+
+
+@pytest.mark.parametrize('outcome', [{'status': 429}, {'status': 503}, {'challenge': True}, {'error': True}])
+def test_congestion_halves_the_limit_once_per_cooldown(clock, outcome):
+    controller = AIMDController('test', initial=8, maximum=8, cooldown=2.0)
+    controller.observe(**outcome)
+    assert controller.limit == 4
+    controller.observe(**outcome)
+    assert controller.limit == 4
+    clock[0] += 2
+    controller.observe(**outcome)
+    assert controller.limit == 2
+
+
+def test_slow_first_byte_counts_as_congestion(clock):
+    controller = AIMDController('test', initial=4, maximum=8, latency_floor=0.5)
+    controller.observe(status=200, latency=0.4)
+    limit = controller.limit
+    # Slower than the average but under the floor
+    controller.observe(status=200, latency=0.45)
+    assert controller.limit > limit
+    controller.observe(status=200, latency=2.0)
+    assert controller.limit < limit
+
+
+def test_limit_never_goes_below_the_minimum(clock):
+    controller = AIMDController('test', initial=2, minimum=1)
+    for _ in range(5):
+        clock[0] += 10
+        controller.observe(status=500)
+    assert controller.limit == 1
+
+
+def test_slot_bounds_the_threads_in_flight():
+    controller = AIMDController('test', initial=2, maximum=2)
+    in_flight, worst = [0], [0]
+    lock = threading.Lock()
+
+    def request():
+        with controller.slot() as observe:
+            with lock:
+                in_flight[0] += 1
+                worst[0] = max(worst[0], in_flight[0])
+            threading.Event().wait(0.01)
+            with lock:
+                in_flight[0] -= 1
+            observe(status=200)
+
+    threads = [threading.Thread(target=request) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert worst[0] == 2
+    assert controller.in_flight == 0
+
+
+def test_async_slot_counts_an_exception_as_error(clock):
+    controller = AIMDController('test', initial=4, maximum=4)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            async with controller.async_slot():
+                raise RuntimeError('connection reset')
+
+    asyncio.run(run())
+    assert controller.limit == 2
+    assert controller.in_flight == 0
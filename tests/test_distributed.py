@@ -0,0 +1,155 @@
+import json
+import threading
+import multiprocessing
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from distributed import SQLiteLeaseQueue, JSONLinesSink, make_shards, run_coordinator, run_worker, make_scraper, \
+    _worker_process
+
+NOVELS = 120
+PER_PAGE = 25
+SHARD_SIZE = 25
+TTL = 2
+
+
+def novel_ids(count):
+    """Listed ids of the stand-in, not consecutive like the real ones"""
+    return [1000 + 3 * num for num in range(count)]
+
+
+def listing_page(ids, pages):
+    novels = ''.join(f'<div class="search_main_box_nu"><div class="search_title"><a href="/series/novel-{i}/">'
+                     f'Novel {i}</a><span class="rl_icons_en" id="sid{i}"></span></div>'
+                     f'<div class="search_genre"><a>Action</a></div></div>' for i in ids)
+    pagination = ''.join(f'<a href="?pg={num}">{num}</a>' for num in range(1, pages + 1))
+    return (f'<html><body><div class="w-blog-content other">{novels}</div>'
+            f'<div class="digg_pagination">{pagination}</div></body></html>')
+
+
+def novel_page(novel_id):
+    ranks = ''.join(f'<span class="userrate rank">#{rank}</span>' for rank in range(1, 6))
+    return (f'<html><head><link rel="shortlink" href="http://localhost/?p={novel_id}"/></head><body>'
+            f'<div class="w-blog-content"><div class="seriestitlenu">Novel {novel_id}</div>'
+            f'<div id="editassociated">N/A</div><div id="showlang"><a>Chinese</a></div>'
+            f'<div id="showauthors"><a>Author {novel_id % 7}</a></div>'
+            f'<div id="seriesgenre"><a class="genre">Action</a></div><div id="showtags"><a>Tag</a></div>'
+            f'<div id="edityear">2020</div><div id="showlicensed">No</div>'
+            f'<div id="showopublisher"><a>Qidian</a></div><div id="showepublisher">N/A</div>'
+            f'<div id="editstatus">100 Chapters (Completed)</div><div id="showtranslated">No</div>'
+            f'<h5 class="seriesother">Release Frequency</h5>Every 2 Day(s)'
+            f'{ranks}<b class="rlist">42</b><span class="uvotes">(4.2 / 5.0, 100 votes)</span>'
+            f'<div class="two-thirds"><div class="wpb_wrapper"></div></div></div></body></html>')
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    """Local stand-in for the novels listing and series pages of novelupdates, in a thread"""
+    ids = novel_ids(NOVELS)
+    pages = -(-NOVELS // PER_PAGE)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path.startswith('/novelslisting/'):
+                page = int(query['pg'][0])
+                body = listing_page(ids[(page - 1) * PER_PAGE:page * PER_PAGE], pages)
+            elif 'p' in query and int(query['p'][0]) in ids:
+                body = novel_page(int(query['p'][0]))
+            else:
+                self.send_error(404)
+                return
+            body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('localhost', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://localhost:{server.server_port}'
+    server.shutdown()
+
+
+class FakeScraper:
+    """parse_single_novel of a NovelScraper, raising for the failing ids"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+
+    def parse_single_novel(self, novel_id):
+        if novel_id in self.failing:
+            raise ValueError(f'broken page {novel_id}')
+        return {'id': novel_id, 'name': f'Novel {novel_id}', 'release_freq': float('nan')}
+
+
+def test_make_shards_depend_on_the_ids_only():
+    shards = make_shards([52, 3, 27, 3, 26], 25)
+    assert shards == [(0, [3]), (1, [26, 27]), (2, [52])]
+    assert make_shards([26, 52, 27, 3], 25) == shards
+
+
+def test_coordinator_is_idempotent(base_url, tmp_path):
+    queue = SQLiteLeaseQueue(str(tmp_path / 'queue.db'))
+    num_shards = run_coordinator(queue, make_scraper(base_url, 0), SHARD_SIZE)
+    assert num_shards == len(make_shards(novel_ids(NOVELS), SHARD_SIZE))
+    assert run_coordinator(queue, make_scraper(base_url, 0), SHARD_SIZE) == 0
+    assert run_coordinator(queue, make_scraper(base_url, 0), SHARD_SIZE, reset=True) == num_shards
+
+
+def test_worker_records_failures_and_completes_the_shard(tmp_path):
+    queue = SQLiteLeaseQueue(str(tmp_path / 'queue.db'))
+    queue.add_shards(make_shards(range(10), 5))
+    sink = JSONLinesSink(str(tmp_path / 'novels.jsonl'))
+
+    assert run_worker(queue, sink, FakeScraper(failing=[2, 7]), 'worker', ttl=TTL, poll_interval=0) == 8
+    assert queue.remaining() == 0
+    assert sorted(record['id'] for record in sink.read()) == [0, 1, 3, 4, 5, 6, 8, 9]
+    assert [(error['id'], error['error']) for error in sink.failed()] == \
+        [(2, 'ValueError: broken page 2'), (7, 'ValueError: broken page 7')]
+
+
+def test_sink_writes_nan_as_null(tmp_path):
+    sink = JSONLinesSink(str(tmp_path / 'novels.jsonl'))
+    sink.write({'id': 1, 'release_freq': float('nan'), 'ranks': [1.0, float('nan')]})
+    with open(sink.path, encoding='utf-8') as f:
+        assert json.loads(f.readline()) == {'id': 1, 'release_freq': None, 'ranks': [1.0, None]}
+
+
+def test_scraped_later_is_not_failed(tmp_path):
+    sink = JSONLinesSink(str(tmp_path / 'novels.jsonl'))
+    sink.write({'id': 1, 'error': 'ValueError: broken page 1'})
+    sink.write({'id': 1, 'name': 'Novel 1'})
+    sink.write({'id': 2, 'name': 'Novel 2'})
+    sink.write({'id': 2, 'error': 'ValueError: broken page 2'})
+    assert sink.failed() == []
+    assert sorted(record['id'] for record in sink.read()) == [1, 2]
+
+
+def test_workers_take_over_an_expired_lease(base_url, tmp_path):
+    queue_path, sink_path = str(tmp_path / 'queue.db'), str(tmp_path / 'novels.jsonl')
+    queue = SQLiteLeaseQueue(queue_path)
+    run_coordinator(queue, make_scraper(base_url, 0), SHARD_SIZE)
+    # A worker that dies right after its claim, the lease must expire and the shard go to another worker
+    assert queue.claim('dead-worker', TTL) is not None
+
+    processes = [multiprocessing.Process(target=_worker_process,
+                                         args=(queue_path, sink_path, base_url, 0, num, TTL, 0.2))
+                 for num in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+
+    assert all(process.exitcode == 0 for process in processes)
+    assert queue.remaining() == 0
+    records = JSONLinesSink(sink_path).read()
+    assert sorted(record['id'] for record in records) == novel_ids(NOVELS)
+    assert all(record['name'] == f"Novel {record['id']}" for record in records)
@@ -0,0 +1,44 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import kasasagi
+from resolver import SeriesResolver
+
+SERIES_PAGE = ('<html><head><link rel="shortlink" href="http://localhost/?p=7"/></head><body>'
+               '<div class="seriestitlenu">Seven</div></body></html>')
+
+
+def test_series_are_fetched_from_their_canonical_url_once_known(monkeypatch, tmp_path):
+    kasasagi.set_parse_pool(0)
+    requested = []
+
+    async def root(request):
+        requested.append(request.path_qs)
+        raise web.HTTPFound("/series/seven/")
+
+    async def series(request):
+        requested.append(request.path_qs)
+        return web.Response(text=SERIES_PAGE, content_type='text/html')
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/', root)
+        app.router.add_get('/series/seven/', series)
+        server = TestServer(app)
+        await server.start_server()
+        base_url = str(server.make_url('')).rstrip('/')
+        monkeypatch.setattr(kasasagi, 'series_base_url', base_url)
+        monkeypatch.setattr(kasasagi, 'series_resolver', SeriesResolver(str(tmp_path / 'slugs.json'), base_url))
+        try:
+            async with aiohttp.ClientSession() as client:
+                return [await kasasagi.fetch_series(client, 7) for _ in range(2)]
+        finally:
+            await server.close()
+
+    first, second = asyncio.run(run())
+    assert first == second and first['id'] == 7 and first['title'] == 'Seven'
+    assert requested == ['/?p=7', '/series/seven/', '/series/seven/']
+    assert SeriesResolver(str(tmp_path / 'slugs.json')).slug(7) == 'seven'
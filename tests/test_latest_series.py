@@ -0,0 +1,88 @@
+import asyncio
+import threading
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import kasasagi
+
+PER_PAGE = 25
+
+
+def latest_page(ids):
+    return ''.join(f'<div class="search_main_box_nu"><div class="search_title"><a href="/series/novel-{i}/">'
+                   f'Novel {i}</a><span class="rl_icons_en" id="sid{i}"></span></div></div>' for i in ids)
+
+
+@pytest.fixture
+def poll(monkeypatch):
+    """poll_latest_series against a stand-in listing the series 1000 down to 1, newest first"""
+    kasasagi.set_parse_pool(0)
+    ids = list(range(1000, 0, -1))
+    requested = []
+
+    async def latest(request):
+        page = int(request.query['pg'])
+        requested.append(page)
+        return web.Response(text=latest_page(ids[(page - 1) * PER_PAGE:page * PER_PAGE]), content_type='text/html')
+
+    def poll(watermark=None, max_pages=10, on_new=None):
+        requested.clear()
+
+        async def run():
+            app = web.Application()
+            app.router.add_get('/latest-series/', latest)
+            server = TestServer(app)
+            await server.start_server()
+            monkeypatch.setattr(kasasagi, 'series_base_url', str(server.make_url('')).rstrip('/'))
+            try:
+                async with aiohttp.ClientSession() as client:
+                    return await kasasagi.poll_latest_series(client, watermark, max_pages, on_new)
+            finally:
+                await server.close()
+
+        return asyncio.run(run()), list(requested)
+
+    return poll
+
+
+def test_first_poll_reads_one_page(poll):
+    (new_series, watermark, truncated), requested = poll()
+    assert len(new_series) == PER_PAGE and watermark == 1000 and not truncated
+    assert requested == [1]
+
+
+def test_poll_stops_at_the_watermark(poll):
+    (new_series, watermark, truncated), requested = poll(watermark=940)
+    assert [entry['id'] for entry in new_series] == list(range(1000, 940, -1))
+    assert watermark == 1000 and not truncated
+    assert requested == [1, 2, 3]
+
+
+def test_truncated_poll_keeps_the_watermark(poll):
+    (new_series, watermark, truncated), requested = poll(watermark=900, max_pages=2)
+    assert len(new_series) == 2 * PER_PAGE
+    assert watermark == 900 and truncated
+
+
+def test_blocking_on_new_runs_off_the_event_loop(poll):
+    calls = []
+
+    def on_new(novel_ids):
+        calls.append((novel_ids, threading.current_thread() is threading.main_thread()))
+
+    poll(watermark=995, on_new=on_new)
+    assert calls == [([1000, 999, 998, 997, 996], False)]
+
+
+def test_coroutine_on_new_is_awaited(poll):
+    calls = []
+
+    async def on_new(novel_ids):
+        await asyncio.sleep(0)
+        calls.append(novel_ids)
+
+    poll(watermark=998, on_new=on_new)
+    assert calls == [[1000, 999]]
@@ -0,0 +1,80 @@
+import csv
+
+import pandas as pd
+import pytest
+
+from normalize import parse_status, format_status, parse_frequency, normalize_statuses, renormalize_csv
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2446 Chapters (Complete)', (2446, 'chapters', True)),
+    ('5 Volumes + 2 side stories', (5, 'volumes', False)),
+    ('12 wn chapters ongoing', (12, 'chapters', False)),
+    ('24 Episodes', (24, 'episodes', False)),
+    ('3 Volumes (120 Chapters)', (120, 'chapters', False)),
+    ('Ongoing, 88', (88, None, False)),
+    ('Completed', (None, None, True)),
+    # Episodes are a unit of their own, the first number was taken before
+    ('Season 2, 13 Episodes', (13, 'episodes', False)),
+    ('007 chapters', (7, 'chapters', False)),
+    (None, (None, None, None)),
+])
+def test_parse_status(text, expected):
+    assert parse_status(text) == expected
+
+
+def test_format_status():
+    assert format_status(12, 'chapters') == '12 chapters'
+    assert format_status(3, 'volumes') == '3 volumes'
+    assert format_status(24, 'episodes') == '24'
+    assert format_status(None, 'chapters') is None
+
+
+def test_parse_frequency():
+    assert parse_frequency('Every 2.3 Day(s)') == 2.3
+    assert parse_frequency('Every 7 Day(s)') == 7.0
+    assert parse_frequency('N/A') is None
+    assert parse_frequency(None) is None
+
+
+def test_list_and_series_agree_on_missing_statuses():
+    values = ['12 Chapters (Complete)', None, float('nan'), '3 Volumes', 'Ongoing']
+    counts, units, completes = normalize_statuses(values)
+    assert (counts, units, completes) == ([12, None, None, 3, None], ['chapters', None, None, 'volumes', None],
+                                          [True, None, None, False, False])
+    series_counts, series_units, series_completes = normalize_statuses(pd.Series(values))
+    assert [None if pd.isna(count) else count for count in series_counts] == counts
+    assert series_units.tolist() == units
+    assert series_completes.tolist() == completes
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def test_renormalize_parses_the_raw_status_again(tmp_path):
+    write_csv(tmp_path / 'in.csv', [
+        {'id': '1', 'chapters_original_status': 'Season 2, 13 Episodes (Complete)',
+         'chapters_original_current': '2', 'complete_original': 'True'},
+        {'id': '2', 'chapters_original_status': '', 'chapters_original_current': '', 'complete_original': ''},
+    ])
+    assert renormalize_csv(str(tmp_path / 'in.csv'), str(tmp_path / 'out.csv')) == 2
+    first, second = read_csv(tmp_path / 'out.csv')
+    assert first['chapters_original_current'] == '13' and first['complete_original'] == 'True'
+    assert first['chapters_original_status_count'] == '13' and first['chapters_original_status_unit'] == 'episodes'
+    assert second['chapters_original_current'] == '' and second['chapters_original_status_count'] == ''
+
+
+def test_renormalize_splits_the_current_column_of_older_catalogs(tmp_path):
+    write_csv(tmp_path / 'in.csv', [{'id': '1', 'chapters_original_current': '120 chapters'}])
+    renormalize_csv(str(tmp_path / 'in.csv'), str(tmp_path / 'out.csv'))
+    row, = read_csv(tmp_path / 'out.csv')
+    assert row['chapters_original_current_count'] == '120' and row['chapters_original_current_unit'] == 'chapters'
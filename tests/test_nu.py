@@ -0,0 +1,53 @@
+import io
+import json
+from datetime import timedelta
+
+import pytest
+import requests
+
+import nu
+
+RECORDS = [{'id': '1', 'title': 'Tensei Shitara Slime Datta Ken', 'genre': ['Action']},
+           {'id': '2', 'title': '転生したらスライムだった件', 'genre': []}]
+
+
+class FakeSession:
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def get(self, url, **kwargs):
+        response = requests.Response()
+        response.status_code = self.status_code
+        response._content = b''
+        response.elapsed = timedelta(0)
+        return response
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def encoder(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(nu, 'orjson', None)
+    return request.param
+
+
+def test_dump_many_text_handle(encoder):
+    fp = io.StringIO()
+    assert nu.dump_many(iter(RECORDS), fp) == 2
+    lines = fp.getvalue().splitlines()
+    assert [json.loads(line) for line in lines] == RECORDS
+    assert '転生' in lines[1]
+
+
+def test_dump_many_binary_handle(encoder):
+    fp = io.BytesIO()
+    assert nu.dump_many(iter(RECORDS), fp) == 2
+    assert [json.loads(line) for line in fp.getvalue().decode('utf-8').splitlines()] == RECORDS
+
+
+def test_series_finder_of_a_failed_page(encoder):
+    scraper = nu.NUScraper.__new__(nu.NUScraper)
+    scraper.SERIES_FINDER = 'https://www.novelupdates.com/series-finder/'
+    scraper.scraper = FakeSession(503)
+    assert scraper.get_series_finder(1) == []
+    assert scraper.parse_series_finder(1) == '[]'
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import aiohttp
+import pytest
+
+import kasasagi
+from watermarks import WatermarkStore
+
+
+def reading_list_page(novels):
+    rows = ''.join(f'<tr><td><a href="/series/{slug}/" title="{slug}">{slug}</a></td>'
+                   f'<td align="left">  {last} / {current}  </td></tr>' for slug, (last, current) in novels.items())
+    return f'<html><body><table>{rows}</table></body></html>'
+
+
+@pytest.fixture
+def sync(monkeypatch, tmp_path):
+    """fetch_reading_list_delta against a stand-in list answering 304 to a matching If-None-Match"""
+    kasasagi.set_parse_pool(0)
+    path = str(tmp_path / 'reading_list_snapshots.json')
+    state = {'novels': {'first': ('10', '8')}, 'etag': '"v1"', 'requests': []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state['requests'].append(self.headers.get('If-None-Match'))
+            if self.headers.get('If-None-Match') == state['etag']:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = reading_list_page(state['novels']).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', state['etag'])
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('localhost', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://localhost:{server.server_port}/readlist/'
+
+    def sync():
+        # A new store every time, like a restarted server reading the file again
+        monkeypatch.setattr(kasasagi, 'reading_list_snapshots', WatermarkStore(path))
+
+        async def run():
+            async with aiohttp.ClientSession() as client:
+                return await kasasagi.fetch_reading_list_delta(client, url)
+
+        return asyncio.run(run())
+
+    yield sync, state
+    server.shutdown()
+
+
+def test_snapshot_survives_a_restart(sync):
+    sync, state = sync
+    delta = sync()
+    assert delta['modified'] and list(delta['added']) == ['first']
+
+    delta = sync()
+    assert not delta['modified']
+    assert state['requests'] == [None, '"v1"']
+
+    state['novels'] = {'first': ('11', '9'), 'second': ('3', '1')}
+    state['etag'] = '"v2"'
+    delta = sync()
+    assert list(delta['added']) == ['second']
+    assert delta['changed'] == {'first': {'current': {'old': '8', 'new': '9'}, 'last': {'old': '10', 'new': '11'}}}
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+import requests
+
+from release_feed import ReleaseFeed
+from resolver import SeriesResolver
+
+SERIES_PAGE = (b'<html><body><table id="myTable"><tbody><tr><td>01/01/21</td><td>Group</td>'
+               b'<td><a href="//www.novelupdates.com/extnu/1/">c1</a></td></tr></tbody></table></body></html>')
+
+
+class FakeSession:
+    """Redirects ?p=7 to /series/seven/ like the site does"""
+
+    def __init__(self):
+        self.requested = []
+
+    def get(self, url, **kwargs):
+        self.requested.append(url)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = SERIES_PAGE
+        response.elapsed = timedelta(0)
+        response.url = 'https://www.novelupdates.com/series/seven/' if url.endswith('?p=7') else url
+        return response
+
+
+def test_known_series_are_polled_from_their_canonical_url(tmp_path):
+    session = FakeSession()
+    resolver = SeriesResolver()
+    feed = ReleaseFeed(str(tmp_path / 'state.json'), str(tmp_path / 'feed.jsonl'), session, delay=0,
+                       resolver=resolver)
+
+    assert [event['chapter'] for event in feed.poll(7)] == ['c1']
+    assert resolver.slug(7) == 'seven'
+    feed.poll(7)
+    assert session.requested == ['https://www.novelupdates.com/?p=7', 'https://www.novelupdates.com/series/seven/']
@@ -0,0 +1,47 @@
+from resolver import SeriesResolver
+
+
+def test_id_and_slug_both_ways():
+    resolver = SeriesResolver()
+    resolver.add(1234, 'https://www.novelupdates.com/series/release-that-witch/')
+    assert resolver.slug(1234) == 'release-that-witch'
+    assert resolver.id('release-that-witch') == 1234
+    assert resolver.id('https://www.novelupdates.com/series/release-that-witch/') == 1234
+    assert resolver.id('https://www.novelupdates.com/?p=99') == 99
+    assert resolver.id('42') == 42
+    assert resolver.id('unknown-series') is None
+
+
+def test_changed_slug_replaces_the_old_one():
+    resolver = SeriesResolver()
+    resolver.add(1, 'old-name')
+    resolver.add(1, '/series/new-name/')
+    assert resolver.slug(1) == 'new-name'
+    assert resolver.id('old-name') is None
+    assert len(resolver) == 1
+
+
+def test_urls_are_made_canonical_when_the_slug_is_known():
+    resolver = SeriesResolver(base_url='http://localhost:8000/')
+    resolver.add(5, 'five')
+    assert resolver.url(5) == 'http://localhost:8000/series/five/'
+    assert resolver.url(6, 'http://localhost:8000/?p=6') == 'http://localhost:8000/?p=6'
+    assert resolver.canonical_url('http://localhost:8000/?p=5') == 'http://localhost:8000/series/five/'
+    assert resolver.canonical_url('http://localhost:8000/?p=6') == 'http://localhost:8000/?p=6'
+
+
+def test_not_a_series_url_is_ignored():
+    resolver = SeriesResolver()
+    resolver.add(1, 'https://www.novelupdates.com/group/some-group/')
+    resolver.add(None, 'slug')
+    assert len(resolver) == 0
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'series.json')
+    resolver = SeriesResolver(path)
+    resolver.add(1, 'one')
+    resolver.add(2, 'two')
+    resolver.save()
+    loaded = SeriesResolver(path)
+    assert loaded.slug(2) == 'two' and loaded.id('one') == 1
@@ -0,0 +1,79 @@
+from scheduler import CrawlScheduler
+
+DAY = 86400
+NOW = 1000 * DAY
+
+
+def test_popular_and_frequent_series_come_first():
+    scheduler = CrawlScheduler()
+    scheduler.update({'id': 1, 'on_reading_lists': 10, 'release_freq': 7})
+    scheduler.update({'id': 2, 'on_reading_lists': 50000, 'release_freq': 7})
+    scheduler.update({'id': 3, 'on_reading_lists': 50000, 'release_freq': 1})
+    for novel_id in (1, 2, 3):
+        scheduler.mark_scraped(novel_id, NOW - 10 * DAY)
+    assert sorted((1, 2, 3), key=lambda novel_id: scheduler.priority(novel_id, NOW), reverse=True) == [3, 2, 1]
+
+
+def test_staleness_and_activity_rank_raise_the_priority():
+    scheduler = CrawlScheduler()
+    scheduler.update({'id': 1, 'on_reading_lists': 100, 'release_freq': 7})
+    scheduler.update({'id': 2, 'on_reading_lists': 100, 'release_freq': 7, 'activity_week_rank': 1})
+    scheduler.mark_scraped(1, NOW - 10 * DAY)
+    scheduler.mark_scraped(2, NOW - 10 * DAY)
+    assert scheduler.priority(2, NOW) > scheduler.priority(1, NOW)
+    scheduler.mark_scraped(1, NOW - 100 * DAY)
+    assert scheduler.priority(1, NOW) == 10 * scheduler.priority(1, NOW - 90 * DAY)
+
+
+def test_unknown_values_fall_back_to_defaults():
+    scheduler = CrawlScheduler()
+    scheduler.add([1])
+    scheduler.update({'id': '2', 'on_reading_lists': '', 'release_freq': float('nan')})
+    assert scheduler.stats[2] == dict()
+    never_scraped = CrawlScheduler.NEVER_SCRAPED_DAYS / CrawlScheduler.DEFAULT_RELEASE_FREQ
+    assert scheduler.priority(1, NOW) == scheduler.priority(2, NOW) == never_scraped
+
+
+def test_batches_stay_within_the_hourly_budget():
+    scheduler = CrawlScheduler(budget_per_hour=3)
+    scheduler.add(range(10))
+    assert len(scheduler.next_batch(2, now=NOW)) == 2
+    assert len(scheduler.next_batch(now=NOW + 60)) == 1
+    assert scheduler.next_batch(now=NOW + 120) == []
+    assert len(scheduler.next_batch(now=NOW + 3600)) == 3
+
+
+def test_listing_pages_are_charged_to_the_budget():
+    scheduler = CrawlScheduler(budget_per_hour=10)
+    assert scheduler.add_pages([[1, 2], [3, 2]], now=NOW) == 3
+    assert scheduler.remaining_budget(NOW) == 8
+    assert len(scheduler.next_batch(now=NOW)) == 3
+
+
+def test_newest_first_pages_are_read_until_a_known_novel():
+    scheduler = CrawlScheduler()
+    scheduler.add([10, 11])
+    read = []
+
+    def pages():
+        for page in ([15, 14], [13, 12, 11], [10, 9]):
+            read.append(page)
+            yield page
+
+    assert scheduler.add_pages(pages(), newest_first=True, now=NOW) == 4
+    assert read == [[15, 14], [13, 12, 11]]
+    assert sorted(scheduler.stats) == [10, 11, 12, 13, 14, 15]
+
+
+def test_state_keeps_the_pool_and_its_stats(tmp_path):
+    state_file = str(tmp_path / 'schedule.json')
+    scheduler = CrawlScheduler(state_file)
+    scheduler.add([1, 2])
+    scheduler.update({'id': 1, 'on_reading_lists': 500, 'release_freq': 3.5})
+    scheduler.mark_scraped(1, NOW)
+    scheduler.save()
+
+    loaded = CrawlScheduler(state_file)
+    assert len(loaded) == 2
+    assert loaded.stats[1] == {'on_reading_lists': 500.0, 'release_freq': 3.5}
+    assert loaded.priority(1, NOW + DAY) == scheduler.priority(1, NOW + DAY)
@@ -0,0 +1,79 @@
+import io
+import gzip
+
+from sitemap import iter_sitemap, SitemapDiscovery
+
+IMAGE_URLSET = b'''<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+  <url>
+    <loc>https://www.novelupdates.com/series/first/</loc>
+    <lastmod>2021-03-04T10:00:00+00:00</lastmod>
+    <image:image><image:loc>https://cdn.novelupdates.com/images/first.jpg</image:loc></image:image>
+  </url>
+  <url>
+    <image:image><image:loc>https://cdn.novelupdates.com/images/second.jpg</image:loc></image:image>
+    <loc>https://www.novelupdates.com/series/second/</loc>
+  </url>
+</urlset>'''
+
+INDEX = b'''<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://www.novelupdates.com/post-sitemap.xml</loc></sitemap>
+  <sitemap><loc>https://www.novelupdates.com/series-sitemap.xml.gz</loc><lastmod>2021-03-04</lastmod></sitemap>
+</sitemapindex>'''
+
+
+class FakeResponse:
+
+    def __init__(self, content):
+        self.status_code = 200
+        self.raw = io.BytesIO(content)
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    def get(self, url, **kwargs):
+        self.requested.append(url)
+        return FakeResponse(self.pages[url])
+
+
+def test_image_extension_does_not_replace_the_loc():
+    assert list(iter_sitemap(io.BytesIO(IMAGE_URLSET))) == [
+        ('url', 'https://www.novelupdates.com/series/first/', '2021-03-04T10:00:00+00:00'),
+        ('url', 'https://www.novelupdates.com/series/second/', None),
+    ]
+
+
+def test_index_entries():
+    assert list(iter_sitemap(io.BytesIO(INDEX))) == [
+        ('sitemap', 'https://www.novelupdates.com/post-sitemap.xml', None),
+        ('sitemap', 'https://www.novelupdates.com/series-sitemap.xml.gz', '2021-03-04'),
+    ]
+
+
+def test_sitemap_without_namespace():
+    sitemap = b'<urlset><url><loc> https://www.novelupdates.com/series/bare/ </loc></url></urlset>'
+    assert list(iter_sitemap(io.BytesIO(sitemap))) == [('url', 'https://www.novelupdates.com/series/bare/', None)]
+
+
+def test_discovery_follows_the_series_sitemaps():
+    session = FakeSession({'https://www.novelupdates.com/sitemap_index.xml': INDEX,
+                           'https://www.novelupdates.com/series-sitemap.xml.gz': gzip.compress(IMAGE_URLSET)})
+    discovery = SitemapDiscovery(session)
+    assert list(discovery.iter_series(since='2021-01-01')) == [
+        ('https://www.novelupdates.com/series/first/', '2021-03-04T10:00:00+00:00'),
+        ('https://www.novelupdates.com/series/second/', None),
+    ]
+    assert list(discovery.iter_series(since='2021-06')) == [('https://www.novelupdates.com/series/second/', None)]
+    assert 'https://www.novelupdates.com/post-sitemap.xml' not in session.requested
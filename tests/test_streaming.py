@@ -0,0 +1,112 @@
+import json
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import kasasagi
+
+PAGES = 20
+ROWS = 5
+
+
+def series_page(pages):
+    return (f'<html><head><link rel="shortlink" href="http://localhost/?p=1"/></head><body>'
+            f'<div class="seriestitlenu">Stream Test</div>'
+            f'<div class="digg_pagination"><span class="gap">...</span><a href="?pg={pages}">{pages}</a></div>'
+            f'</body></html>')
+
+
+def chapter_page(page, rows):
+    body = ''.join(f'<tr><td>01/01/20</td><td><a href="http://www.novelupdates.com/group/group-{i}/">Group {i}</a>'
+                   f'</td><td><a class="chp-release" href="#">c{page}-{i}</a>'
+                   f'<a class="chp-release" href="/c/{i}/">c{page}-{i}</a></td></tr>' for i in range(rows))
+    return f'<html><body><table id="myTable"><tbody>{body}</tbody></table></body></html>'
+
+
+@pytest.fixture
+def chapters(monkeypatch):
+    """Runs consume(iter_all_chapters of a stand-in series), returns its result and the table page requests"""
+    kasasagi.set_parse_pool(0)
+    monkeypatch.setattr(kasasagi, 'chapter_read_ahead', 2)
+    stats = {'requested': [], 'in_flight': 0, 'most_in_flight': 0}
+
+    async def series(request):
+        if 'pg' not in request.query:
+            return web.Response(text=series_page(PAGES), content_type='text/html')
+        stats['requested'].append(int(request.query['pg']))
+        stats['in_flight'] += 1
+        stats['most_in_flight'] = max(stats['most_in_flight'], stats['in_flight'])
+        await asyncio.sleep(0.01)
+        stats['in_flight'] -= 1
+        return web.Response(text=chapter_page(request.query['pg'], ROWS), content_type='text/html')
+
+    def run(consume):
+        async def main():
+            app = web.Application()
+            app.router.add_get('/series/{slug}/', series)
+            server = TestServer(app)
+            await server.start_server()
+            base_url = str(server.make_url('')).rstrip('/')
+            monkeypatch.setattr(kasasagi, 'series_base_url', base_url)
+            try:
+                async with aiohttp.ClientSession() as client:
+                    return await consume(kasasagi.iter_all_chapters(f'{base_url}/series/stream-test/', 'pages',
+                                                                    client))
+            finally:
+                await server.close()
+
+        return asyncio.run(main()), stats
+
+    return run
+
+
+def test_pages_are_read_ahead_within_the_window(chapters):
+    async def consume(items):
+        return [item async for item in items]
+
+    items, stats = chapters(consume)
+    assert items[0] == {'name': 'Stream Test'}
+    assert [item['chapter_name'] for item in items[1:ROWS + 1]] == [f'c1-{i}' for i in range(ROWS)]
+    assert len(items) == 1 + PAGES * ROWS
+    assert sorted(stats['requested']) == list(range(1, PAGES + 1))
+    assert stats['most_in_flight'] <= 2
+
+
+def test_early_exit_stops_fetching(chapters):
+    async def consume(items):
+        first = [await items.__anext__() for _ in range(1 + ROWS)]
+        await items.aclose()
+        await asyncio.sleep(0.05)
+        return first
+
+    items, stats = chapters(consume)
+    assert items[-1]['chapter_name'] == f'c1-{ROWS - 1}'
+    assert len(stats['requested']) <= 3
+
+
+def test_closed_ndjson_stream_cancels_the_running_items():
+    loop = asyncio.new_event_loop()
+    cancelled = []
+
+    async def fetch(key):
+        try:
+            await asyncio.sleep(0 if key == 'fast' else 10)
+        except asyncio.CancelledError:
+            cancelled.append(key)
+            raise
+        return {'key': key}
+
+    try:
+        stream = kasasagi.NDJSONStream(kasasagi.run_batch(['fast', 'slow1', 'slow2'], fetch, 3), loop)
+        # A one byte read runs the batch until its first item is done
+        chunk = stream.read(1)
+        chunk += stream.read(len(stream.buffer))
+        assert json.loads(chunk.decode('utf-8')) == {'key': 'fast', 'result': {'key': 'fast'}}
+        stream.close()
+        assert sorted(cancelled) == ['slow1', 'slow2']
+        assert stream.read() == b''
+    finally:
+        loop.close()
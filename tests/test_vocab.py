@@ -0,0 +1,49 @@
+import threading
+
+from vocab import Vocabulary
+
+
+def test_intern_gives_one_id_per_value():
+    vocab = Vocabulary()
+    assert [vocab.intern(value) for value in ('Action', 'Drama', 'Action', None)] == [0, 1, 0, None]
+    assert len(vocab) == 2
+    assert vocab.lookup(1) == 'Drama'
+    assert vocab.lookup(None) is None
+
+
+def test_encode_decode_round_trip():
+    vocab = Vocabulary()
+    record = {'genres': ['Action', 'Drama'], 'author': 'Er Gen', 'status': float('nan'), 'id': 7}
+    encoded = vocab.encode(dict(record), ['genres', 'author', 'status', 'missing'])
+    assert encoded['genres'] == [0, 1] and encoded['author'] == 2
+    assert encoded['status'] != encoded['status']
+    decoded = vocab.decode(encoded, ['genres', 'author', 'status', 'missing'])
+    assert decoded['genres'] == record['genres'] and decoded['author'] == 'Er Gen' and decoded['id'] == 7
+
+
+def test_save_and_load(tmp_path):
+    vocab = Vocabulary(['Action', 'Drama'])
+    path = str(tmp_path / 'vocab.json')
+    vocab.save(path)
+    loaded = Vocabulary.load(path)
+    assert loaded.values == ['Action', 'Drama']
+    assert loaded.intern('Drama') == 1
+
+
+def test_concurrent_intern_keeps_ids_consistent():
+    vocab = Vocabulary()
+    values = [f'tag-{num}' for num in range(500)]
+    barrier = threading.Barrier(8)
+
+    def intern_all():
+        barrier.wait()
+        for value in values:
+            vocab.intern(value)
+
+    threads = [threading.Thread(target=intern_all) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(vocab) == len(values)
+    assert all(vocab.lookup(vocab.intern(value)) == value for value in values)